@@ -0,0 +1,94 @@
+#!/bin/python
+"""
+Micro-benchmark of the order book maintained by incremental updates.
+Compares OrderBook with the list implementation previously used in the
+Bitfinex gateway, i.e. a linear scan per level and a full sort per insertion.
+
+Usage: python benchmark/bench_order_book.py [-levels 100] [-updates 200000]
+"""
+
+import argparse
+import random
+import timeit
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from market_data import L2Depth, OrderBook
+
+
+def generate_updates(levels, updates, seed=0):
+    """
+    Generate a random stream of (side, price, count, volume) updates around a mid price.
+    Zero count means deletion.
+    """
+    rand = random.Random(seed)
+    ret = []
+    for i in range(0, updates):
+        side = L2Depth.Side.BUY if rand.random() < 0.5 else L2Depth.Side.SELL
+        offset = rand.randint(1, levels)
+        price = 1000.0 - offset if side == L2Depth.Side.BUY else 1000.0 + offset
+        count = 0 if rand.random() < 0.3 else rand.randint(1, 10)
+        ret.append((side, price, count, rand.random()))
+    return ret
+
+
+def run_list(updates, depth):
+    """
+    List implementation with linear scans and sorting. The sorting truncates
+    the levels beyond the depth as the previous gateway did.
+    """
+    l2_depth = L2Depth(depth)
+    l2_depth.bids = []
+    l2_depth.asks = []
+    for side, price, count, volume in updates:
+        levels = l2_depth.bids if side == L2Depth.Side.BUY else l2_depth.asks
+        found = False
+        for i in range(0, len(levels)):
+            if price == levels[i].price:
+                found = True
+                if count == 0:
+                    del levels[i]
+                else:
+                    levels[i].count = count
+                    levels[i].volume = volume
+                break
+
+        if not found and count > 0:
+            levels.append(L2Depth.Depth(price=price, count=count, volume=volume))
+            if side == L2Depth.Side.BUY:
+                l2_depth.sort_bids()
+            else:
+                l2_depth.sort_asks()
+        l2_depth.values()
+    return l2_depth
+
+
+def run_order_book(updates, depth):
+    """
+    OrderBook implementation filling a fixed depth after each update
+    """
+    l2_depth = L2Depth(depth)
+    order_book = OrderBook(depth)
+    for side, price, count, volume in updates:
+        if count == 0:
+            order_book.delete(side, price)
+        else:
+            order_book.update(side, price, count, volume)
+        order_book.fill_l2_depth(l2_depth)
+        l2_depth.values()
+    return l2_depth
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Order book micro-benchmark.')
+    parser.add_argument('-levels', action='store', type=int, default=100, help='Number of price levels per side.')
+    parser.add_argument('-updates', action='store', type=int, default=200000, help='Number of updates.')
+    parser.add_argument('-depth', action='store', type=int, default=25, help='Depth of the L2 snapshot.')
+    args = parser.parse_args()
+
+    updates = generate_updates(args.levels, args.updates)
+    for name, func in [('list', run_list), ('order_book', run_order_book)]:
+        elapsed = min(timeit.repeat(lambda: func(updates, args.depth), number=1, repeat=3))
+        print("%-12s %8.3f s %10.0f updates/s" % (name, elapsed, args.updates / elapsed))
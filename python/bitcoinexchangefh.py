@@ -1,6 +1,7 @@
 #!/bin/python
 
 import argparse
+import time
 import sys
 
 from exch_bitmex import ExchGwBitmex
@@ -11,7 +12,14 @@ from exch_kraken import ExchGwKraken
 from mysql_client import MysqlClient
 from sqlite_client import SqliteClient
 from file_client import FileClient
+from column_client import ColumnClient
+from queued_client import QueuedClient
+from partition_client import PartitionClient
 from subscription_manager import SubscriptionManager
+from poll_scheduler import PollScheduler
+from exchange import ExchangeGateway
+from restful_api_socket import RESTfulApiSocket
+from http_client import HttpConnectionPool
 from util import Logger
 
 
@@ -21,11 +29,12 @@ if __name__ == '__main__':
     parser.add_argument('-csv', action='store_true', help='Use csv file as database.')
     parser.add_argument('-sqlite', action='store_true', help='Use SQLite database.')
     parser.add_argument('-mysql', action='store_true', help='Use MySQL.')
+    parser.add_argument('-column', action='store_true', help='Use binary column files as database.')
     parser.add_argument('-dbpath', action='store', dest='dbpath',
                         help='Database file path. Supported for SQLite only.',
                         default='bitcoinexchange.raw')
     parser.add_argument('-dbdir', action='store', dest='dbdir',
-                        help='Database file directory. Supported for CSV only.',
+                        help='Database file directory. Supported for CSV and column files only.',
                         default='')
     parser.add_argument('-dbaddr', action='store', dest='dbaddr', default='localhost',
                         help='Database address. Defaulted as localhost. Supported for database with connection')
@@ -37,15 +46,47 @@ if __name__ == '__main__':
                         help='Database password. Supported for database with connection')
     parser.add_argument('-dbschema', action='store', dest='dbschema',
                         help='Database schema. Supported for database with connection')
+    parser.add_argument('-dbbatchsize', action='store', dest='dbbatchsize', type=int, default=0,
+                        help='Number of rows committed in one transaction. Supported for SQLite and MySQL')
+    parser.add_argument('-dbbatchinterval', action='store', dest='dbbatchinterval', type=int, default=0,
+                        help='Maximum milliseconds a row is buffered before commit. Supported for SQLite and MySQL')
+    parser.add_argument('-dbperthread', action='store_true', dest='dbperthread',
+                        help='Open one WAL connection per writer thread. Supported for SQLite only')
+    parser.add_argument('-dbflushinterval', action='store', dest='dbflushinterval', type=int, default=1000,
+                        help='Maximum milliseconds the written rows are buffered. Supported for CSV and column files only')
+    parser.add_argument('-dbfsyncinterval', action='store', dest='dbfsyncinterval', type=int, default=0,
+                        help='Milliseconds between fsync calls. Defaulted as 0 (no fsync). Supported for CSV only')
+    parser.add_argument('-dbnativetime', action='store_true', dest='dbnativetime',
+                        help='Store the timestamps as integer nanoseconds since epoch. Supported for SQLite and MySQL')
+    parser.add_argument('-dbpartition', action='store', dest='dbpartition', default='',
+                        help='Split the tables into partitions per UTC day or hour (day, hour). Defaulted as no partition')
+    parser.add_argument('-dbcompress', action='store', dest='dbcompress', default='',
+                        help='Compression method of the closed partitions (gzip, bz2, lzma, lz4, zstd). Supported for CSV only')
+    parser.add_argument('-dbqueue', action='store', dest='dbqueue', type=int, default=0,
+                        help='Size of the queue for the asynchronous database writer. Defaulted as 0 (synchronous)')
+    parser.add_argument('-dbqueuepolicy', action='store', dest='dbqueuepolicy', default='block',
+                        help='Behaviour when the writer queue is full (block, drop, spill). Defaulted as block')
+    parser.add_argument('-dbspill', action='store', dest='dbspill', default='bitcoinexchange.spill',
+                        help='Spill file path of the writer queue. Supported for the spill policy only')
+    parser.add_argument('-wspoolsize', action='store', dest='wspoolsize', type=int, default=1,
+                        help='Maximum number of websocket connections per exchange. Defaulted as 1')
+    parser.add_argument('-engineworkers', action='store', dest='engineworkers', type=int, default=4,
+                        help='Number of threads for the RESTful polls. Defaulted as 4')
+    parser.add_argument('-httptimeout', action='store', dest='httptimeout', type=float, default=10.0,
+                        help='Timeout in seconds of the RESTful requests. Defaulted as 10')
+    parser.add_argument('-httpmaxidle', action='store', dest='httpmaxidle', type=int, default=4,
+                        help='Maximum number of idle keep-alive connections per host. Defaulted as 4')
+    parser.add_argument('-statsinterval', action='store', dest='statsinterval', type=int, default=0,
+                        help='Seconds between logging the statistics. Defaulted as 0 (no logging)')
     parser.add_argument('-output', action='store', dest='output',
                         help='Verbose output file path')
     args = parser.parse_args()
 
     if args.sqlite:
-        db_client = SqliteClient()
-        db_client.connect(path=args.dbpath)
+        db_client = SqliteClient(batch_size=args.dbbatchsize, batch_interval=args.dbbatchinterval)
+        db_client.connect(path=args.dbpath, per_thread=args.dbperthread)
     elif args.mysql:
-        db_client = MysqlClient()
+        db_client = MysqlClient(batch_size=args.dbbatchsize, batch_interval=args.dbbatchinterval)
         db_client.connect(host=args.dbaddr,
                           port=args.dbport,
                           user=args.dbuser,
@@ -53,14 +94,36 @@ if __name__ == '__main__':
                           schema=args.dbschema)
     elif args.csv:
         if args.dbdir != '':
-            db_client = FileClient(dir=args.dbdir)
+            db_client = FileClient(dir=args.dbdir,
+                                   flush_interval=args.dbflushinterval,
+                                   fsync_interval=args.dbfsyncinterval)
         else:
-            db_client = FileClient()
+            db_client = FileClient(flush_interval=args.dbflushinterval,
+                                   fsync_interval=args.dbfsyncinterval)
+    elif args.column:
+        if args.dbdir != '':
+            db_client = ColumnClient(dir=args.dbdir, flush_interval=args.dbflushinterval)
+        else:
+            db_client = ColumnClient(flush_interval=args.dbflushinterval)
     else:
         print('Error: Please define which database is used.')
         parser.print_help()
         sys.exit(1)
 
+    if args.dbnativetime and (args.sqlite or args.mysql):
+        db_client.native_timestamp = True
+
+    if args.dbpartition != '':
+        db_client = PartitionClient(db_client,
+                                    interval=PartitionClient.Interval.parse(args.dbpartition),
+                                    compression=args.dbcompress)
+
+    if args.dbqueue > 0:
+        db_client = QueuedClient(db_client,
+                                 max_size=args.dbqueue,
+                                 overflow_policy=QueuedClient.OverflowPolicy.parse(args.dbqueuepolicy),
+                                 spill_path=args.dbspill)
+
     # Subscription instruments
     if args.instmts is None or len(args.instmts) == 0:
         print('Error: Please define the instrument subscription list. You can refer to subscriptions.ini.')
@@ -70,12 +133,17 @@ if __name__ == '__main__':
     Logger.init_log(args.output)
     subscription_instmts = SubscriptionManager(args.instmts).get_subscriptions()
 
+    RESTfulApiSocket.pool = HttpConnectionPool(timeout=args.httptimeout, max_idle=args.httpmaxidle)
+
     exch_gws = []
     exch_gws.append(ExchGwBtcc(db_client))
-    exch_gws.append(ExchGwBitmex(db_client))
-    exch_gws.append(ExchGwBitfinex(db_client))
-    exch_gws.append(ExchGwOkCoin(db_client))
+    exch_gws.append(ExchGwBitmex(db_client, args.wspoolsize))
+    exch_gws.append(ExchGwBitfinex(db_client, args.wspoolsize))
+    exch_gws.append(ExchGwOkCoin(db_client, args.wspoolsize))
     exch_gws.append(ExchGwKraken(db_client))
+
+    ExchangeGateway.scheduler = PollScheduler(max_workers=args.engineworkers)
+
     threads = []
     for exch in exch_gws:
         for instmt in subscription_instmts:
@@ -84,3 +152,35 @@ if __name__ == '__main__':
                     (instmt.get_exchange_name(), instmt.get_instmt_name()))
                 threads += exch.start(instmt)
 
+    try:
+        while args.statsinterval > 0:
+            time.sleep(args.statsinterval)
+            for instmt in subscription_instmts:
+                stats = instmt.get_l2_depth_stats()
+                Logger.info("[main]", "Instrument %s-%s order book updates: emitted %d, suppressed %d, conflated %d" % \
+                    (instmt.get_exchange_name(), instmt.get_instmt_name(), stats['emitted'], stats['suppressed'],
+                     stats['conflated']))
+                stats = instmt.get_outage_stats()
+                if stats['count'] > 0 or stats['disconnected']:
+                    Logger.info("[main]", "Instrument %s-%s outages: %d, total %.3f seconds%s" % \
+                        (instmt.get_exchange_name(), instmt.get_instmt_name(), stats['count'], stats['time'],
+                         ", disconnected" if stats['disconnected'] else ""))
+                for aggregator in instmt.get_bar_aggregators():
+                    if aggregator.late_count > 0:
+                        Logger.info("[main]", "Instrument %s-%s %s bars: dropped %d late trades" % \
+                            (instmt.get_exchange_name(), instmt.get_instmt_name(), aggregator.name,
+                             aggregator.late_count))
+            for host, stats in RESTfulApiSocket.pool.get_stats().items():
+                Logger.info("[main]", "Host %s requests: %d, reused %d, average dns %.4f, connect %.4f, ttfb %.4f, body %.4f seconds" % \
+                    (host, stats['count'], stats['reused'], stats['dns'], stats['connect'], stats['ttfb'], stats['body']))
+
+        # The scheduler runs in a daemon thread
+        for t in set(threads):
+            t.join()
+    except KeyboardInterrupt:
+        # Record the current bars, which are otherwise lost
+        for exch in exch_gws:
+            for instmt in subscription_instmts:
+                if instmt.get_exchange_name() == exch.get_exchange_name():
+                    exch.flush_bars(instmt)
+        db_client.close()
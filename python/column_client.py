@@ -0,0 +1,579 @@
+from database_client import DatabaseClient
+from file_client import FileClient
+from util import Logger, TimedLock, Timestamp
+import threading
+import struct
+import time
+import json
+import os
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class ColumnClient(DatabaseClient):
+    """
+    Column client. Each table is stored as an append-only file of fixed-size
+    binary records, i.e. int64 for integers and timestamps, int8 and int16 for
+    tinyint and smallint, float64 for decimals and fixed-length bytes for texts,
+    with the schema in a sidecar json file. The record file can be memory mapped
+    by NumPy without parsing.
+    """
+
+    # Column storing the timestamp in nanoseconds since epoch
+    DATE_TIME_COLUMN = 'date_time'
+
+    # Length in bytes of the text columns without a declared length, e.g. varchar(20)
+    TEXT_SIZE = 64
+
+    # Struct format of the recorded columns overriding their declared types, which
+    # are shared with the SQL databases. The trade side is stored as its code, and
+    # the longest trade ids, i.e. the Kraken ids, are 44 characters.
+    COLUMN_FORMATS = {'trade_id': '48s', 'trade_side': 'b', 'side': 'b'}
+
+    # Number of records read at a time
+    READ_BATCH_SIZE = 1024
+
+    class TableSchema(object):
+        """
+        Record layout of a table
+        """
+        def __init__(self, columns, formats):
+            """
+            Constructor
+            :param columns: Column names
+            :param formats: Struct format of each column
+            """
+            self.columns = columns
+            self.formats = formats
+            self.record = struct.Struct('<' + ''.join(formats))
+            self.record_size = self.record.size
+            self.text_indexes = [i for i, fmt in enumerate(formats) if fmt[-1] == 's']
+            if ColumnClient.DATE_TIME_COLUMN in columns:
+                self.date_time_index = columns.index(ColumnClient.DATE_TIME_COLUMN)
+            else:
+                self.date_time_index = -1
+
+        def to_dict(self):
+            return {'columns': self.columns, 'formats': self.formats}
+
+        @staticmethod
+        def from_dict(d):
+            return ColumnClient.TableSchema(d['columns'], d['formats'])
+
+        def dtype(self):
+            """
+            NumPy record type of the table
+            :return List of field names and types
+            """
+            ret = []
+            for column, fmt in zip(self.columns, self.formats):
+                if fmt == 'q':
+                    ret.append((column, '<i8'))
+                elif fmt == 'b':
+                    ret.append((column, 'i1'))
+                elif fmt == 'h':
+                    ret.append((column, '<i2'))
+                elif fmt == 'd':
+                    ret.append((column, '<f8'))
+                else:
+                    ret.append((column, 'S' + fmt[:-1]))
+            return ret
+
+        def encode(self, values):
+            """
+            Pack the values into a record
+            :param values: Value array in the order of the columns
+            :return Bytes
+            """
+            values = list(values)
+            if self.date_time_index >= 0:
+                values[self.date_time_index] = ColumnClient.to_nanoseconds(values[self.date_time_index])
+            for i in self.text_indexes:
+                value = str(values[i]).encode()
+                if len(value) > int(self.formats[i][:-1]):
+                    raise Exception("Value (%s) exceeds the size of column (%s)." % \
+                                    (values[i], self.columns[i]))
+                values[i] = value
+            return self.record.pack(*values)
+
+        def decode(self, buf):
+            """
+            Unpack the records
+            :param buf: Bytes of the records
+            :return List of rows
+            """
+            ret = []
+            for values in self.record.iter_unpack(buf):
+                values = list(values)
+                if self.date_time_index >= 0:
+                    values[self.date_time_index] = \
+                        ColumnClient.from_nanoseconds(values[self.date_time_index])
+                for i in self.text_indexes:
+                    values[i] = values[i].rstrip(b'\0').decode()
+                ret.append(values)
+            return ret
+
+    class FileHandle(object):
+        """
+        Opened record file of a table
+        """
+        def __init__(self, file_path):
+            self.file = open(file_path, 'ab', buffering=FileClient.BUFFER_SIZE)
+            self.is_dirty = False
+            self.last_flush_time = time.time()
+
+    def __init__(self, dir=os.getcwd(), flush_interval=1000):
+        """
+        Constructor
+        :param dir: File directory
+        :param flush_interval: Maximum time (in milliseconds) the written records are kept in
+                               the buffer. Zero means flushing every record.
+        """
+        DatabaseClient.__init__(self)
+        if dir is None or dir == '':
+            raise Exception("ColumnClient does not accept empty directory.")
+
+        # The timestamps are stored in nanoseconds
+        self.native_timestamp = True
+
+        self.file_directory = dir
+        self.flush_interval = flush_interval
+        self.table_locks = dict()       # table -> TimedLock
+        self.table_locks_lock = threading.Lock()
+        self.schemas = dict()           # table -> TableSchema
+        self.file_handles = dict()      # table -> FileHandle
+        self.flush_count = 0
+        self.flush_event = threading.Event()
+        self.flush_thread = None
+
+        if not os.path.isdir(self.file_directory):
+            os.makedirs(self.file_directory)
+
+        if self.flush_interval > 0:
+            self.flush_thread = threading.Thread(target=self.flush_worker)
+            self.flush_thread.daemon = True
+            self.flush_thread.start()
+
+    @staticmethod
+    def to_nanoseconds(value):
+        """
+        Convert the timestamp to nanoseconds since epoch
+        :param value: Nanoseconds, or text in the format "%Y%m%d %H:%M:%S.%f"
+        :return Integer
+        """
+        return value if isinstance(value, int) else Timestamp.parse(value)
+
+    @staticmethod
+    def from_nanoseconds(value):
+        """
+        Convert the nanoseconds since epoch to text
+        :param value: Nanoseconds
+        :return Text in the format "%Y%m%d %H:%M:%S.%f"
+        """
+        return Timestamp.format(value)
+
+    @staticmethod
+    def column_format(column, type):
+        """
+        Map the column to the struct format by its name or its type
+        :param column: Column name
+        :param type: Column type, e.g. int, tinyint, decimal(10,5), text or varchar(20)
+        :return Struct format
+        """
+        type = type.lower().split(' ')[0]
+        if column == ColumnClient.DATE_TIME_COLUMN:
+            return 'q'
+        elif column in ColumnClient.COLUMN_FORMATS:
+            return ColumnClient.COLUMN_FORMATS[column]
+        elif type.startswith('tinyint'):
+            return 'b'
+        elif type.startswith('smallint'):
+            return 'h'
+        elif type.startswith('int') or type.startswith('bigint'):
+            return 'q'
+        elif type.startswith('decimal') or type in ['float', 'double', 'real']:
+            return 'd'
+        elif type.startswith('varchar(') or type.startswith('char('):
+            return type[type.index('(')+1:type.index(')')] + 's'
+        elif type == 'text':
+            return '%ds' % ColumnClient.TEXT_SIZE
+        else:
+            raise Exception("Column type (%s) is not supported." % type)
+
+    def get_file_path(self, table):
+        """
+        Get the record file path of the table
+        :param table: Table name
+        :return File path
+        """
+        return os.path.join(self.file_directory, table + '.col')
+
+    def get_schema_path(self, table):
+        """
+        Get the schema file path of the table
+        :param table: Table name
+        :return File path
+        """
+        return os.path.join(self.file_directory, table + '.col.json')
+
+    def get_table_lock(self, table):
+        """
+        Get the lock of the table
+        :param table: Table name
+        :return Lock
+        """
+        lock = self.table_locks.get(table)
+        if lock is None:
+            self.table_locks_lock.acquire()
+            lock = self.table_locks.setdefault(table, TimedLock())
+            self.table_locks_lock.release()
+        return lock
+
+    def get_schema(self, table):
+        """
+        Get the schema of the table
+        :param table: Table name
+        :return TableSchema object
+        """
+        schema = self.schemas.get(table)
+        if schema is None:
+            schema_path = self.get_schema_path(table)
+            if not os.path.isfile(schema_path):
+                raise Exception("Table (%s) has not been created." % table)
+            with open(schema_path, 'r') as f:
+                schema = ColumnClient.TableSchema.from_dict(json.load(f))
+            self.schemas[table] = schema
+        return schema
+
+    def flush_table(self, table):
+        """
+        Flush the written records of the table. The table lock must be held by the caller.
+        :param table: Table name
+        """
+        handle = self.file_handles.get(table)
+        if handle is not None and handle.is_dirty:
+            handle.file.flush()
+            handle.is_dirty = False
+            handle.last_flush_time = time.time()
+            self.flush_count += 1
+
+    def flush_worker(self):
+        """
+        Flush the opened files when the flush interval is reached
+        """
+        while not self.flush_event.wait(self.flush_interval / 1000.0):
+            self.flush()
+
+    def flush(self):
+        """
+        Flush the written records of all the tables
+        :return True if the records are flushed
+        """
+        for table in list(self.file_handles.keys()):
+            lock = self.get_table_lock(table)
+            lock.acquire()
+            self.flush_table(table)
+            lock.release()
+        return True
+
+    def get_stats(self):
+        """
+        Get the statistics of the opened files and the table locks
+        :return Dictionary of statistics
+        """
+        return {'open_files': len(self.file_handles),
+                'flush_count': self.flush_count,
+                'table_locks': dict([(table, lock.get_stats()) \
+                                     for table, lock in list(self.table_locks.items())])}
+
+    def create(self, table, columns, types, is_ifnotexists=True):
+        """
+        Create table in the database
+        :param table: Table name
+        :param columns: Column array
+        :param types: Type array
+        :param is_ifnotexists: Create table if not exists keyword
+        """
+        columns = [e.split(' ')[0] for e in columns]
+        if len(columns) != len(types):
+            return False
+
+        schema = ColumnClient.TableSchema(columns,
+                                          [ColumnClient.column_format(c, t) for c, t in zip(columns, types)])
+        schema_path = self.get_schema_path(table)
+        lock = self.get_table_lock(table)
+        lock.acquire()
+        try:
+            if os.path.isfile(schema_path):
+                Logger.info(self.__class__.__name__, "File (%s) has been created already." % schema_path)
+            else:
+                with open(schema_path, 'w') as f:
+                    json.dump(schema.to_dict(), f)
+                open(self.get_file_path(table), 'ab').close()
+                self.schemas[table] = schema
+        finally:
+            lock.release()
+
+        return True
+
+    def insert(self, table, columns, values, is_orreplace=False):
+        """
+        Insert into the table. The record is always appended, so "INSERT OR REPLACE"
+        is not supported.
+        :param table: Table name
+        :param columns: Column array
+        :param values: Value array
+        :param is_orreplace: Indicate if the query is "INSERT OR REPLACE"
+        """
+        if is_orreplace:
+            raise Exception("Insert or replace is not supported in column client.")
+
+        if len(columns) != len(values):
+            return False
+
+        schema = self.get_schema(table)
+        if columns != schema.columns:
+            values_map = dict(zip([e.split(' ')[0] for e in columns], values))
+            values = [values_map[e] for e in schema.columns]
+        record = schema.encode(values)
+
+        lock = self.get_table_lock(table)
+        lock.acquire()
+        try:
+            handle = self.file_handles.get(table)
+            if handle is None:
+                handle = ColumnClient.FileHandle(self.get_file_path(table))
+                self.file_handles[table] = handle
+            handle.file.write(record)
+            handle.is_dirty = True
+            if self.flush_interval == 0:
+                self.flush_table(table)
+        finally:
+            lock.release()
+
+        return True
+
+    @staticmethod
+    def search_record(f, schema, id_index, count, value):
+        """
+        Binary search the first record of which the index column is not smaller than the value.
+        The records are in ascending order of the index column.
+        :param f: File opened in binary mode
+        :param schema: TableSchema object
+        :param id_index: Position of the index column
+        :param count: Number of records
+        :param value: Searched value
+        :return Record position
+        """
+        lo = 0
+        hi = count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            f.seek(mid * schema.record_size)
+            if schema.record.unpack(f.read(schema.record_size))[id_index] < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    @staticmethod
+    def scan_records(file_path, schema, start, end, predicate, id_index=-1, upper=None):
+        """
+        Scan the records of the file
+        :param file_path: File path
+        :param schema: TableSchema object
+        :param start: Position of the first record
+        :param end: Position where the scan stops
+        :param predicate: Function which returns True if the row is selected
+        :param id_index: Position of the index column. Negative if the scan is not bounded.
+        :param upper: Upper bound of the index column
+        :return Generator of rows
+        """
+        with open(file_path, 'rb') as f:
+            f.seek(start * schema.record_size)
+            while start < end:
+                count = min(ColumnClient.READ_BATCH_SIZE, end - start)
+                start += count
+                for row in schema.decode(f.read(count * schema.record_size)):
+                    if id_index >= 0 and row[id_index] > upper:
+                        return
+                    elif predicate(row):
+                        yield row
+
+    def iter_select(self, table, columns=['*'], condition='', orderby='', limit=0,
+                    chunk_size=1000, is_chunked=False):
+        """
+        Select rows from the table lazily. The timestamps are returned as text.
+        Currently the method only processes the one column ordering and condition.
+        :param table: Table name
+        :param columns: Selected columns
+        :param condition: Where condition
+        :param orderby: Order by condition
+        :param limit: Rows limit
+        :param chunk_size: Number of rows yielded at a time if is_chunked is True
+        :param is_chunked: Yield lists of rows instead of single rows
+        :return Generator of rows, or lists of rows if is_chunked is True
+        """
+        file_path = self.get_file_path(table)
+        schema = self.get_schema(table)
+        is_all_columns = len(columns) == 1 and columns[0] == '*'
+        columns = [e.split(' ')[0] for e in columns]
+        for col in columns:
+            if not is_all_columns and col not in schema.columns:
+                raise Exception("Field (%s) is not in the table." % col)
+
+        field = ''
+        asc_val = 'asc'
+        if orderby != '':
+            field = orderby.split(' ')[0].strip()
+            asc_val = orderby.split(' ')[1].strip() if len(orderby.split(' ')) > 1 else 'asc'
+            if asc_val != 'asc' and asc_val != 'desc':
+                raise Exception("Incorrect orderby in select statement (%s)." % orderby)
+            elif field not in schema.columns:
+                raise Exception("Field (%s) is not in the table." % field)
+
+        tree = FileClient.parse_condition(condition)
+        predicate = FileClient.compile_condition(tree, schema.columns)
+        lower, upper = FileClient.get_id_range(tree)
+        if FileClient.INDEX_COLUMN in schema.columns:
+            id_index = schema.columns.index(FileClient.INDEX_COLUMN)
+        else:
+            id_index = -1
+            lower, upper = None, None
+
+        lock = self.get_table_lock(table)
+        lock.acquire()
+        try:
+            self.flush_table(table)
+            # The records appended after this point are not selected
+            count = os.path.getsize(file_path) // schema.record_size
+        finally:
+            lock.release()
+
+        start = 0
+        if lower is not None:
+            with open(file_path, 'rb') as f:
+                start = ColumnClient.search_record(f, schema, id_index, count, lower)
+
+        if tree is None and field == FileClient.INDEX_COLUMN and asc_val == 'desc' and limit > 0:
+            # Last records
+            rows = reversed(list(ColumnClient.scan_records(file_path, schema, max(0, count - limit),
+                                                           count, predicate)))
+        else:
+            rows = ColumnClient.scan_records(file_path, schema, start, count, predicate,
+                                             id_index if upper is not None else -1, upper)
+            if field != '' and not (field == FileClient.INDEX_COLUMN and asc_val == 'asc'):
+                # Sort the result
+                field_index_sort = schema.columns.index(field)
+                rows = iter(sorted(rows, key=lambda x:x[field_index_sort], reverse=(asc_val == 'desc')))
+
+        if not is_all_columns:
+            field_index = [schema.columns.index(x) for x in columns]
+
+        chunk = []
+        num_rows = 0
+        for row in rows:
+            if not is_all_columns:
+                row = [row[i] for i in field_index]
+            if is_chunked:
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+            else:
+                yield row
+
+            num_rows += 1
+            if limit > 0 and num_rows >= limit:
+                # Trim the result by the limit
+                break
+
+        if is_chunked and len(chunk) > 0:
+            yield chunk
+
+    def select(self, table, columns=['*'], condition='', orderby='', limit=0, isFetchAll=True):
+        """
+        Select rows from the table. The timestamps are returned as text.
+        Currently the method only processes the one column ordering and condition
+        :param table: Table name
+        :param columns: Selected columns
+        :param condition: Where condition
+        :param orderby: Order by condition
+        :param limit: Rows limit
+        :param isFetchAll: Indicator of fetching all
+        :return Result rows
+        """
+        return list(self.iter_select(table, columns, condition, orderby, limit))
+
+    def load(self, table, start_time=None, end_time=None):
+        """
+        Memory map the records of the table as a NumPy record array. The timestamps
+        are nanoseconds since epoch, and the records are assumed in ascending order
+        of the timestamp when the time range is given.
+        :param table: Table name
+        :param start_time: Inclusive start of the time range, in nanoseconds or text
+        :param end_time: Exclusive end of the time range, in nanoseconds or text
+        :return NumPy record array
+        """
+        if np is None:
+            raise Exception("ColumnClient requires numpy to load the table.")
+
+        schema = self.get_schema(table)
+        lock = self.get_table_lock(table)
+        lock.acquire()
+        try:
+            self.flush_table(table)
+            count = os.path.getsize(self.get_file_path(table)) // schema.record_size
+        finally:
+            lock.release()
+
+        if count == 0:
+            return np.zeros(0, dtype=schema.dtype()).view(np.recarray)
+
+        ret = np.memmap(self.get_file_path(table), dtype=schema.dtype(), mode='r',
+                        shape=(count,)).view(np.recarray)
+        if start_time is not None or end_time is not None:
+            if schema.date_time_index < 0:
+                raise Exception("Table (%s) does not have column (%s)." % \
+                                (table, ColumnClient.DATE_TIME_COLUMN))
+            date_times = ret[ColumnClient.DATE_TIME_COLUMN]
+            start = 0 if start_time is None else \
+                    np.searchsorted(date_times, ColumnClient.to_nanoseconds(start_time), side='left')
+            end = count if end_time is None else \
+                  np.searchsorted(date_times, ColumnClient.to_nanoseconds(end_time), side='left')
+            ret = ret[start:end]
+
+        return ret
+
+    def list_tables(self):
+        """
+        List the tables in the database
+        :return List of table names
+        """
+        ext = '.col.json'
+        return sorted([name[:-len(ext)] for name in os.listdir(self.file_directory) if name.endswith(ext)])
+
+    def delete(self, table, condition='1==1'):
+        """
+        Delete rows from the table
+        :param table: Table name
+        :param condition: Where condition
+        """
+        raise Exception("Deletion is not supported in column client.")
+
+    def close(self):
+        """
+        Flush and close all the opened files
+        """
+        self.flush_event.set()
+        for table in list(self.file_handles.keys()):
+            lock = self.get_table_lock(table)
+            lock.acquire()
+            handle = self.file_handles.pop(table, None)
+            if handle is not None:
+                handle.file.flush()
+                handle.file.close()
+            lock.release()
+        return True
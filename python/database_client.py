@@ -6,7 +6,8 @@ class DatabaseClient:
         """
         Constructor
         """
-        pass
+        # Indicate if the timestamps are inserted in nanoseconds since epoch instead of text
+        self.native_timestamp = False
 
     def connect(self, **args):
         """
@@ -47,6 +48,57 @@ class DatabaseClient:
         :return Result rows
         """
 
+    def iter_select(self, table, columns=['*'], condition='', orderby='', limit=0,
+                    chunk_size=1000, is_chunked=False):
+        """
+        Select rows from the table lazily
+        :param table: Table name
+        :param columns: Selected columns
+        :param condition: Where condition
+        :param orderby: Order by condition
+        :param limit: Rows limit
+        :param chunk_size: Number of rows fetched at a time
+        :param is_chunked: Yield lists of rows instead of single rows
+        :return Generator of rows, or lists of rows if is_chunked is True
+        """
+        rows = self.select(table, columns, condition, orderby, limit)
+        if is_chunked:
+            for i in range(0, len(rows), chunk_size):
+                yield rows[i:i+chunk_size]
+        else:
+            for row in rows:
+                yield row
+
+    def list_tables(self):
+        """
+        List the tables in the database
+        :return List of table names
+        """
+        return []
+
+    def compress(self, table, method='gzip'):
+        """
+        Compress the table. The compressed table is read only.
+        :param table: Table name
+        :param method: Compression method
+        :return True if the table is compressed
+        """
+        return False
+
+    def flush(self):
+        """
+        Flush the buffered rows to the database
+        :return True if the rows are flushed
+        """
+        return True
+
+    def get_stats(self):
+        """
+        Get the statistics of the client
+        :return Dictionary of statistics
+        """
+        return {}
+
     def close(self):
         """
         Close connection
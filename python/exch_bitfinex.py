@@ -1,13 +1,11 @@
 import time
 import threading
-import json
 from functools import partial
-from datetime import datetime
-from ws_api_socket import WebSocketApiClient
-from market_data import L2Depth, Trade
+from ws_api_socket import WebSocketApiClient, WebSocketApiPool
+from market_data import L2Depth, Trade, OrderBook
 from exchange import ExchangeGateway
 from instrument import Instrument
-from util import Logger
+from util import Logger, Timestamp
 
 
 class ExchGwBitfinexWs(WebSocketApiClient):
@@ -29,97 +27,47 @@ class ExchGwBitfinexWs(WebSocketApiClient):
         """
         # No order book mapping from config. Need to decode here.
         l2_depth = instmt.get_l2_depth()
-        l2_depth.date_time = datetime.utcnow().strftime("%Y%m%d %H:%M:%S.%f")
+        order_book = instmt.get_order_book()
+        l2_depth.receive_timestamp = Timestamp.now()
+        l2_depth.timestamp = l2_depth.receive_timestamp
         if isinstance(raw[0], list):
             # Start subscription
-            for i in range(0, 25):
-                bid = raw[i]
-                ask = raw[25+i]
-
-                l2_depth.bids[i] = L2Depth.Depth(price=bid[0], count=bid[1], volume=bid[2])
-                l2_depth.asks[i] = L2Depth.Depth(price=ask[0], count=ask[1], volume=-ask[2])
+            order_book.clear()
+            for level in raw:
+                if level[2] > 0:
+                    order_book.update(L2Depth.Side.BUY, level[0], level[1], level[2])
+                else:
+                    order_book.update(L2Depth.Side.SELL, level[0], level[1], -level[2])
 
         else:
             price = raw[1]
             count = raw[2]
             volume = raw[3]
-            found = False
 
             if count == 0:
                 # Deletion
-                if volume > 0:
-                    for i in range(0, len(l2_depth.bids)):
-                        if price == l2_depth.bids[i].price:
-                            found = True
-                            del l2_depth.bids[i]
-                            break
-                else:
-                    for i in range(0, len(l2_depth.asks)):
-                        if price == l2_depth.asks[i].price:
-                            found = True
-                            del l2_depth.asks[i]
-                            break
-
-                if not found:
+                if not order_book.delete(L2Depth.Side.BUY if volume > 0 else L2Depth.Side.SELL, price):
                     depth_text = ""
                     for i in range(0, l2_depth.depth):
-                        if i < len(l2_depth.bids):
-                            depth_text += "%.4f,%d,%.4f" % \
-                              (l2_depth.bids[i].volume, \
-                               l2_depth.bids[i].count, \
-                               l2_depth.bids[i].price)
-                        else:
-                            depth_text += "                   "
+                        depth_text += "%.4f,%d,%.4f" % \
+                          (l2_depth.bids[i].volume, \
+                           l2_depth.bids[i].count, \
+                           l2_depth.bids[i].price)
                         depth_text += "<--->"
-                        if i < len(l2_depth.asks):
-                            depth_text += "%.4f,%d,%.4f" % \
-                                          (l2_depth.asks[i].volume, \
-                                           l2_depth.asks[i].count, \
-                                           l2_depth.asks[i].price)
-                        else:
-                            depth_text += "                   "
+                        depth_text += "%.4f,%d,%.4f" % \
+                                      (l2_depth.asks[i].volume, \
+                                       l2_depth.asks[i].count, \
+                                       l2_depth.asks[i].price)
                         depth_text += "\n"
                     Logger.info(cls.__name__, "Cannot find the deletion of the message: %s\nDepth:\n%s\n" % \
                               (raw, depth_text))
-            else:
+            elif volume > 0:
                 # Insertion/Update
-                if volume > 0:
-                    # Update
-                    for i in range(0, len(l2_depth.bids)):
-                        if price == l2_depth.bids[i].price:
-                            l2_depth.bids[i].count = count
-                            l2_depth.bids[i].volume = volume
-                            found = True
-                            break
-
-                    if not found:
-                        # Insertion
-                        l2_depth.bids.append(L2Depth.Depth(price=price,
-                                                         count=count,
-                                                         volume=volume))
-                        l2_depth.sort_bids()
-
-                        if len(l2_depth.bids) > l2_depth.depth * 2:
-                            del l2_depth.bids[l2_depth.depth:]
-                else:
-                    for i in range(0, len(l2_depth.asks)):
-                        # Update
-                        if price == l2_depth.asks[i].price:
-                            l2_depth.asks[i].count = count
-                            l2_depth.asks[i].volume = -volume
-                            found = True
-                            break
-
-                    if not found:
-                        # Insertion
-                        l2_depth.asks.append(L2Depth.Depth(price=price,
-                                                    count=count,
-                                                    volume=-volume))
-                        l2_depth.sort_asks()
-
-                        if len(l2_depth.asks) > l2_depth.depth * 2:
-                            del l2_depth.asks[l2_depth.depth:]
+                order_book.update(L2Depth.Side.BUY, price, count, volume)
+            else:
+                order_book.update(L2Depth.Side.SELL, price, count, -volume)
 
+        order_book.fill_l2_depth(l2_depth)
         return l2_depth
 
     @classmethod
@@ -142,7 +90,7 @@ class ExchGwBitfinexWs(WebSocketApiClient):
                     raise
 
                 if field == 'TIMESTAMP':
-                    trade.date_time = datetime.utcfromtimestamp(value).strftime("%Y%m%d %H:%M:%S.%f")
+                    trade.timestamp = Timestamp.from_seconds(value)
                 elif field == 'TRADE_VOLUME':
                     # The trade side is only determined by the sign of the trade volume
                     trade.trade_side = Trade.Side.BUY if value > 0 else Trade.Side.SELL
@@ -159,12 +107,17 @@ class ExchGwBitfinex(ExchangeGateway):
     """
     Exchange gateway BTCC
     """
-    def __init__(self, db_client):
+    def __init__(self, db_client, pool_size=1):
         """
         Constructor
         :param db_client: Database client
+        :param pool_size: Maximum number of socket connections
         """
         ExchangeGateway.__init__(self, ExchGwBitfinexWs(), db_client)
+        self.socket_pool = WebSocketApiPool(self.api_socket, ExchGwBitfinexWs, pool_size)
+        self.instmts = dict()           # Instrument code -> Instrument
+        self.channels = dict()          # (Socket id, channel id) -> Instrument
+        self.message_handlers = dict()  # Socket id -> Message handler
 
     @classmethod
     def get_exchange_name(cls):
@@ -183,6 +136,7 @@ class ExchGwBitfinex(ExchangeGateway):
         Logger.info(self.__class__.__name__, "Instrument %s is subscribed in channel %s" % \
                   (instmt.get_instmt_code(), instmt.get_exchange_name()))
         if not instmt.get_subscribed():
+            self.set_reconnected(instmt)
             ws.send("{\"event\":\"subscribe\", \"channel\": \"book\", \"pair\": \"%s\", \"freq\": \"F0\"}" % instmt.get_instmt_code())
             ws.send("{\"event\":\"subscribe\", \"channel\": \"trades\", \"pair\": \"%s\"}" % instmt.get_instmt_code())
             instmt.set_subscribed(True)
@@ -195,45 +149,47 @@ class ExchGwBitfinex(ExchangeGateway):
         """
         Logger.info(self.__class__.__name__, "Instrument %s is subscribed in channel %s" % \
                   (instmt.get_instmt_code(), instmt.get_exchange_name()))
-        instmt.set_subscribed(False)
+        self.set_disconnected(instmt)
 
-    def on_message_handler(self, instmt, message):
+    def on_message_handler(self, api_socket, message):
         """
-        Incoming message handler
-        :param instmt: Instrument
-        :param message: Message
+        Incoming message handler. The messages are routed to the instruments by
+        pair on subscription and by channel id afterwards. The channel ids are
+        given per socket.
+        :param api_socket: Socket receiving the message
+        :param message: Decoded message
         """
-        message = json.loads(message)
         if isinstance(message, dict):
             keys = message.keys()
             if 'event' in keys and message['event'] == 'info' and  'version' in keys:
                 Logger.info(self.__class__.__name__, "Bitfinex version: %s" % message['version'])
             elif 'event' in keys and message['event'] == 'subscribed':
-                if instmt.get_instmt_code() == message['pair']:
+                instmt = self.instmts.get(message['pair'])
+                if instmt is not None:
                     if message['channel'] == 'book':
                         instmt.set_order_book_channel_id(message['chanId'])
                     elif message['channel'] == 'trades':
                         instmt.set_trades_channel_id(message['chanId'])
                     else:
                         raise Exception("Unknown channel %s : <%s>" % (message['channel'], message))
+                    self.channels[(api_socket.id, message['chanId'])] = instmt
 
                     Logger.info(self.__class__.__name__, 'Subscription: %s, pair: %s, channel Id: %s' % \
                               (message['channel'], instmt.get_instmt_code(), message['chanId']))
         elif isinstance(message, list):
-            if message[0] == instmt.get_order_book_channel_id():
+            instmt = self.channels.get((api_socket.id, message[0]))
+            if instmt is None:
+                return
+            elif message[0] == instmt.get_order_book_channel_id():
                 if isinstance(message[1], list):
                     self.api_socket.parse_l2_depth(instmt, message[1])
                 elif len(message) != 2:
-                    instmt.set_prev_l2_depth(instmt.get_l2_depth().copy())
                     self.api_socket.parse_l2_depth(instmt, message)
                 else:
                     return
 
-                if instmt.get_l2_depth().is_diff(instmt.get_prev_l2_depth()):
-                    instmt.incr_order_book_id()
-                    self.db_client.insert(table=instmt.get_order_book_table_name(),
-                                          columns=['id'] + L2Depth.columns(),
-                                          values=[instmt.get_order_book_id()] + instmt.get_l2_depth().values())
+                if instmt.is_l2_depth_changed():
+                    self.record_order_book(instmt)
             elif message[0] == instmt.get_trades_channel_id():
                 if isinstance(message[1], list):
                     raw_trades = message[1]
@@ -243,17 +199,13 @@ class ExchGwBitfinex(ExchangeGateway):
                         if int(trade.trade_id) > int(instmt.get_exch_trade_id()):
                             instmt.incr_trade_id()
                             instmt.set_exch_trade_id(trade.trade_id)
-                            self.db_client.insert(table=instmt.get_trades_table_name(),
-                                                  columns=['id'] + Trade.columns(),
-                                                  values=[instmt.get_trade_id()] + trade.values())
+                            self.insert_trade(instmt, trade)
                 elif message[1] == 'tu':
                     trade = self.api_socket.parse_trade(instmt, message[3:])
                     if int(trade.trade_id) > int(instmt.get_exch_trade_id()):
                         instmt.incr_trade_id()
                         instmt.set_exch_trade_id(trade.trade_id)
-                        self.db_client.insert(table=instmt.get_trades_table_name(),
-                                              columns=['id'] + Trade.columns(),
-                                              values=[instmt.get_trade_id()] + trade.values())
+                        self.insert_trade(instmt, trade)
 
     def start(self, instmt):
         """
@@ -263,6 +215,7 @@ class ExchGwBitfinex(ExchangeGateway):
         """
         instmt.set_l2_depth(L2Depth(25))
         instmt.set_prev_l2_depth(L2Depth(25))
+        instmt.set_order_book(OrderBook(25))
         instmt.set_order_book_table_name(self.get_order_book_table_name(instmt.get_exchange_name(),
                                                                        instmt.get_instmt_name()))
         instmt.set_trades_table_name(self.get_trades_table_name(instmt.get_exchange_name(),
@@ -271,8 +224,12 @@ class ExchGwBitfinex(ExchangeGateway):
         trade_id, last_exch_trade_id = self.get_trades_init(instmt)
         instmt.set_trade_id(trade_id)
         instmt.set_exch_trade_id(last_exch_trade_id)
-        return [self.api_socket.connect(instmt.get_link(),
-                                        on_message_handler=partial(self.on_message_handler, instmt),
-                                        on_open_handler=partial(self.on_open_handler, instmt),
-                                        on_close_handler=partial(self.on_close_handler, instmt))]
+        self.instmts[instmt.get_instmt_code()] = instmt
+        api_socket = self.socket_pool.get_socket()
+        on_message_handler = self.message_handlers.setdefault(api_socket.id,
+                                                              partial(self.on_message_handler, api_socket))
+        return [api_socket.connect(instmt.get_link(),
+                                   on_message_handler=on_message_handler,
+                                   on_open_handler=partial(self.on_open_handler, instmt),
+                                   on_close_handler=partial(self.on_close_handler, instmt))]
 
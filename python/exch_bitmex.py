@@ -2,12 +2,11 @@ import time
 import threading
 import json
 from functools import partial
-from datetime import datetime
-from ws_api_socket import WebSocketApiClient
+from ws_api_socket import WebSocketApiClient, WebSocketApiPool
 from market_data import L2Depth, Trade
 from exchange import ExchangeGateway
 from instrument import Instrument
-from util import Logger
+from util import Logger, Timestamp
 
 
 class ExchGwBitmexWs(WebSocketApiClient):
@@ -28,6 +27,7 @@ class ExchGwBitmexWs(WebSocketApiClient):
         :param raw: Raw data in JSON
         """
         l2_depth = instmt.get_l2_depth()
+        l2_depth.receive_timestamp = Timestamp.now()
         field_map = instmt.get_order_book_fields_mapping()
         for key, value in raw.items():
             if key in field_map.keys():
@@ -38,7 +38,7 @@ class ExchGwBitmexWs(WebSocketApiClient):
                     raise
                 
                 if field == 'TIMESTAMP':
-                    l2_depth.date_time = value.replace('T', ' ').replace('Z', '').replace('-' , '')
+                    l2_depth.timestamp = Timestamp.parse(value)
                 elif field == 'BIDS':
                     bids = sorted(value, key=lambda x: x[0], reverse=True)
                     for i in range(0, 10):
@@ -72,7 +72,7 @@ class ExchGwBitmexWs(WebSocketApiClient):
                     raise
                 
                 if field == 'TIMESTAMP':
-                    trade.date_time = value.replace('T', ' ').replace('Z', '')
+                    trade.timestamp = Timestamp.parse(value)
                 elif field == 'TRADE_SIDE':
                     trade.trade_side = Trade.parse_side(value)
                     if trade.trade_side == Trade.Side.NONE:
@@ -93,12 +93,15 @@ class ExchGwBitmex(ExchangeGateway):
     """
     Exchange gateway
     """
-    def __init__(self, db_client):
+    def __init__(self, db_client, pool_size=1):
         """
         Constructor
         :param db_client: Database client
+        :param pool_size: Maximum number of socket connections
         """
         ExchangeGateway.__init__(self, ExchGwBitmexWs(), db_client)
+        self.socket_pool = WebSocketApiPool(self.api_socket, ExchGwBitmexWs, pool_size)
+        self.instmts = dict()           # Instrument code -> Instrument
 
     @classmethod
     def get_exchange_name(cls):
@@ -117,6 +120,7 @@ class ExchGwBitmex(ExchangeGateway):
         Logger.info(self.__class__.__name__, "Instrument %s is subscribed in channel %s" % \
                   (instmt.get_instmt_code(), instmt.get_exchange_name()))
         if not instmt.get_subscribed():
+            self.set_reconnected(instmt)
             ws.send("{\"op\":\"subscribe\", \"args\": [\"orderBook10:%s\"]}" % instmt.get_instmt_code())
             ws.send("{\"op\":\"subscribe\", \"args\": [\"trade:%s\"]}" % instmt.get_instmt_code())
             instmt.set_subscribed(True)
@@ -129,15 +133,13 @@ class ExchGwBitmex(ExchangeGateway):
         """
         Logger.info(self.__class__.__name__, "Instrument %s is subscribed in channel %s" % \
                   (instmt.get_instmt_code(), instmt.get_exchange_name()))
-        instmt.set_subscribed(False)
+        self.set_disconnected(instmt)
 
-    def on_message_handler(self, instmt, message):
+    def on_message_handler(self, message):
         """
-        Incoming message handler
-        :param instmt: Instrument
-        :param message: Message
+        Incoming message handler. The rows are routed to the instruments by symbol.
+        :param message: Decoded message
         """
-        message = json.loads(message)
         keys = message.keys()
         if 'info' in keys:
             Logger.info(self.__class__.__name__, message['info'])
@@ -148,25 +150,21 @@ class ExchGwBitmex(ExchangeGateway):
         elif 'table' in keys:
             if message['table'] == 'trade':
                 for trade_raw in message['data']:
-                    if trade_raw["symbol"] == instmt.get_instmt_code():
+                    instmt = self.instmts.get(trade_raw["symbol"])
+                    if instmt is not None:
                         # Filter out the initial subscriptions
                         trade = self.api_socket.parse_trade(instmt, trade_raw)
                         if trade.trade_id != instmt.get_exch_trade_id():
                             instmt.incr_trade_id()
                             instmt.set_exch_trade_id(trade.trade_id)
-                            self.db_client.insert(table=instmt.get_trades_table_name(),
-                                                  columns=['id']+Trade.columns(),
-                                                  values=[instmt.get_trade_id()]+trade.values())
+                            self.insert_trade(instmt, trade)
             elif message['table'] == 'orderBook10':
                 for data in message['data']:
-                    if data["symbol"] == instmt.get_instmt_code():
-                        instmt.set_prev_l2_depth(instmt.get_l2_depth().copy())
+                    instmt = self.instmts.get(data["symbol"])
+                    if instmt is not None:
                         self.api_socket.parse_l2_depth(instmt, data)
-                        if instmt.get_l2_depth().is_diff(instmt.get_prev_l2_depth()):
-                            instmt.incr_order_book_id()
-                            self.db_client.insert(table=instmt.get_order_book_table_name(),
-                                                    columns=['id']+L2Depth.columns(),
-                                                    values=[instmt.get_order_book_id()]+instmt.get_l2_depth().values())
+                        if instmt.is_l2_depth_changed():
+                            self.record_order_book(instmt)
             else:
                 Logger.info(self.__class__.__name__, json.dumps(message,indent=2))
         else:
@@ -188,8 +186,10 @@ class ExchGwBitmex(ExchangeGateway):
         trade_id, last_exch_trade_id = self.get_trades_init(instmt)
         instmt.set_trade_id(trade_id)
         instmt.set_exch_trade_id(last_exch_trade_id)
-        return [self.api_socket.connect(instmt.get_link(),
-                                        on_message_handler=partial(self.on_message_handler, instmt),
-                                        on_open_handler=partial(self.on_open_handler, instmt),
-                                        on_close_handler=partial(self.on_close_handler, instmt))]
+        self.instmts[instmt.get_instmt_code()] = instmt
+        api_socket = self.socket_pool.get_socket()
+        return [api_socket.connect(instmt.get_link(),
+                                   on_message_handler=self.on_message_handler,
+                                   on_open_handler=partial(self.on_open_handler, instmt),
+                                   on_close_handler=partial(self.on_close_handler, instmt))]
 
@@ -1,11 +1,8 @@
-import time
-import threading
 from functools import partial
-from datetime import datetime
 from restful_api_socket import RESTfulApiSocket
 from exchange import ExchangeGateway
 from market_data import L2Depth, Trade
-from util import Logger
+from util import Timestamp
 
 
 class ExchGwBtccRestfulApi(RESTfulApiSocket):
@@ -22,7 +19,7 @@ class ExchGwBtccRestfulApi(RESTfulApiSocket):
         :param instmt: Instrument
         :param raw: Raw data in JSON
         """
-        l2_depth = L2Depth()
+        l2_depth = L2Depth(instmt.get_book_record_depth())
         field_map = instmt.get_order_book_fields_mapping()
         for key, value in raw.items():
             if key in field_map.keys():
@@ -38,17 +35,17 @@ class ExchGwBtccRestfulApi(RESTfulApiSocket):
                         date_time = float(value)
                     else:
                         date_time = float(value)/offset
-                    l2_depth.date_time = datetime.utcfromtimestamp(date_time).strftime("%Y%m%d %H:%M:%S.%f")
+                    l2_depth.timestamp = Timestamp.from_seconds(date_time)
                 elif field == 'BIDS':
                     bids = value
                     sorted(bids, key=lambda x: x[0])
-                    for i in range(0, 5):
+                    for i in range(0, min(l2_depth.depth, len(bids))):
                         l2_depth.bids[i].price = float(bids[i][0]) if type(bids[i][0]) != float else bids[i][0]
                         l2_depth.bids[i].volume = float(bids[i][1]) if type(bids[i][1]) != float else bids[i][1]
                 elif field == 'ASKS':
                     asks = value
                     sorted(asks, key=lambda x: x[0], reverse=True)
-                    for i in range(0, 5):
+                    for i in range(0, min(l2_depth.depth, len(asks))):
                         l2_depth.asks[i].price = float(asks[i][0]) if type(asks[i][0]) != float else asks[i][0]
                         l2_depth.asks[i].volume = float(asks[i][1]) if type(asks[i][1]) != float else asks[i][1]
                 else:
@@ -79,7 +76,7 @@ class ExchGwBtccRestfulApi(RESTfulApiSocket):
                         date_time = float(value)
                     else:
                         date_time = float(value)/offset
-                    trade.date_time = datetime.utcfromtimestamp(date_time).strftime("%Y%m%d %H:%M:%S.%f")
+                    trade.timestamp = Timestamp.from_seconds(date_time)
                 elif field == 'TRADE_SIDE':
                     trade.trade_side = Trade.parse_side(value)
                     if trade.trade_side == Trade.Side.NONE:
@@ -151,51 +148,53 @@ class ExchGwBtcc(ExchangeGateway):
         """
         return 'BTCC'
 
-    def get_order_book_worker(self, instmt):
+    def init_order_book(self, instmt):
         """
-        Get order book worker
+        Initialization of the order book poller
         :param instmt: Instrument
         """
         instmt.set_order_book_id(self.get_order_book_init(instmt))
 
-        while True:
-            try:
-                l2_depth = self.api_socket.get_order_book(instmt)
-                if l2_depth is not None and l2_depth.is_diff(instmt.get_l2_depth()):
-                    instmt.set_prev_l2_depth(instmt.get_l2_depth())
-                    instmt.set_l2_depth(l2_depth)
-                    instmt.incr_order_book_id()
-                    self.db_client.insert(table=instmt.get_order_book_table_name(),
-                                          columns=['id']+L2Depth.columns(),
-                                          values=[instmt.get_order_book_id()]+l2_depth.values())
-            except Exception as e:
-                Logger.error(self.__class__.__name__,
-                          "Error in order book: %s\nReturn: %s" % (e, l2_depth.values()))
-            time.sleep(0.5)
-
-    def get_trades_worker(self, instmt):
-        """
-        Get order book worker thread
-        :param instmt: Instrument name
-        """
-        trade_id, exch_trade_id = self.get_trades_init(instmt)
+    def poll_order_book(self, instmt):
+        """
+        Get the order book once
+        :param instmt: Instrument
+        :return True if the order book is changed
+        """
+        l2_depth = self.api_socket.get_order_book(instmt)
+        if l2_depth is None:
+            return False
+
+        instmt.set_prev_l2_depth(instmt.get_l2_depth())
+        instmt.set_l2_depth(l2_depth)
+        if instmt.is_l2_depth_changed():
+            self.record_order_book(instmt)
+            return True
+        return False
+
+    def init_trades(self, instmt):
+        """
+        Initialization of the trades poller
+        :param instmt: Instrument
+        """
+        trade_id, last_exch_trade_id = self.get_trades_init(instmt)
         instmt.set_trade_id(trade_id)
-        instmt.set_exch_trade_id(exch_trade_id)
-
-        while True:
-            try:
-                ret = self.api_socket.get_trades(instmt)
-                for trade in ret:
-                    if int(trade.trade_id) > int(instmt.get_exch_trade_id()):
-                        instmt.set_exch_trade_id(int(trade.trade_id))
-                        instmt.incr_trade_id()
-                        self.db_client.insert(table=instmt.get_trades_table_name(),
-                                              columns=['id']+Trade.columns(),
-                                              values=[instmt.get_trade_id()]+trade.values())
-            except Exception as e:
-                Logger.error(self.__class__.__name__,
-                          "Error in trades: %s\nReturn: %s" % (e, ret))
-            time.sleep(0.5)
+        instmt.set_exch_trade_id(last_exch_trade_id)
+
+    def poll_trades(self, instmt):
+        """
+        Get the trades once
+        :param instmt: Instrument
+        :return True if there are new trades
+        """
+        is_changed = False
+        for trade in self.api_socket.get_trades(instmt):
+            if int(trade.trade_id) > int(instmt.get_exch_trade_id()):
+                instmt.set_exch_trade_id(int(trade.trade_id))
+                instmt.incr_trade_id()
+                self.insert_trade(instmt, trade)
+                is_changed = True
+        return is_changed
 
     def start(self, instmt):
         """
@@ -209,11 +208,12 @@ class ExchGwBtcc(ExchangeGateway):
                                                                         instmt.get_instmt_name()))
         instmt.set_trades_table_name(self.get_trades_table_name(instmt.get_exchange_name(),
                                                                 instmt.get_instmt_name()))
-        t1 = threading.Thread(target=partial(self.get_order_book_worker, instmt))
-        t1.start()
-        t2 = threading.Thread(target=partial(self.get_trades_worker, instmt))
-        t2.start()
-        return [t1, t2]
+        return self.start_poller('%s order book' % instmt.get_instmt_name(),
+                                 partial(self.init_order_book, instmt),
+                                 partial(self.poll_order_book, instmt), 0.5) + \
+               self.start_poller('%s trades' % instmt.get_instmt_name(),
+                                 partial(self.init_trades, instmt),
+                                 partial(self.poll_trades, instmt), 0.5)
 
 
 
@@ -2,12 +2,11 @@ import time
 import threading
 import json
 from functools import partial
-from datetime import datetime
-from ws_api_socket import WebSocketApiClient
+from ws_api_socket import WebSocketApiClient, WebSocketApiPool
 from market_data import L2Depth, Trade
 from exchange import ExchangeGateway
 from instrument import Instrument
-from util import Logger
+from util import Logger, Timestamp
 
 
 class ExchGwOkCoinWs(WebSocketApiClient):
@@ -29,6 +28,7 @@ class ExchGwOkCoinWs(WebSocketApiClient):
         """
         field_map = instmt.get_order_book_fields_mapping()
         l2_depth = instmt.get_l2_depth()
+        l2_depth.receive_timestamp = Timestamp.now()
         for key, value in raw.items():
             if key in field_map.keys():
                 try:
@@ -38,8 +38,7 @@ class ExchGwOkCoinWs(WebSocketApiClient):
                     raise
                 
                 if field == 'TIMESTAMP':
-                    date_time = float(value)/1000.0
-                    l2_depth.date_time = datetime.utcfromtimestamp(date_time).strftime("%Y%m%d %H:%M:%S.%f")
+                    l2_depth.timestamp = Timestamp.from_milliseconds(value)
                 elif field == 'BIDS':
                     bids = sorted(value, key=lambda x: x[0], reverse=True)
                     for i in range(0, len(bids)):
@@ -97,12 +96,15 @@ class ExchGwOkCoin(ExchangeGateway):
     """
     Exchange gateway
     """
-    def __init__(self, db_client):
+    def __init__(self, db_client, pool_size=1):
         """
         Constructor
         :param db_client: Database client
+        :param pool_size: Maximum number of socket connections
         """
         ExchangeGateway.__init__(self, ExchGwOkCoinWs(), db_client)
+        self.socket_pool = WebSocketApiPool(self.api_socket, ExchGwOkCoinWs, pool_size)
+        self.channels = dict()          # Channel name -> Instrument
 
     @classmethod
     def get_exchange_name(cls):
@@ -121,6 +123,7 @@ class ExchGwOkCoin(ExchangeGateway):
         Logger.info(self.__class__.__name__, "Instrument %s is subscribed in channel %s" % \
                   (instmt.get_instmt_code(), instmt.get_exchange_name()))
         if not instmt.get_subscribed():
+            self.set_reconnected(instmt)
             instmt_code_split = instmt.get_instmt_code().split('_')
             if len(instmt_code_split) == 3:
                 # Future instruments
@@ -137,6 +140,8 @@ class ExchGwOkCoin(ExchangeGateway):
                 instmt.set_order_book_channel_id("ok_sub_%s_depth_20" % instmt.get_instmt_code())
                 instmt.set_trades_channel_id("ok_sub_%s_trades" % instmt.get_instmt_code())
 
+            self.channels[instmt.get_order_book_channel_id()] = instmt
+            self.channels[instmt.get_trades_channel_id()] = instmt
             ws.send("{\"event\":\"addChannel\", \"channel\": \"%s\"}" % instmt.get_order_book_channel_id())
             ws.send("{\"event\":\"addChannel\", \"channel\": \"%s\"}" % instmt.get_trades_channel_id())
             instmt.set_subscribed(True)
@@ -149,30 +154,27 @@ class ExchGwOkCoin(ExchangeGateway):
         """
         Logger.info(self.__class__.__name__, "Instrument %s is subscribed in channel %s" % \
                   (instmt.get_instmt_code(), instmt.get_exchange_name()))
-        instmt.set_subscribed(False)
+        self.set_disconnected(instmt)
 
-    def on_message_handler(self, instmt, messages):
+    def on_message_handler(self, messages):
         """
-        Incoming message handler
-        :param instmt: Instrument
-        :param message: Message
+        Incoming message handler. The messages are routed to the instruments by channel.
+        :param messages: Decoded messages
         """
-        messages = json.loads(messages)
         for message in messages:
             keys = message.keys()
             if 'channel' in keys:
                 if 'data' in keys:
-                    if message['channel'] == instmt.get_order_book_channel_id():
+                    instmt = self.channels.get(message['channel'])
+                    if instmt is None:
+                        continue
+                    elif message['channel'] == instmt.get_order_book_channel_id():
                         data = message['data']
-                        instmt.set_prev_l2_depth(instmt.get_l2_depth().copy())
                         self.api_socket.parse_l2_depth(instmt, data)
 
                         # Insert only if the first 5 levels are different
-                        if instmt.get_l2_depth().is_diff(instmt.get_prev_l2_depth()):
-                            instmt.incr_order_book_id()
-                            self.db_client.insert(table=instmt.get_order_book_table_name(),
-                                                  columns=['id']+L2Depth.columns(),
-                                                  values=[instmt.get_order_book_id()]+instmt.get_l2_depth().values())
+                        if instmt.is_l2_depth_changed():
+                            self.record_order_book(instmt)
 
                     elif message['channel'] == instmt.get_trades_channel_id():
                         for trade_raw in message['data']:
@@ -180,9 +182,7 @@ class ExchGwOkCoin(ExchangeGateway):
                             if trade.trade_id != instmt.get_exch_trade_id():
                                 instmt.incr_trade_id()
                                 instmt.set_exch_trade_id(trade.trade_id)
-                                self.db_client.insert(table=instmt.get_trades_table_name(),
-                                                      columns=['id']+Trade.columns(),
-                                                      values=[instmt.get_trade_id()]+trade.values())
+                                self.insert_trade(instmt, trade)
                 elif 'success' in keys:
                     Logger.info(self.__class__.__name__, "Subscription to channel %s is %s" \
                         % (message['channel'], message['success']))
@@ -205,8 +205,9 @@ class ExchGwOkCoin(ExchangeGateway):
         trade_id, last_exch_trade_id = self.get_trades_init(instmt)
         instmt.set_trade_id(trade_id)
         instmt.set_exch_trade_id(last_exch_trade_id)
-        return [self.api_socket.connect(instmt.get_link(),
-                                        on_message_handler=partial(self.on_message_handler, instmt),
-                                        on_open_handler=partial(self.on_open_handler, instmt),
-                                        on_close_handler=partial(self.on_close_handler, instmt))]
+        api_socket = self.socket_pool.get_socket()
+        return [api_socket.connect(instmt.get_link(),
+                                   on_message_handler=self.on_message_handler,
+                                   on_open_handler=partial(self.on_open_handler, instmt),
+                                   on_close_handler=partial(self.on_close_handler, instmt))]
 
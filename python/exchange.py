@@ -1,11 +1,26 @@
 #!/bin/python
 from database_client import DatabaseClient
-from market_data import L2Depth, Trade
+from market_data import L2Depth, Trade, Bar
+from instrument import Instrument
+from util import Logger, Timestamp
+from poll_scheduler import PollScheduler, Poller, AdaptiveInterval, TokenBucket
+import threading
+import time
 
 class ExchangeGateway:
     """
     Exchange gateway
     """
+    # Scheduler of the RESTful pollers shared by all the exchanges
+    scheduler = PollScheduler()
+
+    # Requests per second and burst size of the RESTful API. Zero rate means unlimited.
+    RATE_LIMIT = 0.0
+    RATE_LIMIT_BURST = 1
+
+    # Seconds between the checks of the bars of which the interval has passed
+    BAR_FLUSH_INTERVAL = 1.0
+
     def __init__(self, api_socket, db_client=DatabaseClient()):
         """
         Constructor
@@ -15,6 +30,14 @@ class ExchangeGateway:
         """
         self.db_client = db_client
         self.api_socket = api_socket
+        self.conflation_lock = threading.Lock()
+        self.conflated_instmts = []
+        self.conflation_thread = None
+        self.emit_locks = dict()        # instrument -> lock of recording its conflated L2 depth
+        self.bar_lock = threading.Lock()
+        self.bar_instmts = []
+        self.bar_thread = None
+        self.rate_limiter = TokenBucket(self.RATE_LIMIT, self.RATE_LIMIT_BURST)
 
     @classmethod
     def get_exchange_name(cls):
@@ -33,6 +56,15 @@ class ExchangeGateway:
         """
         return 'exch_' + exchange.lower() + '_' + instmt_name.lower() + '_book'
 
+    @classmethod
+    def get_order_book_delta_table_name(cls, exchange, instmt_name):
+        """
+        Get order book delta table name
+        :param exchange: Exchange name
+        :param instmt_name: Instrument name
+        """
+        return cls.get_order_book_table_name(exchange, instmt_name) + '_delta'
+
     @classmethod
     def get_trades_table_name(cls, exchange, instmt_name):
         """
@@ -42,6 +74,16 @@ class ExchangeGateway:
         """
         return 'exch_' + exchange.lower() + '_' + instmt_name.lower() + '_trades'
 
+    @classmethod
+    def get_bars_table_name(cls, exchange, instmt_name, interval_name):
+        """
+        Get bars table name
+        :param exchange: Exchange name
+        :param instmt_name: Instrument name
+        :param interval_name: Bar interval name
+        """
+        return 'exch_' + exchange.lower() + '_' + instmt_name.lower() + '_bars_' + interval_name.lower()
+
     def get_order_book_init(self, instmt):
         """
         Initialization method in get_order_book
@@ -51,16 +93,59 @@ class ExchangeGateway:
         table_name = self.get_order_book_table_name(instmt.get_exchange_name(),
                                                     instmt.get_instmt_name())
         self.db_client.create(table_name,
-                              ['id'] + L2Depth.columns(),
-                              ['int primary key'] + L2Depth.types())
+                              ['id'] + L2Depth.columns(instmt.get_book_record_depth()),
+                              ['int primary key'] + L2Depth.types(self.db_client.native_timestamp,
+                                                                  instmt.get_book_record_depth()))
         ret = self.db_client.select(table_name,
                                     columns=['id'],
                                     orderby='id desc',
                                     limit=1)
-        if len(ret) > 0:
-            return ret[0][0]
-        else:
-            return 0
+        last_id = ret[0][0] if len(ret) > 0 else 0
+
+        if instmt.get_book_record_mode() == Instrument.RecordMode.DELTA:
+            table_name = self.get_order_book_delta_table_name(instmt.get_exchange_name(),
+                                                              instmt.get_instmt_name())
+            self.db_client.create(table_name,
+                                  ['id'] + L2Depth.delta_columns(),
+                                  ['int primary key'] + L2Depth.delta_types(self.db_client.native_timestamp))
+            ret = self.db_client.select(table_name,
+                                        columns=['id', 'book_id'],
+                                        orderby='id desc',
+                                        limit=1)
+            if len(ret) > 0:
+                instmt.set_order_book_delta_id(ret[0][0])
+                last_id = max(last_id, ret[0][1])
+
+        return last_id
+
+    def get_bars_init(self, instmt):
+        """
+        Initialization method of the bars. Creates the bars tables and sets the
+        last ids to the aggregators.
+        :param instmt: Instrument
+        """
+        for aggregator in instmt.get_bar_aggregators():
+            table_name = self.get_bars_table_name(instmt.get_exchange_name(),
+                                                  instmt.get_instmt_name(),
+                                                  aggregator.name)
+            self.db_client.create(table_name,
+                                  ['id'] + Bar.columns(),
+                                  ['int primary key'] + Bar.types(self.db_client.native_timestamp))
+            ret = self.db_client.select(table_name,
+                                        columns=['id'],
+                                        orderby='id desc',
+                                        limit=1)
+            aggregator.bar_id = ret[0][0] if len(ret) > 0 else 0
+
+        if len(instmt.get_bar_aggregators()) > 0:
+            self.bar_lock.acquire()
+            if instmt not in self.bar_instmts:
+                self.bar_instmts.append(instmt)
+            if self.bar_thread is None:
+                self.bar_thread = threading.Thread(target=self.bar_worker)
+                self.bar_thread.daemon = True
+                self.bar_thread.start()
+            self.bar_lock.release()
 
     def get_trades_init(self, instmt):
         """
@@ -68,11 +153,12 @@ class ExchangeGateway:
         :param instmt: Instrument
         :return: Last id
         """
+        self.get_bars_init(instmt)
         table_name = self.get_trades_table_name(instmt.get_exchange_name(),
                                                 instmt.get_instmt_name())
         self.db_client.create(table_name,
                               ['id'] + Trade.columns(),
-                              ['int primary key'] + Trade.types())
+                              ['int primary key'] + Trade.types(self.db_client.native_timestamp))
         id_ret = self.db_client.select(table=table_name,
                                     columns=['id'],
                                     orderby="id desc",
@@ -87,6 +173,274 @@ class ExchangeGateway:
         else:
             return 0, 0
     
+    def record_order_book(self, instmt):
+        """
+        Record the changed L2 depth of the instrument. If the instrument is conflated,
+        the latest L2 depth is kept and recorded once per book_conflation_ms, or
+        immediately if the best prices are changed.
+        :param instmt: Instrument
+        """
+        if instmt.get_book_conflation_ms() <= 0:
+            instmt.incr_order_book_id()
+            self.insert_order_book(instmt)
+            return
+
+        l2_depth = instmt.get_l2_depth()
+        top = (l2_depth.bids[0].price, l2_depth.asks[0].price)
+        now = Timestamp.now()
+        emit_lock = self.get_emit_lock(instmt)
+        emit_lock.acquire()
+        try:
+            self.conflation_lock.acquire()
+            try:
+                is_emitted = (instmt.is_book_conflation_top() and top != instmt.get_conflation_top()) or \
+                             now - instmt.get_conflation_time() >= instmt.get_book_conflation_ms() * 1000000
+                if is_emitted:
+                    self.take_order_book(instmt, l2_depth, now)
+                else:
+                    if instmt.get_conflated_l2_depth() is not None:
+                        instmt.incr_l2_depth_conflated()
+                    # The L2 depth of the gateway is updated in place
+                    instmt.set_conflated_l2_depth(l2_depth.copy())
+                    if instmt not in self.conflated_instmts:
+                        self.conflated_instmts.append(instmt)
+                    if self.conflation_thread is None:
+                        self.conflation_thread = threading.Thread(target=self.conflation_worker)
+                        self.conflation_thread.daemon = True
+                        self.conflation_thread.start()
+            finally:
+                self.conflation_lock.release()
+
+            # The database is written outside the conflation lock, so that the other
+            # instruments are not blocked
+            if is_emitted:
+                self.insert_order_book(instmt, l2_depth)
+        finally:
+            emit_lock.release()
+
+    def get_emit_lock(self, instmt):
+        """
+        Get the lock which keeps the conflated L2 depths of the instrument recorded
+        in the order of the ids
+        :param instmt: Instrument
+        :return Lock
+        """
+        self.conflation_lock.acquire()
+        lock = self.emit_locks.get(instmt)
+        if lock is None:
+            lock = threading.Lock()
+            self.emit_locks[instmt] = lock
+        self.conflation_lock.release()
+        return lock
+
+    def take_order_book(self, instmt, l2_depth, now):
+        """
+        Assign the next order book id to the L2 depth to be recorded and clear the
+        pending one. The conflation lock must be held.
+        :param instmt: Instrument
+        :param l2_depth: L2Depth object
+        :param now: Current time in nanoseconds since epoch
+        """
+        instmt.set_conflated_l2_depth(None)
+        instmt.set_conflation_time(now)
+        instmt.set_conflation_top((l2_depth.bids[0].price, l2_depth.asks[0].price))
+        instmt.incr_order_book_id()
+
+    def emit_pending_order_book(self, instmt, now):
+        """
+        Record the pending L2 depth of the instrument if its interval is passed
+        without any further update
+        :param instmt: Instrument
+        :param now: Current time in nanoseconds since epoch
+        """
+        emit_lock = self.get_emit_lock(instmt)
+        emit_lock.acquire()
+        try:
+            self.conflation_lock.acquire()
+            try:
+                l2_depth = instmt.get_conflated_l2_depth()
+                if l2_depth is not None and \
+                   now - instmt.get_conflation_time() >= instmt.get_book_conflation_ms() * 1000000:
+                    self.take_order_book(instmt, l2_depth, now)
+                else:
+                    l2_depth = None
+            finally:
+                self.conflation_lock.release()
+
+            if l2_depth is not None:
+                self.insert_order_book(instmt, l2_depth)
+        finally:
+            emit_lock.release()
+
+    def conflation_worker(self):
+        """
+        Conflation thread. Records the pending L2 depth of which the interval is passed
+        without any further update.
+        """
+        while True:
+            self.conflation_lock.acquire()
+            instmts = list(self.conflated_instmts)
+            self.conflation_lock.release()
+            interval = min([e.get_book_conflation_ms() for e in instmts]) if len(instmts) > 0 else 1000
+            time.sleep(interval / 2000.0)
+
+            now = Timestamp.now()
+            for instmt in instmts:
+                try:
+                    self.emit_pending_order_book(instmt, now)
+                except Exception as e:
+                    Logger.error(self.__class__.__name__, "Conflation error: %s" % e)
+
+    def insert_order_book(self, instmt, l2_depth=None):
+        """
+        Insert the L2 depth of the instrument with the current order book id
+        :param instmt: Instrument
+        :param l2_depth: L2Depth object. Defaulted as the L2 depth of the instrument.
+        """
+        if l2_depth is None:
+            l2_depth = instmt.get_l2_depth()
+
+        if instmt.get_book_record_mode() == Instrument.RecordMode.DELTA:
+            self.insert_order_book_delta(instmt, l2_depth)
+            return
+
+        self.db_client.insert(table=instmt.get_order_book_table_name(),
+                              columns=['id'] + L2Depth.columns(instmt.get_book_record_depth()),
+                              values=[instmt.get_order_book_id()] + \
+                                     l2_depth.values(self.db_client.native_timestamp,
+                                                     instmt.get_book_record_depth()))
+
+    def insert_order_book_delta(self, instmt, l2_depth):
+        """
+        Insert the L2 depth of the instrument as a full snapshot for every
+        book_snapshot_interval books, and otherwise as the changed levels since the
+        last inserted book.
+        :param instmt: Instrument
+        :param l2_depth: L2Depth object
+        """
+        levels = l2_depth.get_levels(instmt.get_book_record_depth())
+        prev_levels = instmt.get_order_book_levels()
+        instmt.set_order_book_levels(levels)
+
+        if prev_levels is None or \
+           instmt.get_order_book_id() - instmt.get_order_book_snapshot_id() >= instmt.get_book_snapshot_interval():
+            self.db_client.insert(table=instmt.get_order_book_table_name(),
+                                  columns=['id'] + L2Depth.columns(instmt.get_book_record_depth()),
+                                  values=[instmt.get_order_book_id()] + \
+                                         l2_depth.values(self.db_client.native_timestamp,
+                                                         instmt.get_book_record_depth()))
+            instmt.set_order_book_snapshot_id(instmt.get_order_book_id())
+            return
+
+        table_name = self.get_order_book_delta_table_name(instmt.get_exchange_name(),
+                                                          instmt.get_instmt_name())
+        date_time = l2_depth.timestamp if self.db_client.native_timestamp else Timestamp.format(l2_depth.timestamp)
+        for side, price, volume in L2Depth.diff_levels(levels, prev_levels):
+            instmt.incr_order_book_delta_id()
+            self.db_client.insert(table=table_name,
+                                  columns=['id'] + L2Depth.delta_columns(),
+                                  values=[instmt.get_order_book_delta_id(), instmt.get_order_book_id(),
+                                          date_time, side, price, volume])
+
+    def insert_trade(self, instmt, trade):
+        """
+        Insert the trade with the current trade id of the instrument
+        :param instmt: Instrument
+        :param trade: Trade
+        """
+        self.db_client.insert(table=instmt.get_trades_table_name(),
+                              columns=['id'] + Trade.columns(),
+                              values=[instmt.get_trade_id()] + trade.values(self.db_client.native_timestamp))
+
+        for aggregator in instmt.get_bar_aggregators():
+            aggregator.lock.acquire()
+            try:
+                self.insert_bar(instmt, aggregator, aggregator.update(trade))
+            finally:
+                aggregator.lock.release()
+
+    def insert_bar(self, instmt, aggregator, bar):
+        """
+        Insert the completed bar with the next bar id. The aggregator lock must be held.
+        :param instmt: Instrument
+        :param aggregator: BarAggregator object
+        :param bar: Completed bar, or None
+        """
+        if bar is None:
+            return
+
+        aggregator.bar_id += 1
+        self.db_client.insert(table=self.get_bars_table_name(instmt.get_exchange_name(),
+                                                             instmt.get_instmt_name(),
+                                                             aggregator.name),
+                              columns=['id'] + Bar.columns(),
+                              values=[aggregator.bar_id] + bar.values(self.db_client.native_timestamp))
+
+    def flush_bars(self, instmt, now=None):
+        """
+        Insert the bars of which the interval has passed without a trade of the next interval
+        :param instmt: Instrument
+        :param now: Current time in nanoseconds since epoch. None means inserting the
+                    current bars anyway, e.g. on shutdown.
+        """
+        for aggregator in instmt.get_bar_aggregators():
+            aggregator.lock.acquire()
+            try:
+                self.insert_bar(instmt, aggregator, aggregator.flush(now))
+            finally:
+                aggregator.lock.release()
+
+    def bar_worker(self):
+        """
+        Bar thread. Completes the bars of the illiquid instruments.
+        """
+        while True:
+            time.sleep(self.BAR_FLUSH_INTERVAL)
+            self.bar_lock.acquire()
+            instmts = list(self.bar_instmts)
+            self.bar_lock.release()
+
+            now = Timestamp.now()
+            for instmt in instmts:
+                try:
+                    self.flush_bars(instmt, now)
+                except Exception as e:
+                    Logger.error(self.__class__.__name__, "Bar error: %s" % e)
+
+    def start_poller(self, name, init, poll, interval):
+        """
+        Start a poller in the shared scheduler. The interval is adapted to whether the
+        polling function returns changed data, and the requests are limited by
+        the rate limiter of the exchange.
+        :param name: Name in the log
+        :param init: Initialization function, or None
+        :param poll: Polling function, which returns True if the data is changed
+        :param interval: Initial seconds between the polls
+        :return List of threads
+        """
+        poller = Poller(name, init, poll, AdaptiveInterval(interval), self.rate_limiter)
+        return [ExchangeGateway.scheduler.add_poller(poller)]
+
+    def set_disconnected(self, instmt):
+        """
+        Mark the instrument disconnected from the feed
+        :param instmt: Instrument
+        """
+        instmt.set_subscribed(False)
+        instmt.set_disconnected(Timestamp.now())
+
+    def set_reconnected(self, instmt):
+        """
+        Mark the instrument reconnected to the feed, and log the outage window
+        :param instmt: Instrument
+        """
+        outage = instmt.set_reconnected(Timestamp.now())
+        if outage is not None:
+            Logger.info(self.__class__.__name__, "Instrument %s-%s outage from %s to %s (%.3f seconds)." % \
+                        (instmt.get_exchange_name(), instmt.get_instmt_name(),
+                         Timestamp.format(outage[0]), Timestamp.format(outage[1]),
+                         (outage[1] - outage[0]) / 1e9))
+
     def start(self, instmt):
         """
         Start the exchange gateway
@@ -1,8 +1,32 @@
 from database_client import DatabaseClient
-from util import Logger
+from util import Logger, TimedLock
+from collections import OrderedDict, deque
 import threading
+import operator
+import bisect
+import time
+import json
+import re
+import io
 import os
 import csv
+import gzip
+import bz2
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 class FileClient(DatabaseClient):
     """
@@ -18,13 +42,160 @@ class FileClient(DatabaseClient):
         SMALLER = 5
         SMALLER_OR_EQUAL = 6
 
-    def __init__(self, dir=os.getcwd()):
+        @staticmethod
+        def parse(value):
+            """
+            Decode the operator symbol
+            :param value: Operator symbol
+            :return: Operator
+            """
+            if value == '=' or value == '==':
+                return FileClient.Operator.EQUAL
+            elif value == '!=' or value == '<>':
+                return FileClient.Operator.NOT_EQUAL
+            elif value == '>':
+                return FileClient.Operator.GREATER
+            elif value == '>=':
+                return FileClient.Operator.GREATER_OR_EQUAL
+            elif value == '<':
+                return FileClient.Operator.SMALLER
+            elif value == '<=':
+                return FileClient.Operator.SMALLER_OR_EQUAL
+            else:
+                return FileClient.Operator.UNKNOWN
+
+    # Comparison functions of the operators
+    OPERATOR_FUNCTIONS = {Operator.EQUAL: operator.eq,
+                          Operator.NOT_EQUAL: operator.ne,
+                          Operator.GREATER: operator.gt,
+                          Operator.GREATER_OR_EQUAL: operator.ge,
+                          Operator.SMALLER: operator.lt,
+                          Operator.SMALLER_OR_EQUAL: operator.le}
+
+    # Operator of the swapped operands, i.e. "a < b" is equivalent to "b > a"
+    OPERATOR_SWAPS = {Operator.EQUAL: Operator.EQUAL,
+                      Operator.NOT_EQUAL: Operator.NOT_EQUAL,
+                      Operator.GREATER: Operator.SMALLER,
+                      Operator.GREATER_OR_EQUAL: Operator.SMALLER_OR_EQUAL,
+                      Operator.SMALLER: Operator.GREATER,
+                      Operator.SMALLER_OR_EQUAL: Operator.GREATER_OR_EQUAL}
+
+    # Tokens of the condition: number, quoted string, operator, parenthesis and name
+    CONDITION_TOKEN = re.compile(r"""\s*(?:(-?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)|('(?:[^']|'')*'|"[^"]*")|"""
+                                 r"""(==|!=|<>|<=|>=|=|<|>)|(\(|\))|([A-Za-z_][A-Za-z0-9_]*))""")
+
+    # Buffer size of the opened files
+    BUFFER_SIZE = 65536
+
+    # Column in ascending order of the appended rows. The recorded tables are
+    # written in the increasing order of their id.
+    INDEX_COLUMN = 'id'
+
+    # Block size of reading the file backwards
+    TAIL_BLOCK_SIZE = 8192
+
+    # File extension and open function of the compression methods. lz4 and zstd
+    # are only available if the optional packages are installed, and lzma if
+    # python is built with it.
+    COMPRESSIONS = OrderedDict([('gzip', ('.gz', gzip.open)),
+                                ('bz2', ('.bz2', bz2.open))])
+    if lzma is not None:
+        COMPRESSIONS['lzma'] = ('.xz', lzma.open)
+    if lz4 is not None:
+        COMPRESSIONS['lz4'] = ('.lz4', lz4.frame.open)
+    if zstandard is not None:
+        COMPRESSIONS['zstd'] = ('.zst', zstandard.open)
+
+    class TableIndex(object):
+        """
+        Sparse index of the row offsets in a file, stored in the sidecar file
+        """
+        def __init__(self):
+            """
+            Constructor
+            """
+            self.ids = []               # Id of every N-th row
+            self.offsets = []           # Byte offset of every N-th row
+            self.data_offset = 0        # Byte offset of the first row
+            self.scanned_offset = 0     # Byte offset up to which the file is indexed
+            self.row_count = 0
+            self.min_id = None
+            self.max_id = None
+
+        def to_dict(self):
+            """
+            Convert the index to a dictionary
+            :return Dictionary
+            """
+            return {'ids': self.ids,
+                    'offsets': self.offsets,
+                    'data_offset': self.data_offset,
+                    'scanned_offset': self.scanned_offset,
+                    'row_count': self.row_count,
+                    'min_id': self.min_id,
+                    'max_id': self.max_id}
+
+        @staticmethod
+        def from_dict(d):
+            """
+            Restore the index from a dictionary
+            :param d: Dictionary
+            :return TableIndex object
+            """
+            index = FileClient.TableIndex()
+            index.ids = d['ids']
+            index.offsets = d['offsets']
+            index.data_offset = d['data_offset']
+            index.scanned_offset = d['scanned_offset']
+            index.row_count = d['row_count']
+            index.min_id = d['min_id']
+            index.max_id = d['max_id']
+            return index
+
+    class FileHandle(object):
+        """
+        Opened file and its csv writer
+        """
+        def __init__(self, file_path):
+            """
+            Constructor
+            :param file_path: File path
+            """
+            self.file = open(file_path, "a", buffering=FileClient.BUFFER_SIZE)
+            self.writer = csv.writer(self.file, lineterminator='\n', quotechar='\"', quoting=csv.QUOTE_NONNUMERIC)
+            self.is_dirty = False
+            self.last_flush_time = time.time()
+            self.last_fsync_time = self.last_flush_time
+
+    def __init__(self, dir=os.getcwd(), max_open_files=64, flush_interval=1000, fsync_interval=0,
+                 index_interval=1000):
         """
         Constructor
+        :param dir: File directory
+        :param max_open_files: Maximum number of files kept open. The least recently
+                               written file is closed when the limit is reached.
+        :param flush_interval: Maximum time (in milliseconds) the written rows are kept in
+                               the buffer. Zero means flushing every row.
+        :param fsync_interval: Time (in milliseconds) between fsync calls on the written
+                               files. Zero means no fsync.
+        :param index_interval: Number of rows between two entries of the sidecar index
         """
         DatabaseClient.__init__(self)
-        self.lock = threading.Lock()
+        self.table_locks = dict()       # table -> TimedLock
+        self.table_locks_lock = threading.Lock()
         self.file_mapping = dict()
+        self.file_handles = OrderedDict()   # table -> FileHandle, in least recently used order
+        self.file_handles_lock = threading.Lock()
+        self.max_open_files = max_open_files
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.flush_count = 0
+        self.fsync_count = 0
+        self.evict_count = 0
+        self.index_interval = index_interval
+        self.indexes = dict()           # table -> TableIndex
+        self.flush_event = threading.Event()
+        self.flush_thread = None
 
         if dir is None or dir == '':
             raise Exception("FileClient does not accept empty directory.")
@@ -33,6 +204,11 @@ class FileClient(DatabaseClient):
 
         self.file_directory = dir
 
+        if self.flush_interval > 0:
+            self.flush_thread = threading.Thread(target=self.flush_worker)
+            self.flush_thread.daemon = True
+            self.flush_thread.start()
+
     @staticmethod
     def convert_str(val):
         """
@@ -63,6 +239,142 @@ class FileClient(DatabaseClient):
             return from_str
 
 
+    def get_table_lock(self, table):
+        """
+        Get the lock of the table. Each table is guarded by its own lock so that
+        writes into different files do not block each other.
+        :param table: Table name
+        :return Lock
+        """
+        lock = self.table_locks.get(table)
+        if lock is None:
+            self.table_locks_lock.acquire()
+            lock = self.table_locks.setdefault(table, TimedLock())
+            self.table_locks_lock.release()
+        return lock
+
+    def get_file_handle(self, table):
+        """
+        Get the opened file of the table. The table lock must be held by the caller.
+        :param table: Table name
+        :return FileHandle object. None if the file does not exist.
+        """
+        self.file_handles_lock.acquire()
+        handle = self.file_handles.get(table)
+        if handle is not None:
+            self.file_handles.move_to_end(table)
+        self.file_handles_lock.release()
+
+        if handle is None:
+            file_path = self.file_directory + table + ".csv"
+            if not os.path.isfile(file_path):
+                return None
+
+            handle = FileClient.FileHandle(file_path)
+            self.file_handles_lock.acquire()
+            self.file_handles[table] = handle
+            if len(self.file_handles) > self.max_open_files:
+                self.evict_file_handles(table)
+            self.file_handles_lock.release()
+
+        return handle
+
+    def evict_file_handles(self, table):
+        """
+        Close the least recently used files until the number of opened files is within
+        the limit. The files being written by other threads are skipped. The lock of the
+        file handles must be held by the caller.
+        :param table: Table name which must not be evicted
+        """
+        for victim in list(self.file_handles.keys()):
+            if len(self.file_handles) <= self.max_open_files:
+                break
+            elif victim == table:
+                continue
+
+            lock = self.get_table_lock(victim)
+            if lock.acquire(blocking=False):
+                handle = self.file_handles.pop(victim)
+                handle.file.close()
+                self.evict_count += 1
+                lock.release()
+
+    def flush_file_handle(self, handle, is_fsync=False):
+        """
+        Flush the file buffer. The table lock must be held by the caller.
+        :param handle: FileHandle object
+        :param is_fsync: Indicate if the file is synchronised to the disk
+        """
+        now = time.time()
+        if handle.is_dirty:
+            handle.file.flush()
+            handle.is_dirty = False
+            handle.last_flush_time = now
+            self.flush_count += 1
+
+        if is_fsync:
+            os.fsync(handle.file.fileno())
+            handle.last_fsync_time = now
+            self.fsync_count += 1
+
+    def flush_table(self, table, is_fsync=False):
+        """
+        Flush the written rows of the table. The table lock must be held by the caller.
+        :param table: Table name
+        :param is_fsync: Indicate if the file is synchronised to the disk
+        """
+        handle = self.file_handles.get(table)
+        if handle is not None:
+            self.flush_file_handle(handle, is_fsync)
+
+    def flush_worker(self):
+        """
+        Flush the opened files when the flush interval is reached
+        """
+        while not self.flush_event.wait(self.flush_interval / 1000.0):
+            now = time.time()
+            self.file_handles_lock.acquire()
+            handles = list(self.file_handles.items())
+            self.file_handles_lock.release()
+            for table, handle in handles:
+                is_fsync = self.fsync_interval > 0 and \
+                           (now - handle.last_fsync_time) * 1000 >= self.fsync_interval
+                if not handle.is_dirty and not is_fsync:
+                    continue
+
+                lock = self.get_table_lock(table)
+                lock.acquire()
+                if self.file_handles.get(table) is handle:
+                    self.flush_file_handle(handle, is_fsync)
+                lock.release()
+
+    def flush(self):
+        """
+        Flush the written rows of all the tables
+        :return True if the rows are flushed
+        """
+        self.file_handles_lock.acquire()
+        tables = list(self.file_handles.keys())
+        self.file_handles_lock.release()
+        for table in tables:
+            lock = self.get_table_lock(table)
+            lock.acquire()
+            self.flush_table(table, self.fsync_interval > 0)
+            lock.release()
+        return True
+
+    def get_stats(self):
+        """
+        Get the statistics of the opened files and the table locks
+        :return Dictionary of statistics
+        """
+        return {'open_files': len(self.file_handles),
+                'flush_count': self.flush_count,
+                'fsync_count': self.fsync_count,
+                'evict_count': self.evict_count,
+                'table_locks': dict([(table, lock.get_stats()) \
+                                     for table, lock in list(self.table_locks.items())])}
+
     def create(self, table, columns, types, is_ifnotexists=True):
         """
         Create table in the database
@@ -76,14 +388,15 @@ class FileClient(DatabaseClient):
         if len(columns) != len(types):
             return False
 
-        self.lock.acquire()
+        lock = self.get_table_lock(table)
+        lock.acquire()
         if os.path.isfile(file_path):
             Logger.info(self.__class__.__name__, "File (%s) has been created already." % file_path)
         else:
             with open(file_path, 'w+') as csvfile:
                 csvfile.write(','.join(["\"" + e + "\"" for e in columns])+'\n')
 
-        self.lock.release()
+        lock.release()
         return True
 
     def insert(self, table, columns, values, is_orreplace=False):
@@ -99,98 +412,543 @@ class FileClient(DatabaseClient):
         if len(columns) != len(values):
             return False
 
-        self.lock.acquire()
-        if not os.path.isfile(file_path):
+        lock = self.get_table_lock(table)
+        lock.acquire()
+        handle = self.get_file_handle(table)
+        if handle is None:
             ret = False
         else:
-            with open(file_path, "a+") as csvfile:
-                writer = csv.writer(csvfile, lineterminator='\n', quotechar='\"', quoting=csv.QUOTE_NONNUMERIC)
-                writer.writerow(values)
-        self.lock.release()
+            handle.writer.writerow(values)
+            handle.is_dirty = True
+            if self.flush_interval == 0:
+                now = time.time()
+                self.flush_file_handle(handle,
+                                       self.fsync_interval > 0 and \
+                                       (now - handle.last_fsync_time) * 1000 >= self.fsync_interval)
+        lock.release()
 
         if not ret:
             raise Exception("File (%s) has not been created.")
 
         return True
 
-    def select(self, table, columns=['*'], condition='', orderby='', limit=0, isFetchAll=True):
+    @staticmethod
+    def csv_reader(lines):
         """
-        Select rows from the table.
-        Currently the method only processes the one column ordering and condition
+        Create the csv reader in the format written by the client
+        :param lines: File or iterable of lines
+        :return csv reader
+        """
+        return csv.reader(lines, lineterminator='\n', quotechar='\"', quoting=csv.QUOTE_NONNUMERIC)
+
+    @staticmethod
+    def read_last_rows(f, n, end_offset):
+        """
+        Read the last rows of the file by seeking backwards from the end offset, so
+        the rows written after the offset are not read
+        :param f: File opened in binary mode
+        :param n: Number of rows
+        :param end_offset: Byte offset where the reading stops
+        :return Rows in the reverse order
+        """
+        pos = end_offset
+        data = b''
+        while pos > 0 and data.count(b'\n') <= n:
+            step = min(FileClient.TAIL_BLOCK_SIZE, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+
+        # Remove the header, or the partial line at the beginning of the block,
+        # and the partial line at the end
+        lines = data.split(b'\n')[1:-1]
+        lines = [line for line in lines if len(line) > 0][-n:]
+        lines.reverse()
+        reader = FileClient.csv_reader(io.TextIOWrapper(io.BytesIO(b'\n'.join(lines)), newline=''))
+        return [list(row) for row in reader]
+
+    @staticmethod
+    def tokenize_condition(condition):
+        """
+        Split the condition into tokens
+        :param condition: Where condition
+        :return List of (token type, token) tuples. The type is one of "value",
+                "operator", "parenthesis", "and", "or" and "field".
+        """
+        tokens = []
+        pos = 0
+        condition = condition.rstrip()
+        while pos < len(condition):
+            m = FileClient.CONDITION_TOKEN.match(condition, pos)
+            if m is None or m.end() == pos:
+                raise Exception("Incorrect condition in select statement (%s)." % condition)
+            pos = m.end()
+            number, string, op, parenthesis, name = m.groups()
+            if number is not None:
+                is_float = '.' in number or 'e' in number or 'E' in number
+                tokens.append(('value', float(number) if is_float else int(number)))
+            elif string is not None:
+                tokens.append(('value', string[1:-1].replace("''", "'")))
+            elif op is not None:
+                tokens.append(('operator', FileClient.Operator.parse(op)))
+            elif parenthesis is not None:
+                tokens.append(('parenthesis', parenthesis))
+            elif name.lower() == 'and' or name.lower() == 'or':
+                tokens.append((name.lower(), name))
+            else:
+                tokens.append(('field', name))
+
+        return tokens
+
+    @staticmethod
+    def parse_condition(condition):
+        """
+        Parse the condition into a tree. Supports comparisons (=, !=, <, <=, >, >=)
+        between fields and constants combined by "and", "or" and parentheses.
+        :param condition: Where condition
+        :return Tree of tuples ("or", [nodes]), ("and", [nodes]) and
+                ("compare", operator, operand, operand), where an operand is
+                ("field", name) or ("value", constant). None if the condition is empty.
+        """
+        tokens = FileClient.tokenize_condition(condition)
+        if len(tokens) == 0:
+            return None
+
+        pos = [0]
+
+        def peek():
+            return tokens[pos[0]] if pos[0] < len(tokens) else (None, None)
+
+        def take(token_type):
+            token = peek()
+            if token[0] != token_type:
+                raise Exception("Incorrect condition in select statement (%s)." % condition)
+            pos[0] += 1
+            return token
+
+        def parse_or():
+            nodes = [parse_and()]
+            while peek()[0] == 'or':
+                take('or')
+                nodes.append(parse_and())
+            return nodes[0] if len(nodes) == 1 else ('or', nodes)
+
+        def parse_and():
+            nodes = [parse_atom()]
+            while peek()[0] == 'and':
+                take('and')
+                nodes.append(parse_atom())
+            return nodes[0] if len(nodes) == 1 else ('and', nodes)
+
+        def parse_operand():
+            token = peek()
+            if token[0] != 'field' and token[0] != 'value':
+                raise Exception("Incorrect condition in select statement (%s)." % condition)
+            pos[0] += 1
+            return token
+
+        def parse_atom():
+            if peek() == ('parenthesis', '('):
+                take('parenthesis')
+                node = parse_or()
+                if take('parenthesis')[1] != ')':
+                    raise Exception("Incorrect condition in select statement (%s)." % condition)
+                return node
+
+            lhs = parse_operand()
+            op = take('operator')[1]
+            if op == FileClient.Operator.UNKNOWN:
+                raise Exception("Incorrect condition in select statement (%s)." % condition)
+            rhs = parse_operand()
+            return ('compare', op, lhs, rhs)
+
+        tree = parse_or()
+        if pos[0] != len(tokens):
+            raise Exception("Incorrect condition in select statement (%s)." % condition)
+        return tree
+
+    @staticmethod
+    def compile_condition(tree, field_names):
+        """
+        Compile the condition tree into a predicate over the row values
+        :param tree: Condition tree from parse_condition
+        :param field_names: Field names of the table
+        :return Function which takes the row and returns True if it is selected
+        """
+        if tree is None:
+            return lambda row: True
+
+        if tree[0] == 'or':
+            predicates = [FileClient.compile_condition(e, field_names) for e in tree[1]]
+            if len(predicates) == 2:
+                p1, p2 = predicates
+                return lambda row: p1(row) or p2(row)
+            return lambda row: any(p(row) for p in predicates)
+        elif tree[0] == 'and':
+            predicates = [FileClient.compile_condition(e, field_names) for e in tree[1]]
+            if len(predicates) == 2:
+                p1, p2 = predicates
+                return lambda row: p1(row) and p2(row)
+            return lambda row: all(p(row) for p in predicates)
+
+        op, lhs, rhs = tree[1], tree[2], tree[3]
+        for operand in (lhs, rhs):
+            if operand[0] == 'field' and operand[1] not in field_names:
+                raise Exception("Field (%s) is not in the table." % operand[1])
+
+        if lhs[0] == 'value' and rhs[0] == 'field':
+            op = FileClient.OPERATOR_SWAPS[op]
+            lhs, rhs = rhs, lhs
+
+        func = FileClient.OPERATOR_FUNCTIONS[op]
+        is_ordering = op != FileClient.Operator.EQUAL and op != FileClient.Operator.NOT_EQUAL
+
+        if lhs[0] == 'value':
+            # Constant expression
+            try:
+                ret = func(lhs[1], rhs[1])
+            except TypeError:
+                ret = False
+            return lambda row: ret
+        elif rhs[0] == 'value':
+            i = field_names.index(lhs[1])
+            value = rhs[1]
+            if not is_ordering:
+                return lambda row: func(row[i], value)
+
+            def compare(row):
+                try:
+                    return func(row[i], value)
+                except TypeError:
+                    # Comparing string with number
+                    return False
+            return compare
+        else:
+            i = field_names.index(lhs[1])
+            j = field_names.index(rhs[1])
+            if not is_ordering:
+                return lambda row: func(row[i], row[j])
+
+            def compare(row):
+                try:
+                    return func(row[i], row[j])
+                except TypeError:
+                    return False
+            return compare
+
+    @staticmethod
+    def get_id_range(tree):
+        """
+        Get the range of the index column from the condition. Only the comparisons
+        between the index column and numbers at the top level conjunction are used.
+        :param tree: Condition tree from parse_condition
+        :return Lower bound and upper bound. None if it is not bounded.
+        """
+        lower = None
+        upper = None
+        if tree is None:
+            return lower, upper
+
+        nodes = tree[1] if tree[0] == 'and' else [tree]
+        for node in nodes:
+            if node[0] != 'compare':
+                continue
+
+            op, lhs, rhs = node[1], node[2], node[3]
+            if lhs[0] == 'value' and rhs[0] == 'field':
+                op = FileClient.OPERATOR_SWAPS[op]
+                lhs, rhs = rhs, lhs
+
+            if lhs != ('field', FileClient.INDEX_COLUMN) or rhs[0] != 'value' or \
+               isinstance(rhs[1], str):
+                continue
+
+            value = rhs[1]
+            if op in (FileClient.Operator.GREATER, FileClient.Operator.GREATER_OR_EQUAL,
+                      FileClient.Operator.EQUAL):
+                lower = value if lower is None else max(lower, value)
+            if op in (FileClient.Operator.SMALLER, FileClient.Operator.SMALLER_OR_EQUAL,
+                      FileClient.Operator.EQUAL):
+                upper = value if upper is None else min(upper, value)
+
+        return lower, upper
+
+    def get_index_path(self, table):
+        """
+        Get the sidecar index file path
+        :param table: Table name
+        :return File path
+        """
+        return self.file_directory + table + ".csv.idx"
+
+    def update_index(self, table, id_index):
+        """
+        Extend the sidecar index with the rows appended since the last update.
+        The table lock must be held by the caller.
+        :param table: Table name
+        :param id_index: Position of the index column
+        :return TableIndex object
+        """
+        file_path = self.file_directory + table + ".csv"
+        index_path = self.get_index_path(table)
+        file_size = os.path.getsize(file_path)
+        index = self.indexes.get(table)
+        if index is None and os.path.isfile(index_path):
+            with open(index_path, 'r') as f:
+                index = FileClient.TableIndex.from_dict(json.load(f))
+
+        if index is None or index.scanned_offset > file_size:
+            # Build the index from scratch
+            index = FileClient.TableIndex()
+
+        if index.scanned_offset < file_size:
+            with open(file_path, 'rb') as f:
+                if index.scanned_offset == 0:
+                    index.data_offset = len(f.readline())
+                    index.scanned_offset = index.data_offset
+                f.seek(index.scanned_offset)
+                offset = index.scanned_offset
+                for line in f:
+                    if line[-1:] != b'\n':
+                        # Incomplete row
+                        break
+
+                    if index.row_count % self.index_interval == 0:
+                        row = next(FileClient.csv_reader([line.decode()]))
+                        index.ids.append(row[id_index])
+                        index.offsets.append(offset)
+
+                    offset += len(line)
+                    index.row_count += 1
+
+                index.scanned_offset = offset
+
+            if index.row_count > 0:
+                index.min_id = index.ids[0]
+                with open(file_path, 'rb') as f:
+                    index.max_id = FileClient.read_last_rows(f, 1, index.scanned_offset)[0][id_index]
+
+            with open(index_path, 'w') as f:
+                json.dump(index.to_dict(), f)
+
+        self.indexes[table] = index
+        return index
+
+    @staticmethod
+    def read_lines(f, end_offset):
+        """
+        Read the lines of the binary file up to the offset
+        :param f: File opened in binary mode
+        :param end_offset: Byte offset where the reading stops
+        :return Generator of decoded lines
+        """
+        offset = f.tell()
+        for line in f:
+            offset += len(line)
+            if offset > end_offset:
+                break
+            yield line.decode()
+
+    def iter_select(self, table, columns=['*'], condition='', orderby='', limit=0,
+                    chunk_size=1000, is_chunked=False):
+        """
+        Select rows from the table lazily.
+        Currently the method only processes the one column ordering and condition.
+        Rows are streamed from the file if there is no ordering or the ordering is
+        the index column in ascending order. The last rows ordered by the index
+        column in descending order are read from the end of the file, and the range
+        conditions on the index column seek through the sidecar index. Other
+        orderings are sorted in memory.
         :param table: Table name
         :param columns: Selected columns
         :param condition: Where condition
         :param orderby: Order by condition
         :param limit: Rows limit
-        :param isFetchAll: Indicator of fetching all
-        :return Result rows
+        :param chunk_size: Number of rows yielded at a time if is_chunked is True
+        :param is_chunked: Yield lists of rows instead of single rows
+        :return Generator of rows, or lists of rows if is_chunked is True
         """
         file_path = self.file_directory + table + ".csv"
         is_all_columns = len(columns) == 1 and columns[0] == '*'
         csv_field_names = []
         columns = [e.split(' ')[0] for e in columns]
-        ret = []
-        is_error = False
-
-        # Preparing condition
-        if condition != '':
-            condition = condition.replace('=', '==')
-            condition = condition.replace('!==', '!=')
-            condition = condition.replace('>==', '>=')
-            condition = condition.replace('<==', '<=')
-
-        self.lock.acquire()
-        if not os.path.isfile(file_path):
-            is_error = True
-        else:
-            with open(file_path, "r") as csvfile:
-                reader = csv.reader(csvfile, lineterminator='\n', quotechar='\"', quoting=csv.QUOTE_NONNUMERIC)
-                csv_field_names = next(reader, None)
-                for col in columns:
-                    if not is_all_columns and col not in csv_field_names:
-                        raise Exception("Field (%s) is not in the table." % col)
-
-                for csv_row in reader:
-                    # Filter by condition statement
-                    is_selected = True
-                    if condition != '':
-                        condition_eval = condition
-                        for i in range(0, len(csv_field_names)):
-                            key = csv_field_names[i]
-                            value = csv_row[i]
-                            if condition_eval.find(key) > -1:
-                                condition_eval = condition_eval.replace(key, str(value))
-                        is_selected = eval(condition_eval)
-
-                    if is_selected:
-                        ret.append(list(csv_row))
-
-        self.lock.release()
-
-        if is_error:
-            raise Exception("File (%s) has not been created.")
+        tree = FileClient.parse_condition(condition)
+        lower, upper = FileClient.get_id_range(tree)
+        offset = 0
+        end_offset = 0
 
+        field = ''
+        asc_val = 'asc'
         if orderby != '':
-            # Sort the result
             field = orderby.split(' ')[0].strip()
             asc_val = orderby.split(' ')[1].strip() if len(orderby.split(' ')) > 1 else 'asc'
             if asc_val != 'asc' and asc_val != 'desc':
                 raise Exception("Incorrect orderby in select statement (%s)." % orderby)
-            elif field not in csv_field_names:
-                raise Exception("Field (%s) is not in the table." % col)
 
-            field_index = csv_field_names.index(field)
-            ret = sorted(ret, key=lambda x:x[field_index], reverse=(asc_val == 'desc'))
+        compressed_path = None
+        opener = None
+        f = None
+
+        lock = self.get_table_lock(table)
+        lock.acquire()
+        try:
+            self.flush_table(table)
+            if not os.path.isfile(file_path):
+                compressed_path, opener = self.get_compressed_file(table)
+                if compressed_path is None:
+                    raise Exception("File (%s) has not been created." % file_path)
+                file_path = compressed_path
+
+            # The file is opened under the table lock, so that it is still readable
+            # if the table is compressed and the file is removed during the scan.
+            # The rows appended after this point are not selected.
+            if compressed_path is None:
+                f = open(file_path, "rb")
+                end_offset = os.fstat(f.fileno()).st_size
+                csv_field_names = next(FileClient.csv_reader([f.readline().decode()]), None)
+            else:
+                f = opener(file_path, "rt")
+                csv_field_names = next(FileClient.csv_reader(f), None)
+            for col in columns:
+                if not is_all_columns and col not in csv_field_names:
+                    raise Exception("Field (%s) is not in the table." % col)
+            if field != '' and field not in csv_field_names:
+                raise Exception("Field (%s) is not in the table." % field)
+            predicate = FileClient.compile_condition(tree, csv_field_names)
+
+            if FileClient.INDEX_COLUMN in csv_field_names:
+                id_index = csv_field_names.index(FileClient.INDEX_COLUMN)
+            else:
+                id_index = -1
+
+            if compressed_path is not None:
+                # Compressed files are not indexed but the rows are still in order
+                pass
+            elif id_index >= 0 and (lower is not None or upper is not None):
+                index = self.update_index(table, id_index)
+                if lower is not None and len(index.ids) > 0:
+                    i = bisect.bisect_right(index.ids, lower) - 1
+                    offset = index.offsets[i] if i >= 0 else index.data_offset
+                if (upper is not None and index.min_id is not None and upper < index.min_id) or \
+                   (lower is not None and index.max_id is not None and lower > index.max_id):
+                    offset = -1
+            if id_index < 0:
+                upper = None
+        except Exception:
+            if f is not None:
+                f.close()
+            raise
+        finally:
+            lock.release()
+
+        try:
+            if is_all_columns:
+                project = None
+            else:
+                field_index = [csv_field_names.index(x) for x in columns]
+                project = lambda row: [row[i] for i in field_index]
+
+            is_tail = tree is None and field == FileClient.INDEX_COLUMN and asc_val == 'desc' and limit > 0
+            if is_tail and compressed_path is None:
+                # Last rows
+                rows = iter(FileClient.read_last_rows(f, limit, end_offset))
+            elif is_tail:
+                # Compressed file cannot be read backwards
+                rows = iter(reversed(deque(FileClient.scan_compressed_rows(f, predicate),
+                                           maxlen=limit)))
+            elif offset < 0:
+                rows = iter([])
+            else:
+                if compressed_path is None:
+                    rows = self.scan_rows(f, offset, end_offset, predicate,
+                                          id_index if upper is not None else -1, upper)
+                else:
+                    rows = self.scan_compressed_rows(f, predicate,
+                                                     id_index if upper is not None else -1, upper)
+                if field != '' and not (field == FileClient.INDEX_COLUMN and asc_val == 'asc'):
+                    # Sort the result
+                    field_index_sort = csv_field_names.index(field)
+                    rows = iter(sorted(rows, key=lambda x:x[field_index_sort], reverse=(asc_val == 'desc')))
 
-        if limit > 0:
-            # Trim the result by the limit
-            ret = ret[:limit]
+            chunk = []
+            count = 0
+            for row in rows:
+                if project is not None:
+                    row = project(row)
+                if is_chunked:
+                    chunk.append(row)
+                    if len(chunk) >= chunk_size:
+                        yield chunk
+                        chunk = []
+                else:
+                    yield row
 
-        if not is_all_columns:
-            field_index = [csv_field_names.index(x) for x in columns]
-            ret = [[row[i] for i in field_index] for row in ret]
+                count += 1
+                if limit > 0 and count >= limit:
+                    # Trim the result by the limit
+                    break
 
-        return ret
+            if is_chunked and len(chunk) > 0:
+                yield chunk
+        finally:
+            f.close()
+
+    @staticmethod
+    def scan_rows(f, offset, end_offset, predicate, id_index=-1, upper=None):
+        """
+        Scan the rows of the file
+        :param f: File opened in binary mode
+        :param offset: Byte offset of the first row. Zero means the beginning of the file.
+        :param end_offset: Byte offset where the scan stops
+        :param predicate: Function which returns True if the row is selected
+        :param id_index: Position of the index column. Negative if the scan is not bounded.
+        :param upper: Upper bound of the index column
+        :return Generator of rows
+        """
+        f.seek(offset)
+        reader = FileClient.csv_reader(FileClient.read_lines(f, end_offset))
+        if offset == 0:
+            next(reader, None)
+
+        for csv_row in reader:
+            if id_index >= 0 and csv_row[id_index] > upper:
+                # Rows are in ascending order of the index column
+                break
+
+            # Filter by condition statement
+            if predicate(csv_row):
+                yield csv_row
+
+    @staticmethod
+    def scan_compressed_rows(f, predicate, id_index=-1, upper=None):
+        """
+        Scan the rows of the compressed file after the header
+        :param f: File opened in text mode by the open function of the compression method
+        :param predicate: Function which returns True if the row is selected
+        :param id_index: Position of the index column. Negative if the scan is not bounded.
+        :param upper: Upper bound of the index column
+        :return Generator of rows
+        """
+        for csv_row in FileClient.csv_reader(f):
+            if id_index >= 0 and csv_row[id_index] > upper:
+                break
+
+            if predicate(csv_row):
+                yield csv_row
+
+    def select(self, table, columns=['*'], condition='', orderby='', limit=0, isFetchAll=True):
+        """
+        Select rows from the table.
+        Currently the method only processes the one column ordering and condition
+        :param table: Table name
+        :param columns: Selected columns
+        :param condition: Where condition
+        :param orderby: Order by condition
+        :param limit: Rows limit
+        :param isFetchAll: Indicator of fetching all
+        :return Result rows
+        """
+        return list(self.iter_select(table, columns, condition, orderby, limit))
 
     def delete(self, table, condition='1==1'):
         """
@@ -200,3 +958,93 @@ class FileClient(DatabaseClient):
         """
         raise Exception("Deletion is not supported in file client.")
 
+    def get_compressed_file(self, table):
+        """
+        Find the compressed file of the table
+        :param table: Table name
+        :return File path and open function. None if the file is not compressed.
+        """
+        for ext, opener in FileClient.COMPRESSIONS.values():
+            file_path = self.file_directory + table + ".csv" + ext
+            if os.path.isfile(file_path):
+                return file_path, opener
+        return None, None
+
+    def list_tables(self):
+        """
+        List the tables in the database
+        :return List of table names
+        """
+        directory, prefix = os.path.split(self.file_directory)
+        ret = set()
+        exts = [".csv"] + [".csv" + ext for ext, opener in FileClient.COMPRESSIONS.values()]
+        for name in os.listdir(directory if directory != '' else os.curdir):
+            if not name.startswith(prefix):
+                continue
+            for ext in exts:
+                if name.endswith(ext):
+                    ret.add(name[len(prefix):-len(ext)])
+        return sorted(ret)
+
+    def compress(self, table, method='gzip'):
+        """
+        Compress the table file. The compressed table is read only.
+        :param table: Table name
+        :param method: Compression method, i.e. gzip, bz2, lzma, lz4 or zstd
+        :return True if the table is compressed
+        """
+        if method not in FileClient.COMPRESSIONS:
+            raise Exception("Compression method (%s) is not supported." % method)
+
+        ext, opener = FileClient.COMPRESSIONS[method]
+        file_path = self.file_directory + table + ".csv"
+        lock = self.get_table_lock(table)
+        lock.acquire()
+        try:
+            self.file_handles_lock.acquire()
+            handle = self.file_handles.pop(table, None)
+            self.file_handles_lock.release()
+            if handle is not None:
+                self.flush_file_handle(handle, self.fsync_interval > 0)
+                handle.file.close()
+
+            if not os.path.isfile(file_path):
+                return False
+
+            with open(file_path, 'rb') as src:
+                with opener(file_path + ext + ".tmp", 'wb') as dst:
+                    while True:
+                        block = src.read(FileClient.BUFFER_SIZE)
+                        if len(block) == 0:
+                            break
+                        dst.write(block)
+            os.replace(file_path + ext + ".tmp", file_path + ext)
+            os.remove(file_path)
+            if os.path.isfile(self.get_index_path(table)):
+                os.remove(self.get_index_path(table))
+            self.indexes.pop(table, None)
+        finally:
+            lock.release()
+
+        return True
+
+    def close(self):
+        """
+        Flush and close all the opened files
+        """
+        self.flush_event.set()
+        self.file_handles_lock.acquire()
+        tables = list(self.file_handles.keys())
+        self.file_handles_lock.release()
+        for table in tables:
+            lock = self.get_table_lock(table)
+            lock.acquire()
+            self.file_handles_lock.acquire()
+            handle = self.file_handles.pop(table, None)
+            self.file_handles_lock.release()
+            if handle is not None:
+                self.flush_file_handle(handle, self.fsync_interval > 0)
+                handle.file.close()
+            lock.release()
+        return True
+
@@ -0,0 +1,332 @@
+#!/bin/python
+
+import http.client
+import socket
+import threading
+import time
+import gzip
+import ssl
+import base64
+from urllib.parse import urlsplit, unquote
+from urllib.request import getproxies, proxy_bypass
+
+class HttpStatusError(Exception):
+    """
+    Error of the response status other than 2xx
+    """
+    def __init__(self, status, reason, url, retry_after=0.0):
+        """
+        Constructor
+        :param status: Response status
+        :param reason: Response reason
+        :param url: Url link
+        :param retry_after: Seconds in the Retry-After header, e.g. of the status 429 or 503
+        """
+        Exception.__init__(self, "HTTP status %d %s (%s)" % (status, reason, url))
+        self.status = status
+        self.reason = reason
+        self.url = url
+        self.retry_after = retry_after
+
+
+class TimedHTTPConnection(http.client.HTTPConnection):
+    """
+    HTTP connection which measures the DNS lookup and the connect time
+    """
+    def connect(self):
+        """
+        Resolve the host and connect. Through a proxy set by set_tunnel, the host
+        is the proxy and the tunnel to the target host is opened after connecting.
+        """
+        start_time = time.time()
+        family, socktype, proto, canonname, address = \
+            socket.getaddrinfo(self.host, self.port, 0, socket.SOCK_STREAM)[0]
+        self.dns_time = time.time() - start_time
+        start_time = time.time()
+        self.sock = socket.create_connection(address[0:2], self.timeout, self.source_address)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self._tunnel_host:
+            self._tunnel()
+        self.connect_time = time.time() - start_time
+
+
+class TimedHTTPSConnection(http.client.HTTPSConnection):
+    """
+    HTTPS connection which measures the DNS lookup and the connect time. The
+    connect time includes the TLS handshake.
+    """
+    def __init__(self, host, port=None, context=None, **kwargs):
+        """
+        Constructor
+        :param host: Host and optional port
+        :param port: Port
+        :param context: SSL context. Defaulted as the default context.
+        """
+        if context is None:
+            context = ssl.create_default_context()
+        http.client.HTTPSConnection.__init__(self, host, port, context=context, **kwargs)
+        self.ssl_context = context
+
+    def connect(self):
+        """
+        Resolve the host, connect and wrap the socket in TLS
+        """
+        TimedHTTPConnection.connect(self)
+        start_time = time.time()
+        # Through a proxy the certificate is of the tunnelled host
+        server_hostname = self._tunnel_host if self._tunnel_host else self.host
+        self.sock = self.ssl_context.wrap_socket(self.sock, server_hostname=server_hostname)
+        self.connect_time += time.time() - start_time
+
+
+class HttpConnectionPool(object):
+    """
+    Pool of the persistent HTTP connections per host. A connection is taken from
+    the pool for a request and put back after the response body is read, so the
+    TCP and TLS handshakes are only paid by the first requests. The responses are
+    requested in gzip.
+    The https requests go through a proxy by a CONNECT tunnel, and the http
+    requests are forwarded by the proxy.
+    """
+    # Errors of a connection closed by the server while it is idle in the pool
+    STALE_ERRORS = (http.client.BadStatusLine, http.client.CannotSendRequest,
+                    ConnectionResetError, BrokenPipeError, ConnectionAbortedError)
+
+    def __init__(self, timeout=10.0, max_idle=4, proxies=None):
+        """
+        Constructor
+        :param timeout: Socket timeout in seconds
+        :param max_idle: Maximum number of the idle connections per host
+        :param proxies: Dictionary of scheme to proxy url, e.g. {'https': 'http://proxy:3128'}.
+                        Defaulted as the proxies of the environment, i.e. HTTP_PROXY,
+                        HTTPS_PROXY and NO_PROXY.
+        """
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.proxies = proxies
+        self.idle = dict()          # (scheme, host) -> list of connections
+        self.stats = dict()         # (scheme, host) -> statistics
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def get_connection(self, scheme, host):
+        """
+        Get an idle connection or create a new one
+        :param scheme: http or https
+        :param host: Host and optional port
+        :return Connection and True if it is reused
+        """
+        self.lock.acquire()
+        try:
+            conns = self.idle.get((scheme, host))
+            if conns:
+                return conns.pop(), True
+        finally:
+            self.lock.release()
+
+        return self.new_connection(scheme, host), False
+
+    def get_proxy(self, scheme, host):
+        """
+        Get the proxy of the host
+        :param scheme: http or https
+        :param host: Host and optional port
+        :return Proxy host and port, and the Proxy-Authorization header value. The
+                proxy is None if the host is connected directly, and the header value
+                is None if the proxy has no credentials.
+        """
+        if self.proxies is None:
+            if proxy_bypass(host):
+                return None, None
+            proxy = getproxies().get(scheme)
+        else:
+            proxy = self.proxies.get(scheme)
+        if not proxy:
+            return None, None
+
+        parts = urlsplit(proxy if '://' in proxy else 'http://' + proxy)
+        proxy_host = parts.netloc.rsplit('@', 1)[-1]
+        if parts.port is None:
+            proxy_host += ':80'
+        auth = None
+        if parts.username is not None:
+            credentials = '%s:%s' % (unquote(parts.username), unquote(parts.password or ''))
+            auth = 'Basic ' + base64.b64encode(credentials.encode('utf8')).decode('ascii')
+        return proxy_host, auth
+
+    def new_connection(self, scheme, host):
+        """
+        Create a connection. It is connected on the first request.
+        :param scheme: http or https
+        :param host: Host and optional port
+        :return Connection
+        """
+        proxy, auth = self.get_proxy(scheme, host)
+        proxy_headers = {'Proxy-Authorization': auth} if auth is not None else {}
+        conn_host = proxy if proxy is not None else host
+        if scheme == 'https':
+            conn = TimedHTTPSConnection(conn_host, timeout=self.timeout)
+            if proxy is not None:
+                conn.set_tunnel(host, headers=proxy_headers)
+            conn.request_prefix = ''
+            conn.proxy_headers = {}
+        else:
+            conn = TimedHTTPConnection(conn_host, timeout=self.timeout)
+            # The forwarding proxy takes the absolute url
+            conn.request_prefix = scheme + '://' + host if proxy is not None else ''
+            conn.proxy_headers = proxy_headers
+        conn.dns_time = 0.0
+        conn.connect_time = 0.0
+        return conn
+
+    def release_connection(self, scheme, host, conn):
+        """
+        Put the connection back to the pool
+        :param scheme: http or https
+        :param host: Host and optional port
+        :param conn: Connection
+        """
+        self.lock.acquire()
+        try:
+            conns = self.idle.setdefault((scheme, host), [])
+            if len(conns) < self.max_idle:
+                conns.append(conn)
+                conn = None
+        finally:
+            self.lock.release()
+
+        if conn is not None:
+            conn.close()
+
+    def request(self, url, headers=None):
+        """
+        Send a GET request
+        :param url: Url link
+        :param headers: Additional headers
+        :return Response body in bytes
+        """
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        host = parts.netloc
+        path = parts.path if parts.path != '' else '/'
+        if parts.query != '':
+            path += '?' + parts.query
+        request_headers = {'Accept-Encoding': 'gzip', 'Connection': 'keep-alive'}
+        if headers is not None:
+            request_headers.update(headers)
+
+        conn, is_reused = self.get_connection(scheme, host)
+        try:
+            try:
+                response, body, timing = self.send(conn, path, request_headers)
+            except HttpConnectionPool.STALE_ERRORS:
+                if not is_reused:
+                    raise
+                # The idle connection is closed by the server. Retry with a new one.
+                conn.close()
+                conn = self.new_connection(scheme, host)
+                is_reused = False
+                response, body, timing = self.send(conn, path, request_headers)
+        except Exception:
+            conn.close()
+            raise
+
+        timing['dns'] = conn.dns_time
+        timing['connect'] = conn.connect_time
+        timing['reused'] = is_reused
+        conn.dns_time = 0.0
+        conn.connect_time = 0.0
+        self.update_stats(scheme, host, timing)
+        self.local.timing = timing
+
+        if response.will_close:
+            conn.close()
+        else:
+            self.release_connection(scheme, host, conn)
+
+        if response.status < 200 or response.status >= 300:
+            try:
+                retry_after = float(response.getheader('Retry-After', 0))
+            except ValueError:
+                # Retry-After in the HTTP date format is not supported
+                retry_after = 0.0
+            raise HttpStatusError(response.status, response.reason, url, retry_after)
+
+        if response.getheader('Content-Encoding', '').lower() == 'gzip':
+            body = gzip.decompress(body)
+        return body
+
+    def send(self, conn, path, headers):
+        """
+        Send the request on the connection and read the response
+        :param conn: Connection
+        :param path: Path and query
+        :param headers: Request headers
+        :return Response, body and timing in seconds of ttfb and body. The time to
+                the first byte excludes the DNS lookup and connect time.
+        """
+        if len(conn.proxy_headers) > 0:
+            headers = dict(headers)
+            headers.update(conn.proxy_headers)
+        start_time = time.time()
+        conn.request('GET', conn.request_prefix + path, headers=headers)
+        response = conn.getresponse()
+        ttfb_time = time.time()
+        body = response.read()
+        end_time = time.time()
+        return response, body, {'ttfb': ttfb_time - start_time - conn.dns_time - conn.connect_time,
+                                'body': end_time - ttfb_time}
+
+    def update_stats(self, scheme, host, timing):
+        """
+        Add the request timing to the statistics of the host
+        :param scheme: http or https
+        :param host: Host and optional port
+        :param timing: Timing of the request
+        """
+        self.lock.acquire()
+        stats = self.stats.setdefault((scheme, host),
+                                      {'count': 0, 'reused': 0, 'dns': 0.0, 'connect': 0.0,
+                                       'ttfb': 0.0, 'body': 0.0})
+        stats['count'] += 1
+        if timing['reused']:
+            stats['reused'] += 1
+        for key in ['dns', 'connect', 'ttfb', 'body']:
+            stats[key] += timing[key]
+        self.lock.release()
+
+    def get_timing(self):
+        """
+        Get the timing of the last request of the current thread
+        :return Dictionary of the seconds of dns, connect, ttfb and body, and
+                whether the connection is reused. None if there is no request.
+        """
+        return getattr(self.local, 'timing', None)
+
+    def get_stats(self):
+        """
+        Get the statistics per host
+        :return Dictionary of host to the number of requests, reused connections
+                and the average seconds of dns, connect, ttfb and body
+        """
+        ret = dict()
+        self.lock.acquire()
+        for (scheme, host), stats in self.stats.items():
+            e = dict(stats)
+            for key in ['dns', 'connect', 'ttfb', 'body']:
+                e[key] = stats[key] / stats['count']
+            ret[scheme + '://' + host] = e
+        self.lock.release()
+        return ret
+
+    def close(self):
+        """
+        Close the idle connections
+        """
+        self.lock.acquire()
+        idle = self.idle
+        self.idle = dict()
+        self.lock.release()
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
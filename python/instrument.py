@@ -1,6 +1,24 @@
 import json
+from market_data import L2Depth, BarAggregator
 
 class Instrument(object):
+    class RecordMode:
+        FULL = 'full'
+        DELTA = 'delta'
+
+        @staticmethod
+        def parse(value):
+            """
+            Decode the order book record mode
+            :param value: Mode name, i.e. full or delta
+            :return: Record mode
+            """
+            value = value.lower()
+            if value == Instrument.RecordMode.FULL or value == Instrument.RecordMode.DELTA:
+                return value
+            else:
+                raise Exception("Unknown order book record mode (%s)." % value)
+
     def __init__(self,
                  exchange_name,
                  instmt_name,
@@ -24,6 +42,20 @@ class Instrument(object):
         self.subscribed = False
         self.l2_depth = None
         self.prev_l2_depth = None
+        self.l2_depth_fingerprint = None
+        self.l2_depth_emitted = 0
+        self.l2_depth_suppressed = 0
+        self.l2_depth_conflated = 0
+        self.conflated_l2_depth = None
+        self.conflation_time = 0
+        self.conflation_top = None
+        self.disconnected_time = 0
+        self.outages = []
+        self.outage_time = 0
+        self.order_book = None
+        self.order_book_snapshot_id = 0
+        self.order_book_delta_id = 0
+        self.order_book_levels = None
         self.order_book_channel_id = ''
         self.trades_channel_id = ''
 
@@ -54,6 +86,27 @@ class Instrument(object):
         else:
             self.link = ''
 
+        # Number of the first levels and the tolerances in the order book change detection
+        self.book_diff_depth = int(param.get('book_diff_depth', 5))
+        self.book_price_tolerance = float(param.get('book_price_tolerance', 0.0))
+        self.book_volume_tolerance = float(param.get('book_volume_tolerance', 0.0))
+
+        # Number of the levels recorded in the order book table
+        self.book_record_depth = int(param.get('book_record_depth', 5))
+
+        # Record the full order books, or the periodic snapshots and the changed levels in between
+        self.book_record_mode = Instrument.RecordMode.parse(param.get('book_record_mode', Instrument.RecordMode.FULL))
+        self.book_snapshot_interval = int(param.get('book_snapshot_interval', 100))
+
+        # Record only the latest order book once per interval (in milliseconds), or
+        # immediately if the best prices are changed. Zero means recording every book.
+        self.book_conflation_ms = int(param.get('book_conflation_ms', 0))
+        self.book_conflation_top = int(param.get('book_conflation_top', 1)) != 0
+
+        # Bars aggregated from the trades, e.g. 1s,1m
+        self.bar_aggregators = [BarAggregator(e.strip()) for e in param.get('bar_intervals', '').split(',')
+                                if e.strip() != '']
+
     def copy(self, obj):
         """
         Copy constructor
@@ -74,6 +127,29 @@ class Instrument(object):
         self.subscribed = obj.subscribed
         self.l2_depth = obj.l2_depth
         self.prev_l2_depth = obj.prev_l2_depth
+        self.l2_depth_fingerprint = obj.l2_depth_fingerprint
+        self.l2_depth_emitted = obj.l2_depth_emitted
+        self.l2_depth_suppressed = obj.l2_depth_suppressed
+        self.l2_depth_conflated = obj.l2_depth_conflated
+        self.conflated_l2_depth = obj.conflated_l2_depth
+        self.conflation_time = obj.conflation_time
+        self.conflation_top = obj.conflation_top
+        self.disconnected_time = obj.disconnected_time
+        self.outages = obj.outages
+        self.outage_time = obj.outage_time
+        self.book_diff_depth = obj.book_diff_depth
+        self.book_price_tolerance = obj.book_price_tolerance
+        self.book_volume_tolerance = obj.book_volume_tolerance
+        self.book_record_depth = obj.book_record_depth
+        self.book_record_mode = obj.book_record_mode
+        self.book_snapshot_interval = obj.book_snapshot_interval
+        self.book_conflation_ms = obj.book_conflation_ms
+        self.book_conflation_top = obj.book_conflation_top
+        self.bar_aggregators = obj.bar_aggregators
+        self.order_book = obj.order_book
+        self.order_book_snapshot_id = obj.order_book_snapshot_id
+        self.order_book_delta_id = obj.order_book_delta_id
+        self.order_book_levels = obj.order_book_levels
         self.order_book_channel_id = obj.order_book_channel_id
         self.trades_channel_id = obj.trades_channel_id
 
@@ -155,6 +231,135 @@ class Instrument(object):
     def set_prev_l2_depth(self, prev_l2_depth):
         self.prev_l2_depth = prev_l2_depth
 
+    def is_l2_depth_changed(self):
+        """
+        Check if the first levels of the L2 depth are changed since the last changed
+        one, within the price and volume tolerance. The levels are compared with the
+        cached fingerprint instead of a copy of the previous depth.
+        :return True if the levels are changed
+        """
+        fingerprint = self.l2_depth.fingerprint(self.book_diff_depth)
+        if fingerprint == self.l2_depth_fingerprint or \
+           ((self.book_price_tolerance > 0 or self.book_volume_tolerance > 0) and \
+            not L2Depth.is_fingerprint_diff(fingerprint, self.l2_depth_fingerprint,
+                                            self.book_price_tolerance, self.book_volume_tolerance)):
+            self.l2_depth_suppressed += 1
+            return False
+
+        self.l2_depth_fingerprint = fingerprint
+        self.l2_depth_emitted += 1
+        return True
+
+    def get_l2_depth_stats(self):
+        """
+        Get the numbers of the emitted, suppressed and conflated L2 depth updates
+        :return Dictionary of statistics
+        """
+        return {'emitted': self.l2_depth_emitted,
+                'suppressed': self.l2_depth_suppressed,
+                'conflated': self.l2_depth_conflated}
+
+    def get_book_record_depth(self):
+        return self.book_record_depth
+
+    def get_book_record_mode(self):
+        return self.book_record_mode
+
+    def get_book_snapshot_interval(self):
+        return self.book_snapshot_interval
+
+    def get_book_conflation_ms(self):
+        return self.book_conflation_ms
+
+    def is_book_conflation_top(self):
+        return self.book_conflation_top
+
+    def get_conflated_l2_depth(self):
+        return self.conflated_l2_depth
+
+    def set_conflated_l2_depth(self, conflated_l2_depth):
+        self.conflated_l2_depth = conflated_l2_depth
+
+    def get_conflation_time(self):
+        return self.conflation_time
+
+    def set_conflation_time(self, conflation_time):
+        self.conflation_time = conflation_time
+
+    def get_conflation_top(self):
+        return self.conflation_top
+
+    def set_conflation_top(self, conflation_top):
+        self.conflation_top = conflation_top
+
+    def incr_l2_depth_conflated(self):
+        self.l2_depth_conflated += 1
+
+    def get_order_book_snapshot_id(self):
+        return self.order_book_snapshot_id
+
+    def set_order_book_snapshot_id(self, order_book_snapshot_id):
+        self.order_book_snapshot_id = order_book_snapshot_id
+
+    def get_order_book_delta_id(self):
+        return self.order_book_delta_id
+
+    def set_order_book_delta_id(self, order_book_delta_id):
+        self.order_book_delta_id = order_book_delta_id
+
+    def incr_order_book_delta_id(self):
+        self.order_book_delta_id += 1
+
+    def get_order_book_levels(self):
+        return self.order_book_levels
+
+    def set_order_book_levels(self, order_book_levels):
+        self.order_book_levels = order_book_levels
+
+    def get_bar_aggregators(self):
+        return self.bar_aggregators
+
+    def set_disconnected(self, now):
+        """
+        Start the outage window if it is not started
+        :param now: Current time in nanoseconds since epoch
+        """
+        if self.disconnected_time == 0:
+            self.disconnected_time = now
+
+    def set_reconnected(self, now):
+        """
+        Close the outage window
+        :param now: Current time in nanoseconds since epoch
+        :return Start and end time of the outage, or None if it is not disconnected
+        """
+        if self.disconnected_time == 0:
+            return None
+
+        outage = (self.disconnected_time, now)
+        self.outages.append(outage)
+        self.outage_time += now - self.disconnected_time
+        self.disconnected_time = 0
+        return outage
+
+    def get_outages(self):
+        return self.outages
+
+    def get_outage_stats(self):
+        """
+        Get the number and the total time of the outages
+        :return Dictionary of statistics
+        """
+        return {'count': len(self.outages),
+                'time': self.outage_time / 1e9,
+                'disconnected': self.disconnected_time != 0}
+
+    def get_order_book(self):
+        return self.order_book
+
+    def set_order_book(self, order_book):
+        self.order_book = order_book
+
     def get_order_book_channel_id(self):
         return self.order_book_channel_id
 
@@ -1,18 +1,26 @@
 #!/bin/python
-from datetime import datetime
-import copy
+from util import Timestamp
+import bisect
+import threading
 
 
 class MarketDataBase:
     """
-    Abstract class of a market data
+    Abstract class of a market data. The market data classes define __slots__
+    to avoid the per-object dictionary.
+    The exchange and receive timestamps are kept in nanoseconds since epoch, and
+    the text date_time is only rendered when it is read.
     """
+    __slots__ = ('timestamp', 'receive_timestamp')
+
     class Side:
         NONE = 0
         BUY = 1
         SELL = 2
 
     class Depth(object):
+        __slots__ = ('price', 'count', 'volume')
+
         def __init__(self, price=0.0, count=0, volume=0.0):
             """
             Constructor
@@ -22,7 +30,7 @@ class MarketDataBase:
             self.volume = volume
 
         def copy(self):
-            return copy.deepcopy(self)
+            return MarketDataBase.Depth(self.price, self.count, self.volume)
 
     @staticmethod
     def parse_side(value):
@@ -51,60 +59,108 @@ class MarketDataBase:
         """
         Constructor
         """
-        pass
+        self.receive_timestamp = Timestamp.now()
+        self.timestamp = self.receive_timestamp
+
+    @property
+    def date_time(self):
+        """
+        Exchange timestamp in the format "%Y%m%d %H:%M:%S.%f"
+        """
+        return Timestamp.format(self.timestamp)
+
+    @date_time.setter
+    def date_time(self, value):
+        """
+        Set the exchange timestamp
+        :param value: Nanoseconds since epoch, or text in the format "%Y%m%d %H:%M:%S.%f"
+        """
+        self.timestamp = value if isinstance(value, int) else Timestamp.parse(value)
+
+    @staticmethod
+    def date_time_type(native_timestamp=False):
+        """
+        Return the column type of date_time
+        :param native_timestamp: Store the timestamp in nanoseconds instead of text
+        """
+        return 'bigint' if native_timestamp else 'text'
 
 
 class L2Depth(MarketDataBase):
     """
-    L2 price depth. Container of date, time, bid and ask up to 5 levels
+    L2 price depth. Container of date, time, bid and ask levels
     """
+    __slots__ = ('depth', 'bids', 'asks')
+
     def __init__(self, depth=5):
         """
         Constructor
         :param depth: Number of depth
         """
         MarketDataBase.__init__(self)
-        self.date_time = datetime.utcnow().strftime("%Y%m%d %H:%M:%S.%f")
         self.depth = depth
         self.bids = [MarketDataBase.Depth() for i in range(0, self.depth)]
         self.asks = [MarketDataBase.Depth() for i in range(0, self.depth)]
 
+    # Cache of the generated columns and types by the number of depth
+    columns_cache = dict()
+    types_cache = dict()
+
+    # Level of the padded depth beyond the available levels. Never modified.
+    empty_level = MarketDataBase.Depth()
+
     @staticmethod
-    def columns():
+    def columns(depth=5):
         """
-        Return static columns names
+        Return columns names, i.e. date_time, bid prices (b1, b2...), ask prices (a1, a2...),
+        bid volumes (bq1, bq2...) and ask volumes (aq1, aq2...)
+        :param depth: Number of recorded depth
         """
-        return ['date_time',
-                'b1', 'b2', 'b3', 'b4', 'b5',
-                'a1', 'a2', 'a3', 'a4', 'a5',
-                'bq1', 'bq2', 'bq3', 'bq4', 'bq5',
-                'aq1', 'aq2', 'aq3', 'aq4', 'aq5']
+        ret = L2Depth.columns_cache.get(depth)
+        if ret is None:
+            levels = range(1, depth + 1)
+            ret = ['date_time'] + \
+                  ['b%d' % i for i in levels] + \
+                  ['a%d' % i for i in levels] + \
+                  ['bq%d' % i for i in levels] + \
+                  ['aq%d' % i for i in levels]
+            L2Depth.columns_cache[depth] = ret
+        return ret
 
     @staticmethod
-    def types():
+    def types(native_timestamp=False, depth=5):
         """
-        Return static column types
+        Return column types
+        :param native_timestamp: Store the timestamp in nanoseconds instead of text
+        :param depth: Number of recorded depth
         """
-        return ['text'] + \
-               ['decimal(10,5)'] * 10 + \
-               ['decimal(20,8)'] * 10
+        ret = L2Depth.types_cache.get((native_timestamp, depth))
+        if ret is None:
+            ret = [MarketDataBase.date_time_type(native_timestamp)] + \
+                  ['decimal(10,5)'] * (2 * depth) + \
+                  ['decimal(20,8)'] * (2 * depth)
+            L2Depth.types_cache[(native_timestamp, depth)] = ret
+        return ret
 
-    def values(self):
+    def values(self, native_timestamp=False, depth=5):
         """
-        Return values in a list
+        Return values in a list. The bid and ask levels are packed in one pass per
+        field instead of concatenating the lists per side, and the levels beyond
+        the depth of the object are zero.
+        :param native_timestamp: Return the timestamp in nanoseconds instead of text
+        :param depth: Number of recorded depth
         """
-        if self.depth == 5:
-            return [self.date_time] + \
-                   [b.price for b in self.bids] + \
-                   [a.price for a in self.asks] + \
-                   [b.volume for b in self.bids] + \
-                   [a.volume for a in self.asks]
-        else:
-            return [self.date_time] + \
-                   [b.price for b in self.bids[0:5]] + \
-                   [a.price for a in self.asks[0:5]] + \
-                   [b.volume for b in self.bids[0:5]] + \
-                   [a.volume for a in self.asks[0:5]]
+        bids = self.bids[0:depth]
+        asks = self.asks[0:depth]
+        if len(bids) < depth:
+            bids += [L2Depth.empty_level] * (depth - len(bids))
+        if len(asks) < depth:
+            asks += [L2Depth.empty_level] * (depth - len(asks))
+        levels = bids + asks
+        ret = [self.timestamp if native_timestamp else Timestamp.format(self.timestamp)]
+        ret += [e.price for e in levels]
+        ret += [e.volume for e in levels]
+        return ret
 
     def sort_bids(self):
         """
@@ -128,12 +184,94 @@ class L2Depth(MarketDataBase):
         """
         Copy
         """
-        ret = L2Depth(depth=self.depth)
-        ret.date_time = self.date_time
-        ret.bids = [e.copy() for e in self.bids]
-        ret.asks = [e.copy() for e in self.asks]
+        # Skip the constructor which allocates the empty levels
+        ret = L2Depth.__new__(L2Depth)
+        ret.depth = self.depth
+        ret.timestamp = self.timestamp
+        ret.receive_timestamp = self.receive_timestamp
+        ret.bids = [MarketDataBase.Depth(e.price, e.count, e.volume) for e in self.bids]
+        ret.asks = [MarketDataBase.Depth(e.price, e.count, e.volume) for e in self.asks]
         return ret
 
+    @staticmethod
+    def delta_columns():
+        """
+        Return static column names of the delta rows
+        """
+        return ['book_id', 'date_time', 'side', 'price', 'volume']
+
+    @staticmethod
+    def delta_types(native_timestamp=False):
+        """
+        Return static column types of the delta rows
+        :param native_timestamp: Store the timestamp in nanoseconds instead of text
+        """
+        return ['int', MarketDataBase.date_time_type(native_timestamp), 'int',
+                'decimal(10,5)', 'decimal(20,8)']
+
+    def get_levels(self, depth=5):
+        """
+        Return the non-empty levels of the first n price depth
+        :param depth: Number of price depth
+        :return: Dictionaries of bid and ask volume by price
+        """
+        return dict([(e.price, e.volume) for e in self.bids[0:depth] if e.price != 0.0]), \
+               dict([(e.price, e.volume) for e in self.asks[0:depth] if e.price != 0.0])
+
+    @staticmethod
+    def diff_levels(levels, prev_levels):
+        """
+        Compare the levels from the method get_levels
+        :param levels: Bid and ask levels
+        :param prev_levels: Previous bid and ask levels
+        :return: List of the changed levels in (side, price, volume). The removed levels have zero volume.
+        """
+        ret = []
+        for side, curr, prev in ((MarketDataBase.Side.BUY, levels[0], prev_levels[0]),
+                                 (MarketDataBase.Side.SELL, levels[1], prev_levels[1])):
+            for price, volume in curr.items():
+                if prev.get(price) != volume:
+                    ret.append((side, price, volume))
+            for price in prev:
+                if price not in curr:
+                    ret.append((side, price, 0.0))
+        return ret
+
+    def fingerprint(self, n=5):
+        """
+        Return the prices and volumes of the first n price depth in a tuple
+        :param n: Number of price depth
+        :return: Tuple of bid prices, ask prices, bid volumes and ask volumes
+        """
+        bids = self.bids[0:n]
+        asks = self.asks[0:n]
+        return tuple([b.price for b in bids] + [a.price for a in asks] +
+                     [b.volume for b in bids] + [a.volume for a in asks])
+
+    @staticmethod
+    def is_fingerprint_diff(fingerprint, prev_fingerprint, price_tolerance=0.0, volume_tolerance=0.0):
+        """
+        Compare the fingerprints with the tolerance
+        :param fingerprint: Fingerprint from the method fingerprint
+        :param prev_fingerprint: Another fingerprint
+        :param price_tolerance: Maximum price difference regarded as unchanged
+        :param volume_tolerance: Maximum volume difference regarded as unchanged
+        :return: True if they are different
+        """
+        if fingerprint == prev_fingerprint:
+            return False
+        elif prev_fingerprint is None or len(fingerprint) != len(prev_fingerprint):
+            return True
+
+        half = len(fingerprint) // 2
+        for i in range(0, half):
+            if abs(fingerprint[i] - prev_fingerprint[i]) > price_tolerance:
+                return True
+        for i in range(half, len(fingerprint)):
+            if abs(fingerprint[i] - prev_fingerprint[i]) > volume_tolerance:
+                return True
+        return False
+
     def is_diff(self, l2_depth):
         """
         Compare the first 5 price depth
@@ -153,6 +291,8 @@ class Trade(MarketDataBase):
     """
     Trade. Container of date, time, trade price, volume and side.
     """
+    __slots__ = ('trade_id', 'trade_price', 'trade_volume', 'trade_side')
+
     def __init__(self):
         """
         Constructor
@@ -161,12 +301,10 @@ class Trade(MarketDataBase):
         :param default_format: Default date time format
         """
         MarketDataBase.__init__(self)
-        self.date_time = datetime.utcnow().strftime("%Y%m%d %H:%M:%S.%f")
         self.trade_id = ''
         self.trade_price = 0.0
         self.trade_volume = 0.0
         self.trade_side = MarketDataBase.Side.NONE
-        self.update_date_time = datetime.utcnow()
 
 
     @staticmethod
@@ -177,15 +315,444 @@ class Trade(MarketDataBase):
         return ['date_time', 'trade_id', 'trade_price', 'trade_volume', 'trade_side']
 
     @staticmethod
-    def types():
+    def types(native_timestamp=False):
         """
         Return static column types
+        :param native_timestamp: Store the timestamp in nanoseconds instead of text
         """
-        return ['text', 'text', 'decimal(10,5)', 'decimal(20,8)', 'text']
+        return [MarketDataBase.date_time_type(native_timestamp), 'text', 'decimal(10,5)', 'decimal(20,8)', 'text']
 
-    def values(self):
+    def values(self, native_timestamp=False):
         """
         Return values in a list
+        :param native_timestamp: Return the timestamp in nanoseconds instead of text
         """
-        return [self.date_time] + \
+        date_time = self.timestamp if native_timestamp else Timestamp.format(self.timestamp)
+        return [date_time] + \
                [self.trade_id] + [self.trade_price] + [self.trade_volume] + [self.trade_side]
+
+
+class Bar(MarketDataBase):
+    """
+    Bar. Container of the open, high, low, close, volume, volume weighted average
+    price and number of the trades in an interval. The timestamp is the start of
+    the interval.
+    """
+    __slots__ = ('open', 'high', 'low', 'close', 'volume', 'turnover', 'trade_count')
+
+    def __init__(self, timestamp=0, trade=None):
+        """
+        Constructor
+        :param timestamp: Start of the interval in nanoseconds since epoch
+        :param trade: First trade of the bar
+        """
+        MarketDataBase.__init__(self)
+        self.timestamp = timestamp
+        if trade is None:
+            self.open = self.high = self.low = self.close = 0.0
+            self.volume = 0.0
+            self.turnover = 0.0
+            self.trade_count = 0
+        else:
+            self.open = self.high = self.low = self.close = trade.trade_price
+            self.volume = trade.trade_volume
+            self.turnover = trade.trade_price * trade.trade_volume
+            self.trade_count = 1
+
+    @property
+    def vwap(self):
+        """
+        Volume weighted average price
+        """
+        return self.turnover / self.volume if self.volume > 0.0 else self.close
+
+    def update(self, trade):
+        """
+        Add the trade to the bar
+        :param trade: Trade object
+        """
+        price = trade.trade_price
+        if price > self.high:
+            self.high = price
+        elif price < self.low:
+            self.low = price
+        self.close = price
+        self.volume += trade.trade_volume
+        self.turnover += price * trade.trade_volume
+        self.trade_count += 1
+
+    @staticmethod
+    def columns():
+        """
+        Return static columns names
+        """
+        return ['date_time', 'open', 'high', 'low', 'close', 'volume', 'vwap', 'trade_count']
+
+    @staticmethod
+    def types(native_timestamp=False):
+        """
+        Return static column types
+        :param native_timestamp: Store the timestamp in nanoseconds instead of text
+        """
+        return [MarketDataBase.date_time_type(native_timestamp)] + ['decimal(10,5)'] * 4 + \
+               ['decimal(20,8)', 'decimal(10,5)', 'int']
+
+    def values(self, native_timestamp=False):
+        """
+        Return values in a list
+        :param native_timestamp: Return the timestamp in nanoseconds instead of text
+        """
+        date_time = self.timestamp if native_timestamp else Timestamp.format(self.timestamp)
+        return [date_time, self.open, self.high, self.low, self.close, self.volume, self.vwap,
+                self.trade_count]
+
+
+class BarAggregator(object):
+    """
+    Aggregator of the trades into the bars of a fixed interval. The bar is completed
+    by the first trade in a later interval, or by flush when the interval has passed,
+    and the intervals without any trade have no bar. A late trade of a completed
+    interval is dropped and counted.
+    """
+    # Units of the interval names
+    UNITS = {'s': Timestamp.SECOND,
+             'm': 60 * Timestamp.SECOND,
+             'h': 3600 * Timestamp.SECOND,
+             'd': 86400 * Timestamp.SECOND}
+
+    # Nanoseconds waited after the end of the interval before flush completes the
+    # bar, for the trades delayed by the exchange and the network
+    CLOSE_DELAY = Timestamp.SECOND
+
+    def __init__(self, name):
+        """
+        Constructor
+        :param name: Interval name, e.g. 1s, 5m, 1h or 1d
+        """
+        self.name = name
+        self.interval = BarAggregator.parse_interval(name)
+        self.bar = None
+        self.bar_id = 0
+        self.closed_time = 0        # End of the last completed interval
+        self.late_count = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def parse_interval(name):
+        """
+        Decode the interval name
+        :param name: Interval name, e.g. 1s, 5m, 1h or 1d
+        :return: Interval in nanoseconds
+        """
+        unit = BarAggregator.UNITS.get(name[-1:])
+        if unit is None or not name[:-1].isdigit() or int(name[:-1]) == 0:
+            raise Exception("Unknown bar interval (%s)." % name)
+        return int(name[:-1]) * unit
+
+    def update(self, trade):
+        """
+        Add the trade to the current bar
+        :param trade: Trade object
+        :return: The completed bar, or None if the current bar is not completed
+        """
+        start = trade.timestamp - trade.timestamp % self.interval
+        bar = self.bar
+        if start < self.closed_time or (bar is not None and start < bar.timestamp):
+            self.late_count += 1
+            return None
+        elif bar is None or start > bar.timestamp:
+            self.bar = Bar(start, trade)
+            if bar is not None:
+                self.closed_time = bar.timestamp + self.interval
+            return bar
+
+        bar.update(trade)
+        return None
+
+    def flush(self, now=None):
+        """
+        Complete the current bar if its interval has passed
+        :param now: Current time in nanoseconds since epoch. None means completing
+                    the current bar anyway, e.g. on shutdown.
+        :return: The completed bar, or None if the current bar is not completed
+        """
+        bar = self.bar
+        if bar is None or \
+           (now is not None and now < bar.timestamp + self.interval + BarAggregator.CLOSE_DELAY):
+            return None
+
+        self.bar = None
+        self.closed_time = bar.timestamp + self.interval
+        return bar
+
+
+class OrderBook(object):
+    """
+    Order book of the price levels maintained by incremental updates. Each side
+    keeps the levels in a price-keyed dictionary and the prices in a sorted list,
+    so that a level is found by hashing, inserted or deleted by bisection, and
+    the top levels are taken from the end of the sorted list.
+    """
+    def __init__(self, depth=5):
+        """
+        Constructor
+        :param depth: Number of the top levels set to the L2 depth
+        """
+        self.depth = depth
+        self.bids = dict()          # price -> Depth
+        self.asks = dict()          # price -> Depth
+        self.bid_prices = []        # Ascending order. The best bid is the last one.
+        self.ask_prices = []        # Negative prices in ascending order. The best ask is the last one.
+        self.is_bids_changed = True # Top bid levels are inserted or deleted since the last fill
+        self.is_asks_changed = True # Top ask levels are inserted or deleted since the last fill
+        self.filled_l2_depth = None
+        self.empty_levels = [MarketDataBase.Depth() for i in range(0, depth)]
+
+    def clear(self):
+        """
+        Remove all the price levels
+        """
+        self.bids.clear()
+        self.asks.clear()
+        del self.bid_prices[:]
+        del self.ask_prices[:]
+        self.is_bids_changed = True
+        self.is_asks_changed = True
+
+    def update(self, side, price, count, volume):
+        """
+        Insert or update the price level
+        :param side: MarketDataBase.Side.BUY or SELL
+        :param price: Price
+        :param count: Number of orders
+        :param volume: Volume
+        """
+        if side == MarketDataBase.Side.BUY:
+            levels = self.bids
+        else:
+            levels = self.asks
+
+        depth = levels.get(price)
+        if depth is not None:
+            # The level is shared with the L2 depth
+            depth.count = count
+            depth.volume = volume
+            return
+
+        levels[price] = MarketDataBase.Depth(price=price, count=count, volume=volume)
+        if side == MarketDataBase.Side.BUY:
+            prices = self.bid_prices
+            i = bisect.bisect_left(prices, price)
+            prices.insert(i, price)
+            if len(prices) - i <= self.depth:
+                self.is_bids_changed = True
+        else:
+            prices = self.ask_prices
+            i = bisect.bisect_left(prices, -price)
+            prices.insert(i, -price)
+            if len(prices) - i <= self.depth:
+                self.is_asks_changed = True
+
+    def delete(self, side, price):
+        """
+        Delete the price level
+        :param side: MarketDataBase.Side.BUY or SELL
+        :param price: Price
+        :return True if the price level is found
+        """
+        if side == MarketDataBase.Side.BUY:
+            if self.bids.pop(price, None) is None:
+                return False
+            prices = self.bid_prices
+            i = bisect.bisect_left(prices, price)
+            if len(prices) - i <= self.depth:
+                self.is_bids_changed = True
+        else:
+            if self.asks.pop(price, None) is None:
+                return False
+            prices = self.ask_prices
+            i = bisect.bisect_left(prices, -price)
+            if len(prices) - i <= self.depth:
+                self.is_asks_changed = True
+
+        del prices[i]
+        return True
+
+    def get_bids(self, n):
+        """
+        Get the best bids
+        :param n: Number of price levels
+        :return List of Depth in descending order of price
+        """
+        bids = self.bids
+        return [bids[price] for price in self.bid_prices[:-n-1:-1]]
+
+    def get_asks(self, n):
+        """
+        Get the best asks
+        :param n: Number of price levels
+        :return List of Depth in ascending order of price
+        """
+        asks = self.asks
+        return [asks[-price] for price in self.ask_prices[:-n-1:-1]]
+
+    def fill_l2_depth(self, l2_depth):
+        """
+        Set the top levels to the L2 depth. The levels are shared with the order
+        book, so the L2 depth must be copied to keep a snapshot. The missing levels
+        are empty. Only the sides of which the top levels are inserted or deleted
+        are set again.
+        :param l2_depth: L2Depth object with the same depth as the order book
+        """
+        n = self.depth
+        if l2_depth is not self.filled_l2_depth:
+            self.filled_l2_depth = l2_depth
+            self.is_bids_changed = True
+            self.is_asks_changed = True
+
+        if self.is_bids_changed:
+            bids = self.get_bids(n)
+            if len(bids) < n:
+                bids += self.empty_levels[len(bids):]
+            l2_depth.bids = bids
+            self.is_bids_changed = False
+
+        if self.is_asks_changed:
+            asks = self.get_asks(n)
+            if len(asks) < n:
+                asks += self.empty_levels[len(asks):]
+            l2_depth.asks = asks
+            self.is_asks_changed = False
+
+
+class L2DepthReader(object):
+    """
+    Reader of the order books recorded in snapshots and deltas. The order book
+    table contains the periodic full snapshots, and the delta table contains the
+    changed levels of the books in between, referred by the book id.
+    """
+    def __init__(self, db_client, table_name, delta_table_name=''):
+        """
+        Constructor
+        :param db_client: Database client
+        :param table_name: Order book table name
+        :param delta_table_name: Delta table name. Defaulted as the order book table name with suffix "_delta"
+        """
+        self.db_client = db_client
+        self.table_name = table_name
+        self.delta_table_name = delta_table_name if delta_table_name != '' else table_name + '_delta'
+
+    @staticmethod
+    def to_nanoseconds(value):
+        """
+        Convert the selected timestamp to nanoseconds since epoch
+        :param value: Nanoseconds, or text in the format of "%Y%m%d %H:%M:%S.%f"
+        :return Integer
+        """
+        return Timestamp.parse(value) if isinstance(value, str) else int(value)
+
+    def get_l2_depth(self, date_time):
+        """
+        Rebuild the order book at the time
+        :param date_time: Nanoseconds since epoch, or text in the format of "%Y%m%d %H:%M:%S.%f"
+        :return L2Depth object, or None if there is no snapshot before the time
+        """
+        date_time = L2DepthReader.to_nanoseconds(date_time)
+        return self.rebuild(lambda book_id, t: L2DepthReader.to_nanoseconds(t) <= date_time)
+
+    def get_l2_depth_by_id(self, book_id):
+        """
+        Rebuild the order book of the book id
+        :param book_id: Order book id
+        :return L2Depth object, or None if there is no snapshot before the book
+        """
+        return self.rebuild(lambda id, t: id <= book_id)
+
+    def search_last(self, table, columns, predicate):
+        """
+        Binary search the last row of which the predicate is True by the id column.
+        The predicate is True for the rows up to the searched row and False after it.
+        Each step selects one row by a range of the id, which is seeked by the index
+        of the database.
+        :param table: Table name
+        :param columns: Selected columns. The first column is id.
+        :param predicate: Function of the selected row
+        :return Selected row, or None if the predicate is False for the first row
+        """
+        rows = self.db_client.select(table, columns=columns, orderby='id asc', limit=1)
+        if len(rows) == 0 or not predicate(rows[0]):
+            return None
+        ret = rows[0]
+        rows = self.db_client.select(table, columns=columns, orderby='id desc', limit=1)
+        if predicate(rows[0]):
+            return rows[0]
+
+        lo = int(ret[0]) + 1
+        hi = int(rows[0][0]) - 1
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            rows = self.db_client.select(table, columns=columns, condition="id>=%d and id<=%d" % (mid, hi),
+                                         orderby='id asc', limit=1)
+            if len(rows) == 0:
+                hi = mid - 1
+            elif predicate(rows[0]):
+                ret = rows[0]
+                lo = int(ret[0]) + 1
+            else:
+                hi = mid - 1
+        return ret
+
+    def rebuild(self, is_before):
+        """
+        Seek the latest snapshot and apply the deltas after it. The snapshot and
+        the first delta are searched by the id, and the deltas are read until the
+        first one after the book.
+        :param is_before: Function of the book id and the date time, which returns
+                          True if the book is not after the rebuilt one
+        :return L2Depth object, or None if there is no snapshot
+        """
+        snapshot = self.search_last(self.table_name, ['id', 'date_time'],
+                                    lambda row: is_before(int(row[0]), row[1]))
+        if snapshot is None:
+            return None
+        book_id = int(snapshot[0])
+        rows = self.db_client.select(self.table_name, condition="id=%d" % book_id)
+
+        row = rows[0]
+        depth = (len(row) - 2) // 4
+        bids = dict()
+        asks = dict()
+        for i in range(0, depth):
+            if row[2+i] != 0.0:
+                bids[row[2+i]] = row[2+2*depth+i]
+            if row[2+depth+i] != 0.0:
+                asks[row[2+depth+i]] = row[2+3*depth+i]
+        date_time = row[1]
+
+        # Last delta of the books up to the snapshot
+        last_delta = self.search_last(self.delta_table_name, ['id', 'book_id'],
+                                      lambda row: int(row[1]) <= book_id)
+        condition = "id>%d" % int(last_delta[0]) if last_delta is not None else ''
+        deltas = self.db_client.iter_select(self.delta_table_name,
+                                            columns=['book_id', 'date_time', 'side', 'price', 'volume'],
+                                            condition=condition, orderby='id asc')
+        for delta in deltas:
+            if not is_before(int(delta[0]), delta[1]):
+                break
+            levels = bids if delta[2] == MarketDataBase.Side.BUY else asks
+            if delta[4] == 0.0:
+                levels.pop(delta[3], None)
+            else:
+                levels[delta[3]] = delta[4]
+            date_time = delta[1]
+        deltas.close()
+
+        ret = L2Depth(depth)
+        ret.date_time = date_time
+        for i, price in enumerate(sorted(bids, reverse=True)[0:depth]):
+            ret.bids[i].price = price
+            ret.bids[i].volume = bids[price]
+        for i, price in enumerate(sorted(asks)[0:depth]):
+            ret.asks[i].price = price
+            ret.asks[i].volume = asks[price]
+        return ret
@@ -3,24 +3,40 @@ from sql_client import SqlClient
 
 class MysqlClient(SqlClient):
     """
-    Sqlite client
+    Mysql client
     """
-    def __init__(self):
+    # Placeholder of the bound parameters in the statement
+    PARAM_MARKER = '%s'
+
+    # Keyword of the "INSERT OR REPLACE" statement
+    INSERT_OR_REPLACE = 'replace'
+
+    def __init__(self, batch_size=0, batch_interval=0):
         """
         Constructor
+        :param batch_size: Number of buffered rows which triggers a flush
+        :param batch_interval: Maximum time (in milliseconds) a buffered row waits before a flush
         """
-        SqlClient.__init__(self)
+        SqlClient.__init__(self, batch_size=batch_size, batch_interval=batch_interval)
+        self.connect_args = dict()
 
     def connect(self, **kwargs):
         """
         Connect
-        :param path: sqlite file to connect
+        :param host: Database address
+        :param port: Database port. Defaulted as 3306.
+        :param user: Database user
+        :param pwd: Database password
+        :param schema: Database schema
         """
+        self.connect_args = kwargs
         host = kwargs['host']
+        port = int(kwargs.get('port', 3306))
         user = kwargs['user']
         pwd = kwargs['pwd']
         schema = kwargs['schema']
         self.conn = pymysql.connect(host=host,
+                                    port=port,
                                     user=user,
                                     password=pwd,
                                     db=schema,
@@ -29,12 +45,24 @@ class MysqlClient(SqlClient):
         self.cursor = self.conn.cursor()
         return self.conn is not None and self.cursor is not None
 
-    def execute(self, sql):
+    def execute(self, sql, params=None):
         """
         Execute the sql command
         :param sql: SQL command
+        :param params: Bound parameters
+        """
+        if params is None:
+            self.cursor.execute(sql)
+        else:
+            self.cursor.execute(sql, params)
+
+    def executemany(self, sql, params_list):
+        """
+        Execute the sql command for each set of bound parameters
+        :param sql: SQL command
+        :param params_list: List of bound parameters
         """
-        self.cursor.execute(sql)
+        self.cursor.executemany(sql, params_list)
 
     def commit(self):
         """
@@ -42,6 +70,12 @@ class MysqlClient(SqlClient):
         """
         self.conn.commit()
 
+    def rollback(self):
+        """
+        Rollback
+        """
+        self.conn.rollback()
+
     def fetchone(self):
         """
         Fetch one record
@@ -56,6 +90,69 @@ class MysqlClient(SqlClient):
         """
         return self.cursor.fetchall()
 
+    def list_tables(self):
+        """
+        List the tables in the schema
+        :return List of table names
+        """
+        self.flush()
+        lock = self.get_lock()
+        lock.acquire()
+        try:
+            self.execute("show tables")
+            # The rows are dictionaries of the DictCursor keyed by Tables_in_<schema>
+            ret = sorted([list(row.values())[0] for row in self.fetchall()])
+        finally:
+            lock.release()
+        return ret
+
+    def open_stream_cursor(self):
+        """
+        Open a server side cursor on a dedicated connection, so that the rows
+        are streamed from the server instead of being buffered in the client.
+        :return Cursor and the lock guarding it
+        """
+        conn = pymysql.connect(host=self.connect_args['host'],
+                               port=int(self.connect_args.get('port', 3306)),
+                               user=self.connect_args['user'],
+                               password=self.connect_args['pwd'],
+                               db=self.connect_args['schema'],
+                               charset='utf8mb4',
+                               cursorclass=pymysql.cursors.SSCursor)
+        return conn.cursor(), None
+
+    def close_stream_cursor(self, cursor):
+        """
+        Close the streaming cursor and its connection
+        :param cursor: Cursor from open_stream_cursor
+        """
+        conn = cursor.connection
+        cursor.close()
+        conn.close()
+
+    def iter_select(self, table, columns=['*'], condition='', orderby='', limit=0,
+                    chunk_size=1000, is_chunked=False):
+        """
+        Select rows from the table lazily. The rows are returned as lists, the
+        same as select.
+        :param table: Table name
+        :param columns: Selected columns
+        :param condition: Where condition
+        :param orderby: Order by condition
+        :param limit: Rows limit
+        :param chunk_size: Number of rows fetched at a time
+        :param is_chunked: Yield lists of rows instead of single rows
+        :return Generator of rows, or lists of rows if is_chunked is True
+        """
+        for rows in SqlClient.iter_select(self, table, columns, condition, orderby, limit,
+                                          chunk_size, True):
+            rows = [list(e) for e in rows]
+            if is_chunked:
+                yield rows
+            else:
+                for row in rows:
+                    yield row
+
     def select(self, table, columns=['*'], condition='', orderby='', limit=0, isFetchAll=True):
         """
         Select rows from the table
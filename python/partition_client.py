@@ -0,0 +1,373 @@
+from database_client import DatabaseClient
+from util import Logger, Timestamp
+from collections import deque
+import threading
+import re
+
+class PartitionClient(DatabaseClient):
+    """
+    Partition client. Each table is split into physical tables per UTC day or
+    hour, named as <table>_<yyyymmdd> or <table>_<yyyymmdd>_<hh>, on top of the
+    underlying database client. The rows go to the partition of their date_time
+    column. The closed partitions are compressed in the background if the
+    underlying client supports compression.
+    """
+
+    class Interval:
+        DAY = 0
+        HOUR = 1
+
+        @staticmethod
+        def parse(value):
+            """
+            Decode the interval name
+            :param value: Interval name, i.e. day or hour
+            :return: Interval
+            """
+            value = value.lower()
+            if value == 'day':
+                return PartitionClient.Interval.DAY
+            elif value == 'hour':
+                return PartitionClient.Interval.HOUR
+            else:
+                raise Exception("Unknown partition interval (%s)." % value)
+
+    # Column deciding the partition of the row
+    DATE_TIME_COLUMN = 'date_time'
+
+    # Column in ascending order across the partitions
+    INDEX_COLUMN = 'id'
+
+    # Suffix of the partition name
+    PARTITION_SUFFIX = re.compile(r"^_(\d{8})(?:_(\d{2}))?$")
+
+    def __init__(self, client, interval=Interval.DAY, compression=''):
+        """
+        Constructor
+        :param client: Underlying database client
+        :param interval: Partition interval
+        :param compression: Compression method of the closed partitions. Empty means no compression.
+        """
+        DatabaseClient.__init__(self)
+        self.native_timestamp = client.native_timestamp
+        self.client = client
+        self.interval = interval
+        self.compression = compression
+        self.schemas = dict()           # table -> (columns, types)
+        self.partitions = dict()        # table -> list of partition names in ascending order
+        self.current = dict()           # table -> (partition key, partition name)
+        self.lock = threading.Lock()
+        self.compress_queue = deque()
+        self.compress_cond = threading.Condition()
+        self.compress_count = 0
+        self.stopped = False
+        self.compress_thread = None
+        if self.compression != '':
+            self.compress_thread = threading.Thread(target=self.compress_worker)
+            self.compress_thread.daemon = True
+            self.compress_thread.start()
+
+    def connect(self, **kwargs):
+        """
+        Connect
+        :return True if it is connected
+        """
+        return self.client.connect(**kwargs)
+
+    def get_partition_key(self, date_time=None):
+        """
+        Get the partition key of the timestamp
+        :param date_time: Nanoseconds since epoch, or text in the format of "%Y%m%d %H:%M:%S.%f".
+                          None means the current time.
+        :return Partition key, i.e. yyyymmdd or yyyymmdd_hh
+        """
+        if date_time is None:
+            date_time = Timestamp.format(Timestamp.now())
+        elif isinstance(date_time, int):
+            date_time = Timestamp.format(date_time)
+
+        if self.interval == PartitionClient.Interval.HOUR:
+            return date_time[0:8] + '_' + date_time[9:11]
+        else:
+            return date_time[0:8]
+
+    def get_partition_name(self, table, key):
+        """
+        Get the physical table name of the partition
+        :param table: Table name
+        :param key: Partition key
+        :return Partition name
+        """
+        return table + '_' + key
+
+    def get_partitions(self, table):
+        """
+        Get the partitions of the table
+        :param table: Table name
+        :return List of partition names in ascending order of time
+        """
+        self.lock.acquire()
+        ret = self.partitions.get(table)
+        self.lock.release()
+        if ret is not None:
+            return list(ret)
+
+        ret = []
+        for name in self.client.list_tables():
+            if name.startswith(table) and \
+               PartitionClient.PARTITION_SUFFIX.match(name[len(table):]) is not None:
+                ret.append(name)
+        ret.sort()
+
+        self.lock.acquire()
+        ret = self.partitions.setdefault(table, ret)
+        self.lock.release()
+        return list(ret)
+
+    def create(self, table, columns, types, is_ifnotexists=True):
+        """
+        Create the partition of the current time. The older partitions which are
+        not compressed yet are put in the compression queue.
+        :param table: Table name
+        :param columns: Column array
+        :param types: Type array
+        :param is_ifnotexists: Create table if not exists keyword
+        """
+        if len(columns) != len(types):
+            return False
+
+        self.lock.acquire()
+        self.schemas[table] = (columns, types)
+        self.lock.release()
+
+        key = self.get_partition_key()
+        name = self.get_partition_name(table, key)
+        for partition in self.get_partitions(table):
+            if partition < name:
+                self.enqueue_compression(partition)
+
+        return self.create_partition(table, key)
+
+    def create_partition(self, table, key):
+        """
+        Create the partition and make it the current one of the table
+        :param table: Table name
+        :param key: Partition key
+        :return True if the partition is created
+        """
+        name = self.get_partition_name(table, key)
+        columns, types = self.schemas[table]
+        ret = self.client.create(name, columns, types)
+        self.get_partitions(table)
+
+        self.lock.acquire()
+        if name not in self.partitions[table]:
+            self.partitions[table].append(name)
+            self.partitions[table].sort()
+        previous = self.current.get(table)
+        self.current[table] = (key, name)
+        self.lock.release()
+
+        if previous is not None and previous[1] < name:
+            Logger.info(self.__class__.__name__, "Partition (%s) is closed." % previous[1])
+            self.enqueue_compression(previous[1])
+
+        return ret
+
+    def insert(self, table, columns, values, is_orreplace=False):
+        """
+        Insert into the partition of the row
+        :param table: Table name
+        :param columns: Column array
+        :param values: Value array
+        :param is_orreplace: Indicate if the query is "INSERT OR REPLACE"
+        """
+        if len(columns) != len(values):
+            return False
+
+        if PartitionClient.DATE_TIME_COLUMN in columns:
+            key = self.get_partition_key(values[columns.index(PartitionClient.DATE_TIME_COLUMN)])
+        else:
+            key = self.get_partition_key()
+
+        current = self.current.get(table)
+        if current is None or key > current[0]:
+            # Late rows of a closed partition stay in the current one, so that
+            # the ids are in ascending order across the partitions.
+            if table not in self.schemas:
+                raise Exception("Table (%s) has not been created." % table)
+            self.create_partition(table, key)
+            current = self.current[table]
+
+        return self.client.insert(current[1], columns, values, is_orreplace)
+
+    def enqueue_compression(self, partition):
+        """
+        Put the partition in the compression queue
+        :param partition: Partition name
+        """
+        if self.compress_thread is None:
+            return
+
+        self.compress_cond.acquire()
+        if partition not in self.compress_queue:
+            self.compress_queue.append(partition)
+            self.compress_cond.notify_all()
+        self.compress_cond.release()
+
+    def compress_worker(self):
+        """
+        Compression thread. Compresses the closed partitions.
+        """
+        while True:
+            self.compress_cond.acquire()
+            while len(self.compress_queue) == 0 and not self.stopped:
+                self.compress_cond.wait()
+            if self.stopped:
+                self.compress_cond.release()
+                break
+            partition = self.compress_queue.popleft()
+            self.compress_cond.release()
+
+            try:
+                if self.client.compress(partition, self.compression):
+                    self.compress_count += 1
+                    Logger.info(self.__class__.__name__, "Partition (%s) is compressed." % partition)
+            except Exception as e:
+                Logger.error(self.__class__.__name__, "Compression error: %s\nTable: %s" % (e, partition))
+
+    def select(self, table, columns=['*'], condition='', orderby='', limit=0, isFetchAll=True):
+        """
+        Select rows from all the partitions of the table.
+        Ordering by the index column walks the partitions in order and stops at the
+        limit. The other orderings are merged in memory and the ordered field must
+        be selected.
+        :param table: Table name
+        :param columns: Selected columns
+        :param condition: Where condition
+        :param orderby: Order by condition
+        :param limit: Rows limit
+        :param isFetchAll: Indicator of fetching all
+        :return Result rows
+        """
+        field = orderby.split(' ')[0].strip() if orderby != '' else ''
+        is_desc = len(orderby.split(' ')) > 1 and orderby.split(' ')[1].strip() == 'desc'
+        partitions = self.get_partitions(table)
+
+        if field == '' or field == PartitionClient.INDEX_COLUMN:
+            if is_desc:
+                partitions.reverse()
+            ret = []
+            for partition in partitions:
+                ret += self.client.select(partition, columns, condition, orderby,
+                                          limit - len(ret) if limit > 0 else 0)
+                if limit > 0 and len(ret) >= limit:
+                    break
+            return ret
+
+        if len(columns) == 1 and columns[0] == '*':
+            field_names = [e.split(' ')[0] for e in self.schemas[table][0]] \
+                          if table in self.schemas else []
+        else:
+            field_names = [e.split(' ')[0] for e in columns]
+        if field not in field_names:
+            raise Exception("Field (%s) must be selected to order the partitions." % field)
+
+        ret = []
+        for partition in partitions:
+            ret += self.client.select(partition, columns, condition, orderby, limit)
+        field_index = field_names.index(field)
+        ret.sort(key=lambda x:x[field_index], reverse=is_desc)
+        return ret[0:limit] if limit > 0 else ret
+
+    def iter_select(self, table, columns=['*'], condition='', orderby='', limit=0,
+                    chunk_size=1000, is_chunked=False):
+        """
+        Select rows from all the partitions of the table lazily.
+        Ordering by the index column chains the lazy selects of the partitions in
+        order, so only one chunk is held in memory. The other orderings are merged
+        in memory as in select.
+        :param table: Table name
+        :param columns: Selected columns
+        :param condition: Where condition
+        :param orderby: Order by condition
+        :param limit: Rows limit
+        :param chunk_size: Number of rows fetched at a time
+        :param is_chunked: Yield lists of rows instead of single rows
+        :return Generator of rows, or lists of rows if is_chunked is True
+        """
+        field = orderby.split(' ')[0].strip() if orderby != '' else ''
+        is_desc = len(orderby.split(' ')) > 1 and orderby.split(' ')[1].strip() == 'desc'
+        if field != '' and field != PartitionClient.INDEX_COLUMN:
+            for rows in DatabaseClient.iter_select(self, table, columns, condition, orderby, limit,
+                                                   chunk_size, is_chunked):
+                yield rows
+            return
+
+        partitions = self.get_partitions(table)
+        if is_desc:
+            partitions.reverse()
+        count = 0
+        for partition in partitions:
+            for rows in self.client.iter_select(partition, columns, condition, orderby,
+                                                limit - count if limit > 0 else 0,
+                                                chunk_size, True):
+                count += len(rows)
+                if is_chunked:
+                    yield rows
+                else:
+                    for row in rows:
+                        yield row
+            if limit > 0 and count >= limit:
+                break
+
+    def delete(self, table, condition='1==1'):
+        """
+        Delete rows from all the partitions of the table
+        :param table: Table name
+        :param condition: Where condition
+        """
+        ret = True
+        for partition in self.get_partitions(table):
+            ret = self.client.delete(partition, condition) and ret
+        return ret
+
+    def list_tables(self):
+        """
+        List the physical tables of the underlying client
+        :return List of table names
+        """
+        return self.client.list_tables()
+
+    def flush(self):
+        """
+        Flush the buffered rows of the underlying client
+        :return True if the rows are flushed
+        """
+        return self.client.flush()
+
+    def get_stats(self):
+        """
+        Get the statistics of the partitions
+        :return Dictionary of statistics
+        """
+        self.compress_cond.acquire()
+        ret = {'compress_queue': len(self.compress_queue),
+               'compress_count': self.compress_count,
+               'partitions': dict([(table, name) for table, (key, name) in list(self.current.items())])}
+        self.compress_cond.release()
+        ret['client'] = self.client.get_stats()
+        return ret
+
+    def close(self):
+        """
+        Stop the compression thread and close the underlying client. The partitions
+        left in the queue are compressed after the next start.
+        """
+        self.compress_cond.acquire()
+        self.stopped = True
+        self.compress_cond.notify_all()
+        self.compress_cond.release()
+        if self.compress_thread is not None:
+            self.compress_thread.join()
+        return self.client.close()
@@ -0,0 +1,233 @@
+#!/bin/python
+
+import heapq
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http_client import HttpStatusError
+from util import Logger
+
+class TokenBucket(object):
+    """
+    Token bucket rate limiter. The tokens are refilled at the rate up to the
+    capacity, and each request takes one token.
+    """
+    def __init__(self, rate, capacity=1):
+        """
+        Constructor
+        :param rate: Tokens per second. Zero means unlimited.
+        :param capacity: Maximum number of tokens, i.e. the burst size
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.last_time = time.time()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Take a token in advance
+        :return Seconds to wait until the token is available
+        """
+        if self.rate <= 0:
+            return 0.0
+
+        self.lock.acquire()
+        try:
+            now = time.time()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_time) * self.rate)
+            self.last_time = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+        finally:
+            self.lock.release()
+
+
+class AdaptiveInterval(object):
+    """
+    Polling interval adapted to the results. The interval is shortened when the
+    data is changed, lengthened when it is unchanged, and backed off on errors.
+    """
+    # Factors applied to the interval
+    SPEEDUP = 0.75
+    SLOWDOWN = 1.25
+    BACKOFF = 2.0
+
+    def __init__(self, interval, min_interval=0.0, max_interval=0.0):
+        """
+        Constructor
+        :param interval: Initial seconds between the polls
+        :param min_interval: Minimum interval. Defaulted as half of the initial interval.
+        :param max_interval: Maximum interval. Defaulted as 10 times of the initial interval.
+        """
+        self.interval = interval
+        self.min_interval = min_interval if min_interval > 0 else interval / 2
+        self.max_interval = max_interval if max_interval > 0 else interval * 10
+
+    def update(self, is_changed):
+        """
+        Adapt the interval to a successful poll
+        :param is_changed: Indicate if the poll returns new data
+        :return Next interval
+        """
+        if is_changed:
+            self.interval = max(self.min_interval, self.interval * AdaptiveInterval.SPEEDUP)
+        else:
+            self.interval = min(self.max_interval, self.interval * AdaptiveInterval.SLOWDOWN)
+        return self.interval
+
+    def backoff(self, delay=0.0):
+        """
+        Back off the interval after an error
+        :param delay: Minimum delay required by the server, e.g. Retry-After
+        :return Next interval
+        """
+        self.interval = min(self.max_interval, self.interval * AdaptiveInterval.BACKOFF)
+        return max(self.interval, delay)
+
+
+class Poller(object):
+    """
+    Polling task. The polling function returns True if the data is changed.
+    """
+    def __init__(self, name, init, poll, interval, rate_limiter=None):
+        """
+        Constructor
+        :param name: Name in the log
+        :param init: Initialization function called before the first poll, or None
+        :param poll: Polling function
+        :param interval: AdaptiveInterval object
+        :param rate_limiter: TokenBucket object shared by the pollers of the exchange, or None
+        """
+        self.name = name
+        self.init = init
+        self.poll = poll
+        self.interval = interval
+        self.rate_limiter = rate_limiter
+        self.next_time = 0.0
+        self.has_token = False
+
+    def reserve(self):
+        """
+        Take a token from the rate limiter
+        :return Seconds to wait until the token is available
+        """
+        self.has_token = True
+        return self.rate_limiter.reserve() if self.rate_limiter is not None else 0.0
+
+    def execute(self):
+        """
+        Poll once
+        :return Seconds to the next poll, counted from the start of this poll
+        """
+        self.has_token = False
+        try:
+            if self.init is not None:
+                # Retried at the next poll if it fails
+                self.init()
+                self.init = None
+            return self.interval.update(self.poll())
+        except HttpStatusError as e:
+            Logger.error(self.__class__.__name__, "Error in %s: %s" % (self.name, e))
+            return self.interval.backoff(e.retry_after)
+        except Exception as e:
+            Logger.error(self.__class__.__name__, "Error in %s: %s" % (self.name, e))
+            return self.interval.backoff()
+
+
+class PollScheduler(object):
+    """
+    Scheduler of the pollers on a shared pool of worker threads. The pollers are
+    kept in a heap by the next poll time, and a poller is scheduled again only
+    after its poll is finished.
+    """
+    def __init__(self, max_workers=4):
+        """
+        Constructor
+        :param max_workers: Number of the worker threads
+        """
+        self.max_workers = max_workers
+        self.heap = []
+        self.count = 0              # Tie breaker of the heap
+        self.cond = threading.Condition()
+        self.executor = None
+        self.thread = None
+        self.stopped = False
+
+    def start(self):
+        """
+        Start the scheduler thread
+        :return Scheduler thread
+        """
+        if self.thread is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            self.thread = threading.Thread(target=self.run)
+            self.thread.daemon = True
+            self.thread.start()
+        return self.thread
+
+    def add_poller(self, poller):
+        """
+        Schedule the poller immediately
+        :param poller: Poller object
+        :return Scheduler thread
+        """
+        self.schedule(poller, time.time())
+        return self.start()
+
+    def schedule(self, poller, next_time):
+        """
+        Put the poller in the heap
+        :param poller: Poller object
+        :param next_time: Time of the next poll
+        """
+        self.cond.acquire()
+        poller.next_time = next_time
+        self.count += 1
+        heapq.heappush(self.heap, (next_time, self.count, poller))
+        self.cond.notify()
+        self.cond.release()
+
+    def run(self):
+        """
+        Scheduler thread. Submits the due pollers to the workers.
+        """
+        while True:
+            self.cond.acquire()
+            while not self.stopped and (len(self.heap) == 0 or self.heap[0][0] > time.time()):
+                self.cond.wait(self.heap[0][0] - time.time() if len(self.heap) > 0 else None)
+            if self.stopped:
+                self.cond.release()
+                break
+            next_time, count, poller = heapq.heappop(self.heap)
+            self.cond.release()
+
+            if not poller.has_token:
+                delay = poller.reserve()
+                if delay > 0:
+                    self.schedule(poller, time.time() + delay)
+                    continue
+
+            self.executor.submit(self.execute, poller)
+
+    def execute(self, poller):
+        """
+        Poll on the worker thread and schedule the next poll
+        :param poller: Poller object
+        """
+        start_time = time.time()
+        interval = poller.execute()
+        self.schedule(poller, max(start_time + interval, time.time()))
+
+    def stop(self):
+        """
+        Stop the scheduler
+        """
+        self.cond.acquire()
+        self.stopped = True
+        self.cond.notify()
+        self.cond.release()
+        if self.thread is not None:
+            self.thread.join()
+            self.executor.shutdown(wait=False)
+            self.thread = None
@@ -0,0 +1,324 @@
+from database_client import DatabaseClient
+from collections import deque
+from util import Logger
+import threading
+import time
+import json
+import os
+
+class QueuedClient(DatabaseClient):
+    """
+    Queued client. Insertions are put into a bounded queue and written to the
+    underlying database client by a dedicated writer thread, so that the
+    exchange callbacks are not blocked by the database I/O.
+    """
+
+    class OverflowPolicy:
+        BLOCK = 0
+        DROP_OLDEST = 1
+        SPILL = 2
+
+        @staticmethod
+        def parse(value):
+            """
+            Decode the policy name
+            :param value: Policy name, i.e. block, drop or spill
+            :return: Overflow policy
+            """
+            value = value.lower()
+            if value == 'block':
+                return QueuedClient.OverflowPolicy.BLOCK
+            elif value == 'drop' or value == 'drop_oldest':
+                return QueuedClient.OverflowPolicy.DROP_OLDEST
+            elif value == 'spill':
+                return QueuedClient.OverflowPolicy.SPILL
+            else:
+                raise Exception("Unknown overflow policy (%s)." % value)
+
+    def __init__(self, client, max_size=10000, overflow_policy=OverflowPolicy.BLOCK,
+                 spill_path='', batch_size=1000):
+        """
+        Constructor
+        :param client: Underlying database client
+        :param max_size: Maximum number of queued rows
+        :param overflow_policy: Behaviour when the queue is full
+        :param spill_path: Spill file path. Required for the spill policy.
+        :param batch_size: Maximum number of rows written before flushing the underlying client
+        """
+        DatabaseClient.__init__(self)
+        self.native_timestamp = client.native_timestamp
+        if overflow_policy == QueuedClient.OverflowPolicy.SPILL and spill_path == '':
+            raise Exception("QueuedClient requires a spill file path for the spill policy.")
+
+        self.client = client
+        self.max_size = max_size
+        self.overflow_policy = overflow_policy
+        self.spill_path = spill_path
+        self.batch_size = batch_size
+        self.queue = deque()
+        self.cond = threading.Condition()
+        self.in_flight = 0              # Rows taken by the writer but not yet committed
+        self.spill_rows = 0
+        self.spill_file = None
+        self.replay_rows = 0            # Spilled rows left in the replay file
+        self.replay_file = None
+        self.stopped = False
+        self.enqueued = 0
+        self.committed = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.latency = 0.0
+        self.max_latency = 0.0
+        self.last_latency = 0.0
+        self.writer = threading.Thread(target=self.writer_worker)
+        self.writer.daemon = True
+        self.writer.start()
+
+    def connect(self, **kwargs):
+        """
+        Connect
+        :return True if it is connected
+        """
+        return self.client.connect(**kwargs)
+
+    def create(self, table, columns, types, is_ifnotexists=True):
+        """
+        Create table in the database
+        :param table: Table name
+        :param columns: Column array
+        :param types: Type array
+        :param is_ifnotexists: Create table if not exists keyword
+        """
+        return self.client.create(table, columns, types, is_ifnotexists)
+
+    def insert(self, table, columns, values, is_orreplace=False):
+        """
+        Queue the insertion
+        :param table: Table name
+        :param columns: Column array
+        :param values: Value array
+        :param is_orreplace: Indicate if the query is "INSERT OR REPLACE"
+        """
+        if len(columns) != len(values):
+            return False
+
+        item = (table, columns, values, is_orreplace, time.time())
+        self.cond.acquire()
+        if self.stopped:
+            self.cond.release()
+            raise Exception("QueuedClient has been closed.")
+
+        if self.spill_rows > 0 or self.replay_file is not None:
+            # Keep the order once the rows are spilled
+            self.spill(item)
+        elif len(self.queue) >= self.max_size:
+            if self.overflow_policy == QueuedClient.OverflowPolicy.BLOCK:
+                while len(self.queue) >= self.max_size:
+                    self.cond.wait()
+                self.queue.append(item)
+            elif self.overflow_policy == QueuedClient.OverflowPolicy.DROP_OLDEST:
+                self.queue.popleft()
+                self.queue.append(item)
+                self.dropped += 1
+            else:
+                self.spill(item)
+        else:
+            self.queue.append(item)
+
+        self.enqueued += 1
+        self.cond.notify_all()
+        self.cond.release()
+        return True
+
+    def spill(self, item):
+        """
+        Append the item into the spill file. The condition lock must be held by the caller.
+        :param item: Queue item
+        """
+        if self.spill_file is None:
+            self.spill_file = open(self.spill_path, 'a')
+        self.spill_file.write(json.dumps(list(item)) + '\n')
+        self.spill_rows += 1
+        self.spilled += 1
+
+    def load_spill(self):
+        """
+        Take the next spilled items, at most max_size of them. The spill file is
+        rotated into the replay file, which is read in chunks and removed after it
+        is replayed, so the rows spilled in a long outage are not loaded in memory
+        at once. The rows spilled during the replay go to a new spill file.
+        The condition lock must be held by the caller.
+        :return List of items
+        """
+        replay_path = self.spill_path + '.replay'
+        if self.replay_file is None:
+            self.spill_file.close()
+            self.spill_file = None
+            os.replace(self.spill_path, replay_path)
+            self.replay_file = open(replay_path, 'r')
+            self.replay_rows = self.spill_rows
+            self.spill_rows = 0
+
+        items = []
+        while len(items) < self.max_size:
+            line = self.replay_file.readline()
+            if line == '':
+                break
+            items.append(tuple(json.loads(line)))
+
+        self.replay_rows = max(0, self.replay_rows - len(items))
+        if len(items) < self.max_size or self.replay_rows == 0:
+            self.replay_file.close()
+            self.replay_file = None
+            self.replay_rows = 0
+            os.remove(replay_path)
+        return items
+
+    def writer_worker(self):
+        """
+        Writer thread. Takes the queued rows and inserts them to the underlying client.
+        """
+        while True:
+            self.cond.acquire()
+            while len(self.queue) == 0 and self.spill_rows == 0 and self.replay_rows == 0 and \
+                  not self.stopped:
+                self.cond.wait()
+
+            if len(self.queue) > 0:
+                count = min(self.batch_size, len(self.queue))
+                batch = [self.queue.popleft() for i in range(0, count)]
+            elif self.spill_rows > 0 or self.replay_rows > 0:
+                batch = self.load_spill()
+                if len(batch) == 0:
+                    self.cond.release()
+                    continue
+            else:
+                # Stopped and drained
+                self.cond.release()
+                break
+
+            self.in_flight = len(batch)
+            self.cond.notify_all()
+            self.cond.release()
+
+            for table, columns, values, is_orreplace, enqueue_time in batch:
+                try:
+                    self.client.insert(table, columns, values, is_orreplace)
+                except Exception as e:
+                    Logger.error(self.__class__.__name__, "Insertion error: %s\nTable: %s" % (e, table))
+
+            try:
+                self.client.flush()
+            except Exception as e:
+                Logger.error(self.__class__.__name__, "Flush error: %s" % e)
+
+            commit_time = time.time()
+            self.cond.acquire()
+            for item in batch:
+                latency = commit_time - item[4]
+                self.latency += latency
+                self.max_latency = max(self.max_latency, latency)
+            self.last_latency = commit_time - batch[-1][4]
+            self.committed += len(batch)
+            self.in_flight = 0
+            self.cond.notify_all()
+            self.cond.release()
+
+    def flush(self):
+        """
+        Block until all the queued rows are committed
+        :return True if the rows are flushed
+        """
+        self.cond.acquire()
+        while (len(self.queue) > 0 or self.spill_rows > 0 or self.replay_rows > 0 or self.in_flight > 0) and \
+              self.writer.is_alive():
+            self.cond.wait()
+        self.cond.release()
+        return True
+
+    def select(self, table, columns=['*'], condition='', orderby='', limit=0, isFetchAll=True):
+        """
+        Select rows from the table after the queued rows are committed
+        :param table: Table name
+        :param columns: Selected columns
+        :param condition: Where condition
+        :param orderby: Order by condition
+        :param limit: Rows limit
+        :param isFetchAll: Indicator of fetching all
+        :return Result rows
+        """
+        self.flush()
+        return self.client.select(table, columns, condition, orderby, limit, isFetchAll)
+
+    def iter_select(self, table, columns=['*'], condition='', orderby='', limit=0,
+                    chunk_size=1000, is_chunked=False):
+        """
+        Select rows from the table lazily after the queued rows are committed
+        :param table: Table name
+        :param columns: Selected columns
+        :param condition: Where condition
+        :param orderby: Order by condition
+        :param limit: Rows limit
+        :param chunk_size: Number of rows fetched at a time
+        :param is_chunked: Yield lists of rows instead of single rows
+        :return Generator of rows, or lists of rows if is_chunked is True
+        """
+        self.flush()
+        return self.client.iter_select(table, columns, condition, orderby, limit,
+                                       chunk_size, is_chunked)
+
+    def delete(self, table, condition='1==1'):
+        """
+        Delete rows from the table after the queued rows are committed
+        :param table: Table name
+        :param condition: Where condition
+        """
+        self.flush()
+        return self.client.delete(table, condition)
+
+    def list_tables(self):
+        """
+        List the tables after the queued rows are committed
+        :return List of table names
+        """
+        self.flush()
+        return self.client.list_tables()
+
+    def compress(self, table, method='gzip'):
+        """
+        Compress the table of the underlying client
+        :param table: Table name
+        :param method: Compression method
+        :return True if the table is compressed
+        """
+        return self.client.compress(table, method)
+
+    def get_stats(self):
+        """
+        Get the statistics of the queue. Latencies are in milliseconds.
+        :return Dictionary of statistics
+        """
+        self.cond.acquire()
+        ret = {'queue_depth': len(self.queue) + self.spill_rows + self.replay_rows + self.in_flight,
+               'spill_rows': self.spill_rows + self.replay_rows,
+               'enqueued': self.enqueued,
+               'committed': self.committed,
+               'dropped': self.dropped,
+               'spilled': self.spilled,
+               'last_latency': self.last_latency * 1000,
+               'avg_latency': self.latency * 1000 / self.committed if self.committed > 0 else 0.0,
+               'max_latency': self.max_latency * 1000}
+        self.cond.release()
+        ret['client'] = self.client.get_stats()
+        return ret
+
+    def close(self):
+        """
+        Commit the queued rows, stop the writer thread and close the underlying client
+        """
+        self.cond.acquire()
+        self.stopped = True
+        self.cond.notify_all()
+        self.cond.release()
+        self.writer.join()
+        return self.client.close()
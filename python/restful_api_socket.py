@@ -1,15 +1,14 @@
-try:
-    import urllib.request as urlrequest
-except ImportError:
-    import urllib as urlrequest
-
 import json
 from api_socket import ApiSocket
+from http_client import HttpConnectionPool
 
 class RESTfulApiSocket(ApiSocket):
     """
     Generic REST API call
     """
+    # Persistent connections shared by all the RESTful sockets
+    pool = HttpConnectionPool()
+
     def __init__(self):
         """
         Constructor
@@ -23,9 +22,9 @@ class RESTfulApiSocket(ApiSocket):
         :param: url: The url link
         :return JSON object
         """
-        res = urlrequest.urlopen(url)
+        res = RESTfulApiSocket.pool.request(url)
         try:
-            res = json.loads(res.read().decode('utf8'))
+            res = json.loads(res.decode('utf8'))
             return res
         except:
             return {}
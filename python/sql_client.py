@@ -1,50 +1,136 @@
 from database_client import DatabaseClient
 import threading
-from util import Logger
+import time
+from util import Logger, TimedLock
 
 class SqlClient(DatabaseClient):
     """
     Sql client
     """
-    def __init__(self):
+    # Placeholder of the bound parameters in the statement
+    PARAM_MARKER = '?'
+
+    # Keyword of the "INSERT OR REPLACE" statement
+    INSERT_OR_REPLACE = 'insert or replace'
+
+    class TableBuffer(object):
+        """
+        Buffered rows of a table
+        """
+        def __init__(self):
+            """
+            Constructor
+            """
+            self.lock = TimedLock()
+            self.rows = dict()          # (columns, is_orreplace) -> values list
+            self.row_count = 0
+            self.first_time = 0.0       # Time of the first buffered row
+
+        def take(self):
+            """
+            Take all the buffered rows. The lock must be held by the caller.
+            :return Dictionary of buffered rows
+            """
+            rows = self.rows
+            self.rows = dict()
+            self.row_count = 0
+            return rows
+
+    def __init__(self, batch_size=0, batch_interval=0):
         """
         Constructor
+        :param batch_size: Number of buffered rows which triggers a flush. Zero means no
+                           row count threshold.
+        :param batch_interval: Maximum time (in milliseconds) a buffered row waits before
+                               a flush. Zero means no time threshold.
+                               Rows are committed one by one if both thresholds are zero.
         """
         DatabaseClient.__init__(self)
         self.conn = None
         self.cursor = None
-        self.lock = threading.Lock()
+        self.lock = TimedLock()         # Connection lock
+        self.insert_stmts = dict()      # (table, columns, is_orreplace) -> insert statement
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.table_buffers = dict()     # table -> TableBuffer
+        self.table_buffers_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.flush_count = 0
+        self.flush_rows = 0
+        self.flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self.last_flush_latency = 0.0
+        self.flush_event = threading.Event()
+        self.flush_thread = None
 
-    @staticmethod
-    def convert_str(val):
-        """
-        Convert the value to string
-        :param val: Can be string, int or float
-        :return:
-        """
-        if isinstance(val, str):
-            return "'" + val + "'"
-        elif isinstance(val, int):
-            return str(val)
-        elif isinstance(val, float):
-            return "%.8f" % val
-        else:
-            raise Exception("Cannot convert value (%s) to string. Value is not string, integer nor float" %\
-                            val)
+        if self.batch_interval > 0:
+            self.flush_thread = threading.Thread(target=self.flush_worker)
+            self.flush_thread.daemon = True
+            self.flush_thread.start()
+
+    def get_lock(self):
+        """
+        Get the lock guarding the connection used by the current thread
+        :return Lock
+        """
+        return self.lock
+
+    def get_lock_stats(self):
+        """
+        Get the statistics of the connection lock
+        :return Dictionary of statistics
+        """
+        return self.lock.get_stats()
 
-    def execute(self, sql):
+    def get_table_buffer(self, table):
+        """
+        Get the buffer of the table
+        :param table: Table name
+        :return TableBuffer object
+        """
+        buf = self.table_buffers.get(table)
+        if buf is None:
+            self.table_buffers_lock.acquire()
+            buf = self.table_buffers.setdefault(table, SqlClient.TableBuffer())
+            self.table_buffers_lock.release()
+        return buf
+
+    def is_batched(self):
+        """
+        Indicate if the insertion is buffered
+        :return True if rows are buffered before committing
+        """
+        return self.batch_size > 0 or self.batch_interval > 0
+
+    def execute(self, sql, params=None):
         """
         Execute the sql command
         :param sql: SQL command
+        :param params: Bound parameters
         """
         return True
 
+    def executemany(self, sql, params_list):
+        """
+        Execute the sql command for each set of bound parameters
+        :param sql: SQL command
+        :param params_list: List of bound parameters
+        """
+        for params in params_list:
+            self.execute(sql, params)
+
     def commit(self):
         """
         Commit
         """
         return True
 
+    def rollback(self):
+        """
+        Rollback
+        """
+        return True
+
     def fetchone(self):
         """
         Fetch one record
@@ -80,10 +166,11 @@ class SqlClient(DatabaseClient):
         else:
             sql = "create table %s (%s)" % (table, column_names)
 
-        self.lock.acquire()
+        lock = self.get_lock()
+        lock.acquire()
         self.execute(sql)
         self.commit()
-        self.lock.release()
+        lock.release()
         return True
 
     def insert(self, table, columns, values, is_orreplace=False):
@@ -97,33 +184,187 @@ class SqlClient(DatabaseClient):
         if len(columns) != len(values):
             return False
 
-        column_names = ','.join(columns)
-        value_string = ','.join([SqlClient.convert_str(e) for e in values])
-        if is_orreplace:
-            sql = "insert or replace into %s (%s) values (%s)" % (table, column_names, value_string)
-        else:
-            sql = "insert into %s (%s) values (%s)" % (table, column_names, value_string)
-        self.lock.acquire()
+        if self.is_batched():
+            key = (tuple(columns), is_orreplace)
+            buf = self.get_table_buffer(table)
+            buf.lock.acquire()
+            if buf.row_count == 0:
+                buf.first_time = time.time()
+            rows = buf.rows.get(key)
+            if rows is None:
+                buf.rows[key] = [values]
+            else:
+                rows.append(values)
+            buf.row_count += 1
+            pending = buf.take() if self.is_flush_due(buf) else None
+            buf.lock.release()
+
+            if pending is not None:
+                self.write_rows({table: pending})
+            return True
+
+        sql = self.insert_statement(table, columns, is_orreplace)
+        lock = self.get_lock()
+        lock.acquire()
 
         try:
-            self.execute(sql)
+            self.execute(sql, values)
             self.commit()
         except Exception as e:
-            Logger.info(self.__class__.__name__, "SQL error: %s\nSQL: %s" % (e, sql))
+            Logger.info(self.__class__.__name__, "SQL error: %s\nSQL: %s\nValues: %s" % (e, sql, values))
 
-        self.lock.release()
+        lock.release()
         return True
 
-    def select(self, table, columns=['*'], condition='', orderby='', limit=0, isFetchAll=True):
+    def insert_statement(self, table, columns, is_orreplace=False):
         """
-        Select rows from the table
+        Get the parameterized insert statement. The statement is cached so that
+        the database can reuse the prepared statement.
+        :param table: Table name
+        :param columns: Column array
+        :param is_orreplace: Indicate if the query is "INSERT OR REPLACE"
+        :return SQL command
+        """
+        key = (table, tuple(columns), is_orreplace)
+        sql = self.insert_stmts.get(key)
+        if sql is None:
+            markers = ','.join([self.PARAM_MARKER] * len(columns))
+            sql = "%s into %s (%s) values (%s)" % \
+                  (self.INSERT_OR_REPLACE if is_orreplace else 'insert', table, ','.join(columns), markers)
+            self.insert_stmts[key] = sql
+        return sql
+
+    def is_flush_due(self, buf):
+        """
+        Check if the buffered rows of the table reach either the row count or time
+        threshold. The buffer lock must be held by the caller.
+        :param buf: TableBuffer object
+        :return True if the buffered rows should be flushed
+        """
+        if buf.row_count == 0:
+            return False
+        elif self.batch_size > 0 and buf.row_count >= self.batch_size:
+            return True
+        elif self.batch_interval > 0 and \
+             (time.time() - buf.first_time) * 1000 >= self.batch_interval:
+            return True
+        else:
+            return False
+
+    def flush_worker(self):
+        """
+        Flush the buffered rows when the time threshold is reached
+        """
+        while not self.flush_event.wait(self.batch_interval / 1000.0):
+            pending = dict()
+            for table, buf in list(self.table_buffers.items()):
+                buf.lock.acquire()
+                if self.is_flush_due(buf):
+                    pending[table] = buf.take()
+                buf.lock.release()
+
+            if len(pending) > 0:
+                self.write_rows(pending)
+
+    def flush(self):
+        """
+        Flush the buffered rows of all the tables in a single transaction
+        :return True if the rows are flushed
+        """
+        pending = dict()
+        for table, buf in list(self.table_buffers.items()):
+            buf.lock.acquire()
+            if buf.row_count > 0:
+                pending[table] = buf.take()
+            buf.lock.release()
+
+        if len(pending) > 0:
+            self.write_rows(pending)
+        return True
+
+    def write_rows(self, pending):
+        """
+        Write the rows in a single transaction
+        :param pending: Dictionary of table to the buffered rows
+        """
+        row_count = 0
+        lock = self.get_lock()
+        lock.acquire()
+        start_time = time.time()
+        try:
+            try:
+                for table, table_rows in pending.items():
+                    for key, rows in table_rows.items():
+                        columns, is_orreplace = key
+                        self.executemany(self.insert_statement(table, columns, is_orreplace), rows)
+                        row_count += len(rows)
+                self.commit()
+            except Exception as e:
+                # Fall back to row by row insertion so that only the failed rows are discarded
+                Logger.info(self.__class__.__name__, "SQL error in batch insertion: %s" % e)
+                row_count = 0
+                try:
+                    self.rollback()
+                    for table, table_rows in pending.items():
+                        for key, rows in table_rows.items():
+                            columns, is_orreplace = key
+                            sql = self.insert_statement(table, columns, is_orreplace)
+                            for values in rows:
+                                try:
+                                    self.execute(sql, values)
+                                except Exception as e:
+                                    Logger.info(self.__class__.__name__, "SQL error: %s\nSQL: %s\nValues: %s" % \
+                                                (e, sql, values))
+                            row_count += len(rows)
+                    self.commit()
+                except Exception as e:
+                    # e.g. The connection is lost. The rows are discarded.
+                    Logger.error(self.__class__.__name__, "SQL error in committing the rows: %s" % e)
+                    row_count = 0
+
+            latency = time.time() - start_time
+        finally:
+            lock.release()
+
+        self.stats_lock.acquire()
+        self.flush_count += 1
+        self.flush_rows += row_count
+        self.flush_latency += latency
+        self.last_flush_latency = latency
+        self.max_flush_latency = max(self.max_flush_latency, latency)
+        self.stats_lock.release()
+
+    def get_stats(self):
+        """
+        Get the statistics of the batched insertion and the locks. Latencies are in
+        milliseconds.
+        :return Dictionary of statistics
+        """
+        self.stats_lock.acquire()
+        ret = {'flush_count': self.flush_count,
+               'flush_rows': self.flush_rows,
+               'pending_rows': sum([buf.row_count for buf in list(self.table_buffers.values())]),
+               'avg_batch_size': self.flush_rows / self.flush_count if self.flush_count > 0 else 0.0,
+               'last_flush_latency': self.last_flush_latency * 1000,
+               'avg_flush_latency': self.flush_latency * 1000 / self.flush_count \
+                                    if self.flush_count > 0 else 0.0,
+               'max_flush_latency': self.max_flush_latency * 1000}
+        self.stats_lock.release()
+        ret['lock'] = self.get_lock_stats()
+        ret['table_locks'] = dict([(table, buf.lock.get_stats()) \
+                                   for table, buf in list(self.table_buffers.items())])
+        return ret
+
+    @staticmethod
+    def select_sql(table, columns=['*'], condition='', orderby='', limit=0):
+        """
+        Build the select statement
         :param table: Table name
         :param columns: Selected columns
         :param condition: Where condition
         :param orderby: Order by condition
         :param limit: Rows limit
-        :param isFetchAll: Indicator of fetching all
-        :return Result rows
+        :return SQL command
         """
         sql = "select %s from %s" % (','.join(columns), table)
         if len(condition) > 0:
@@ -135,15 +376,92 @@ class SqlClient(DatabaseClient):
         if limit > 0:
             sql += " limit %d" % limit
 
-        self.lock.acquire()
+        return sql
+
+    def open_stream_cursor(self):
+        """
+        Open a cursor for streaming the result rows
+        :return Cursor and the lock guarding it. The lock is None if the cursor
+                is not shared with the other threads.
+        """
+        raise Exception("Streaming select is not supported in %s." % self.__class__.__name__)
+
+    def close_stream_cursor(self, cursor):
+        """
+        Close the streaming cursor
+        :param cursor: Cursor from open_stream_cursor
+        """
+        cursor.close()
+
+    def iter_select(self, table, columns=['*'], condition='', orderby='', limit=0,
+                    chunk_size=1000, is_chunked=False):
+        """
+        Select rows from the table lazily. The rows are fetched chunk by chunk
+        from a dedicated cursor, and the connection lock is only held while
+        fetching a chunk.
+        :param table: Table name
+        :param columns: Selected columns
+        :param condition: Where condition
+        :param orderby: Order by condition
+        :param limit: Rows limit
+        :param chunk_size: Number of rows fetched at a time
+        :param is_chunked: Yield lists of rows instead of single rows
+        :return Generator of rows, or lists of rows if is_chunked is True
+        """
+        sql = self.select_sql(table, columns, condition, orderby, limit)
+        self.flush()
+        cursor, lock = self.open_stream_cursor()
+        try:
+            if lock is not None:
+                lock.acquire()
+            try:
+                cursor.execute(sql)
+            finally:
+                if lock is not None:
+                    lock.release()
+
+            while True:
+                if lock is not None:
+                    lock.acquire()
+                try:
+                    rows = cursor.fetchmany(chunk_size)
+                finally:
+                    if lock is not None:
+                        lock.release()
+
+                if len(rows) == 0:
+                    break
+                elif is_chunked:
+                    yield rows
+                else:
+                    for row in rows:
+                        yield row
+        finally:
+            self.close_stream_cursor(cursor)
+
+    def select(self, table, columns=['*'], condition='', orderby='', limit=0, isFetchAll=True):
+        """
+        Select rows from the table
+        :param table: Table name
+        :param columns: Selected columns
+        :param condition: Where condition
+        :param orderby: Order by condition
+        :param limit: Rows limit
+        :param isFetchAll: Indicator of fetching all
+        :return Result rows
+        """
+        sql = self.select_sql(table, columns, condition, orderby, limit)
+        self.flush()
+        lock = self.get_lock()
+        lock.acquire()
         self.execute(sql)
         if isFetchAll:
             ret = self.fetchall()
-            self.lock.release()
+            lock.release()
             return ret
         else:
             ret = self.fetchone()
-            self.lock.release()
+            lock.release()
             return ret
 
     def delete(self, table, condition='1==1'):
@@ -156,8 +474,24 @@ class SqlClient(DatabaseClient):
         if len(condition) > 0:
             sql += " where %s" % condition
 
-        self.lock.acquire()
+        self.flush()
+        lock = self.get_lock()
+        lock.acquire()
         self.execute(sql)
         self.commit()
-        self.lock.release()
+        lock.release()
+        return True
+
+    def close(self):
+        """
+        Flush the buffered rows and close connection
+        """
+        self.flush_event.set()
+        self.flush()
+        if self.conn is not None:
+            self.lock.acquire()
+            self.conn.close()
+            self.conn = None
+            self.cursor = None
+            self.lock.release()
         return True
@@ -1,52 +1,199 @@
 #!/bin/python
 
 import sqlite3
+import threading
 from sql_client import SqlClient
+from util import TimedLock
 
 class SqliteClient(SqlClient):
     """
     Sqlite client
     """
-    def __init__(self):
+    def __init__(self, batch_size=0, batch_interval=0):
         """
         Constructor
+        :param batch_size: Number of buffered rows which triggers a flush
+        :param batch_interval: Maximum time (in milliseconds) a buffered row waits before a flush
         """
-        SqlClient.__init__(self)
+        SqlClient.__init__(self, batch_size=batch_size, batch_interval=batch_interval)
+        self.path = ''
+        self.is_per_thread = False
+        self.local = threading.local()
+        self.thread_conns = []          # List of (thread, connection, lock) opened by the threads
+        self.thread_conns_lock = threading.Lock()
 
     def connect(self, **kwargs):
         """
         Connect
         :param path: sqlite file to connect
+        :param per_thread: Open one WAL connection per thread instead of sharing a single
+                           connection. Not supported for in-memory database.
         """
-        path = kwargs['path']
-        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.path = kwargs['path']
+        self.is_per_thread = kwargs.get('per_thread', False)
+        if self.is_per_thread and self.path == ':memory:':
+            raise Exception("SqliteClient does not support connection per thread for in-memory database.")
+
+        # Keep the prepared insert statements of all the tables in the statement cache
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=1024)
+        if self.is_per_thread:
+            self.conn.execute('pragma journal_mode=wal')
         self.cursor = self.conn.cursor()
         return self.conn is not None and self.cursor is not None
-        
-    def execute(self, sql):
+
+    def get_connection(self):
+        """
+        Get the connection and cursor used by the current thread
+        :return Connection and cursor
+        """
+        if not self.is_per_thread:
+            return self.conn, self.cursor
+
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            # Writers wait on the database lock instead of failing immediately
+            conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=1024,
+                                   timeout=60)
+            self.local.conn = conn
+            self.local.cursor = conn.cursor()
+            self.local.lock = TimedLock()
+            self.thread_conns_lock.acquire()
+            self.prune_connections()
+            self.thread_conns.append((threading.current_thread(), conn, self.local.lock))
+            self.thread_conns_lock.release()
+
+        return conn, self.local.cursor
+
+    def prune_connections(self):
+        """
+        Close the connections of the ended threads, e.g. the short-lived workers.
+        The connection list lock must be held by the caller.
+        """
+        alive = []
+        for thread, conn, lock in self.thread_conns:
+            if thread.is_alive():
+                alive.append((thread, conn, lock))
+            else:
+                conn.close()
+        self.thread_conns = alive
+
+    def get_lock(self):
+        """
+        Get the lock guarding the connection used by the current thread
+        :return Lock
+        """
+        if not self.is_per_thread:
+            return self.lock
+
+        self.get_connection()
+        return self.local.lock
+
+    def get_lock_stats(self):
+        """
+        Get the statistics of the connection locks
+        :return Dictionary of statistics
+        """
+        if not self.is_per_thread:
+            return self.lock.get_stats()
+
+        ret = {'count': 0, 'contended_count': 0, 'wait_time': 0.0, 'avg_wait_time': 0.0,
+               'max_wait_time': 0.0, 'connections': len(self.thread_conns)}
+        for thread, conn, lock in list(self.thread_conns):
+            stats = lock.get_stats()
+            ret['count'] += stats['count']
+            ret['contended_count'] += stats['contended_count']
+            ret['wait_time'] += stats['wait_time']
+            ret['max_wait_time'] = max(ret['max_wait_time'], stats['max_wait_time'])
+        if ret['count'] > 0:
+            ret['avg_wait_time'] = ret['wait_time'] / ret['count']
+        return ret
+
+    def execute(self, sql, params=None):
         """
         Execute the sql command
         :param sql: SQL command
+        :param params: Bound parameters
+        """
+        conn, cursor = self.get_connection()
+        if params is None:
+            cursor.execute(sql)
+        else:
+            cursor.execute(sql, params)
+
+    def executemany(self, sql, params_list):
+        """
+        Execute the sql command for each set of bound parameters
+        :param sql: SQL command
+        :param params_list: List of bound parameters
         """
-        self.cursor.execute(sql)
-        
+        conn, cursor = self.get_connection()
+        cursor.executemany(sql, params_list)
+
     def commit(self):
         """
         Commit
-        """    
-        self.conn.commit()
-        
+        """
+        conn, cursor = self.get_connection()
+        conn.commit()
+
+    def rollback(self):
+        """
+        Rollback
+        """
+        conn, cursor = self.get_connection()
+        conn.rollback()
+
     def fetchone(self):
         """
         Fetch one record
         :return Record
-        """        
-        return self.cursor.fetchone()     
+        """
+        conn, cursor = self.get_connection()
+        return cursor.fetchone()
 
     def fetchall(self):
         """
         Fetch all records
         :return Record
-        """        
-        return self.cursor.fetchall()
+        """
+        conn, cursor = self.get_connection()
+        return cursor.fetchall()
 
+    def list_tables(self):
+        """
+        List the tables in the database
+        :return List of table names
+        """
+        self.flush()
+        lock = self.get_lock()
+        lock.acquire()
+        try:
+            self.execute("select name from sqlite_master where type='table' order by name")
+            ret = [row[0] for row in self.fetchall()]
+        finally:
+            lock.release()
+        return ret
+
+    def open_stream_cursor(self):
+        """
+        Open a cursor for streaming the result rows
+        :return Cursor and the lock guarding it
+        """
+        lock = self.get_lock()
+        lock.acquire()
+        conn, cursor = self.get_connection()
+        stream_cursor = conn.cursor()
+        lock.release()
+        return stream_cursor, lock
+
+    def close(self):
+        """
+        Flush the buffered rows and close connections
+        """
+        SqlClient.close(self)
+        self.thread_conns_lock.acquire()
+        for thread, conn, lock in self.thread_conns:
+            conn.close()
+        self.thread_conns = []
+        self.thread_conns_lock.release()
+        return True
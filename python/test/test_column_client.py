@@ -0,0 +1,124 @@
+#!/bin/python
+
+import unittest
+import shutil
+import struct
+import os
+from column_client import ColumnClient, np
+from file_client import FileClient
+from market_data import Trade, L2Depth
+from util import Logger
+
+path = 'columnclienttest'
+table_name = 'test_query'
+columns = ['id', 'date_time', 'trade_id', 'trade_price', 'trade_volume']
+types = ['int PRIMARY KEY', 'text', 'text', 'decimal(10,5)', 'decimal(20,8)']
+
+class ColumnClientTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        Logger.init_log()
+        cls.db_client = ColumnClient(dir=path)
+        cls.db_client.create(table_name, columns, types)
+        for i in range(1, 11):
+            cls.db_client.insert(table_name, columns,
+                                 [i, '20161026 10:00:%02d.123456' % i, 'T%d' % i, 100.0 + i, 0.5 * i])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db_client.close()
+        shutil.rmtree(path)
+
+    def test_query(self):
+        row = self.db_client.select(table=table_name)
+        self.assertEqual(len(row), 10)
+        self.assertEqual(row[0], [1, '20161026 10:00:01.123456', 'T1', 101.0, 0.5])
+
+        # Records are in fixed size
+        self.assertEqual(os.path.getsize(os.path.join(path, table_name + '.col')),
+                         10 * (8 * 4 + 48))
+
+        row = self.db_client.select(table=table_name, columns=['id', 'trade_id'],
+                                    orderby='id desc', limit=2)
+        self.assertEqual(row, [[10, 'T10'], [9, 'T9']])
+
+        row = self.db_client.select(table=table_name, columns=['id'],
+                                    condition="id>=4 and id<7 or trade_id='T9'")
+        self.assertEqual(row, [[4], [5], [6], [9]])
+
+        row = self.db_client.select(table=table_name, columns=['id'],
+                                    condition="date_time>'20161026 10:00:08'")
+        self.assertEqual(row, [[8], [9], [10]])
+
+        self.assertRaises(Exception, self.db_client.insert, table_name, columns,
+                          [11, '20161026 10:00:11.000000', 'T' * 100, 1.0, 1.0])
+        self.assertRaises(Exception, self.db_client.insert, table_name, columns,
+                          [1, '20161026 10:00:01.123456', 'T1', 1.0, 1.0], True)
+
+    def test_timestamp(self):
+        ns = ColumnClient.to_nanoseconds('20161026 10:00:01.123456')
+        self.assertEqual(ns, 1477476001123456000)
+        self.assertEqual(ColumnClient.from_nanoseconds(ns), '20161026 10:00:01.123456')
+
+    def test_layout(self):
+        # The NumPy record type matches the struct layout of the records
+        schema = self.db_client.get_schema(table_name)
+        fmt = '<'
+        for name, dtype in schema.dtype():
+            if dtype[0] == 'S':
+                fmt += dtype[1:] + 's'
+            else:
+                fmt += {'<i8': 'q', '<f8': 'd', 'i1': 'b', '<i2': 'h'}[dtype]
+        self.assertEqual(struct.calcsize(fmt), schema.record_size)
+        self.db_client.flush()
+        with open(os.path.join(path, table_name + '.col'), 'rb') as f:
+            values = struct.unpack(fmt, f.read(schema.record_size))
+        self.assertEqual(values, (1, 1477476001123456000, b'T1' + b'\0' * 46,
+                                  101.0, 0.5))
+
+    def test_size(self):
+        file_client = FileClient(dir=os.path.join(path, 'csv'))
+        tables = [('trades', ['id'] + Trade.columns(), ['int primary key'] + Trade.types()),
+                  ('book', ['id'] + L2Depth.columns(), ['int primary key'] + L2Depth.types())]
+        for name, cols, col_types in tables:
+            self.db_client.create(name, cols, col_types)
+            file_client.create(name, cols, col_types)
+
+        for i in range(1, 101):
+            trade = Trade()
+            trade.timestamp = 1477476001123456000 + i * 1000000
+            trade.trade_id = str(123456789 + i)
+            trade.trade_price = 650.0 + i % 7 * 0.13
+            trade.trade_volume = 0.0125 * (i % 11)
+            trade.trade_side = Trade.Side.BUY
+            l2_depth = L2Depth(5)
+            l2_depth.timestamp = trade.timestamp
+            for j in range(0, 5):
+                l2_depth.bids[j].price = 650.0 - j * 0.1
+                l2_depth.bids[j].volume = 0.5 * (i % 7 + j)
+                l2_depth.asks[j].price = 650.1 + j * 0.1
+                l2_depth.asks[j].volume = 0.25 * (i % 5 + j)
+            for client in [self.db_client, file_client]:
+                client.insert('trades', tables[0][1], [i] + trade.values(client.native_timestamp))
+                client.insert('book', tables[1][1], [i] + l2_depth.values(client.native_timestamp))
+        self.db_client.flush()
+        file_client.close()
+
+        # The trade side is one byte and the trade id is 48 bytes, while the shared
+        # schema declares them as text
+        self.assertEqual(Trade.types()[1:], ['text', 'decimal(10,5)', 'decimal(20,8)', 'text'])
+        self.assertEqual(self.db_client.get_schema('trades').record_size, 8 * 4 + 48 + 1)
+        for name in ['trades', 'book']:
+            self.assertEqual(os.path.getsize(os.path.join(path, name + '.col')),
+                             100 * self.db_client.get_schema(name).record_size)
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_load(self):
+        data = self.db_client.load(table_name)
+        self.assertEqual(len(data), 10)
+        self.assertEqual(data.trade_price[0], 101.0)
+        data = self.db_client.load(table_name, '20161026 10:00:03', '20161026 10:00:05.5')
+        self.assertEqual(list(data.id), [3, 4, 5])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+#!/bin/python
+
+import unittest
+from market_data import Trade
+from instrument import Instrument
+from exch_btcc import ExchGwBtcc
+from sqlite_client import SqliteClient
+
+class ApiSocketStub(object):
+    """
+    API socket returning the same window of trades on every request, as the
+    since parameter of BTCC is not advanced by the socket
+    """
+    def __init__(self):
+        self.trades = []
+
+    def get_trades(self, instmt):
+        return list(self.trades)
+
+class ExchGwBtccTest(unittest.TestCase):
+    def test_poll_trades(self):
+        db_client = SqliteClient()
+        db_client.connect(path=':memory:')
+        exch = ExchGwBtcc(db_client)
+        exch.api_socket = ApiSocketStub()
+        instmt = Instrument('BTCC', 'BTCCNY', 'btccny')
+        instmt.set_trades_table_name(exch.get_trades_table_name('BTCC', 'BTCCNY'))
+        exch.init_trades(instmt)
+
+        def add_trade(trade_id):
+            trade = Trade()
+            trade.date_time = '20161026 10:00:00.000000'
+            trade.trade_id = str(trade_id)
+            trade.trade_price = 100.0
+            trade.trade_volume = 1.0
+            exch.api_socket.trades.append(trade)
+
+        self.assertFalse(exch.poll_trades(instmt))
+        add_trade(10)
+        add_trade(11)
+        self.assertTrue(exch.poll_trades(instmt))
+        self.assertFalse(exch.poll_trades(instmt))
+        add_trade(12)
+        self.assertTrue(exch.poll_trades(instmt))
+        self.assertEqual(db_client.select(instmt.get_trades_table_name(), columns=['id', 'trade_id']),
+                         [(1, '10'), (2, '11'), (3, '12')])
+        self.assertEqual(instmt.get_exch_trade_id(), 12)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+#!/bin/python
+
+import unittest
+import threading
+import time
+from market_data import L2Depth, Trade
+from instrument import Instrument
+from exchange import ExchangeGateway
+from sqlite_client import SqliteClient
+from util import Logger
+
+class ExchangeGatewayTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        Logger.init_log()
+
+    def test_conflation(self):
+        db_client = SqliteClient()
+        db_client.connect(path=':memory:')
+        exch = ExchangeGateway(None, db_client)
+        instmt = Instrument('Test', 'XBTUSD', 'xbtusd', book_conflation_ms='50')
+        instmt.set_order_book_table_name(exch.get_order_book_table_name('Test', 'XBTUSD'))
+        instmt.set_order_book_id(exch.get_order_book_init(instmt))
+        l2_depth = L2Depth(5)
+        instmt.set_l2_depth(l2_depth)
+
+        def update(bid, bid_volume):
+            l2_depth.bids[0].price = bid
+            l2_depth.bids[0].volume = bid_volume
+            l2_depth.asks[0].price = 101.0
+            exch.record_order_book(instmt)
+            return db_client.select(instmt.get_order_book_table_name(), columns=['id', 'bq1'])
+
+        # The first book and the change of the best prices are recorded immediately
+        self.assertEqual(update(100.0, 1.0), [(1, 1.0)])
+        self.assertEqual(update(100.0, 2.0), [(1, 1.0)])
+        self.assertEqual(update(100.0, 3.0), [(1, 1.0)])
+        self.assertEqual(update(100.5, 4.0), [(1, 1.0), (2, 4.0)])
+
+        # The pending book is recorded after the interval
+        self.assertEqual(update(100.5, 5.0), [(1, 1.0), (2, 4.0)])
+        l2_depth.bids[0].volume = 6.0
+        time.sleep(0.2)
+        self.assertEqual(db_client.select(instmt.get_order_book_table_name(), columns=['id', 'bq1']),
+                         [(1, 1.0), (2, 4.0), (3, 5.0)])
+        self.assertEqual(instmt.get_l2_depth_stats()['conflated'], 1)
+
+    def test_conflation_insert_unlocked(self):
+        db_client = SqliteClient()
+        db_client.connect(path=':memory:')
+        exch = ExchangeGateway(None, db_client)
+        instmts = []
+        for name in ['XBTUSD', 'ETHUSD']:
+            instmt = Instrument('Test', name, name.lower(), book_conflation_ms='10000')
+            instmt.set_order_book_table_name(exch.get_order_book_table_name('Test', name))
+            instmt.set_order_book_id(exch.get_order_book_init(instmt))
+            l2_depth = L2Depth(5)
+            l2_depth.bids[0].price = 100.0
+            instmt.set_l2_depth(l2_depth)
+            instmts.append(instmt)
+
+        # The insertion of an instrument blocks
+        entered = threading.Event()
+        resumed = threading.Event()
+        insert_order_book = exch.insert_order_book
+
+        def blocked_insert_order_book(instmt, l2_depth=None):
+            if instmt is instmts[0]:
+                entered.set()
+                resumed.wait(5)
+            insert_order_book(instmt, l2_depth)
+
+        exch.insert_order_book = blocked_insert_order_book
+        t = threading.Thread(target=exch.record_order_book, args=(instmts[0],))
+        t.start()
+        self.assertTrue(entered.wait(5))
+
+        # The other instrument is still recorded and conflated
+        exch.record_order_book(instmts[1])
+        instmts[1].get_l2_depth().bids[0].volume = 1.0
+        exch.record_order_book(instmts[1])
+        self.assertEqual(db_client.select(instmts[1].get_order_book_table_name(), columns=['id']), [(1,)])
+        self.assertIsNotNone(instmts[1].get_conflated_l2_depth())
+        resumed.set()
+        t.join()
+        self.assertEqual(db_client.select(instmts[0].get_order_book_table_name(), columns=['id']), [(1,)])
+
+    def test_bars(self):
+        db_client = SqliteClient()
+        db_client.connect(path=':memory:')
+        exch = ExchangeGateway(None, db_client)
+        exch.BAR_FLUSH_INTERVAL = 3600
+        instmt = Instrument('Test', 'XBTUSD', 'xbtusd', bar_intervals='1s, 1m')
+        instmt.set_trades_table_name(exch.get_trades_table_name('Test', 'XBTUSD'))
+        exch.get_trades_init(instmt)
+        for i in range(0, 3):
+            trade = Trade()
+            trade.date_time = '20161026 10:00:%02d.500000' % i
+            trade.trade_price = 100.0 + i
+            trade.trade_volume = 1.0
+            instmt.incr_trade_id()
+            exch.insert_trade(instmt, trade)
+
+        self.assertEqual(db_client.select(exch.get_bars_table_name('Test', 'XBTUSD', '1s'),
+                                          columns=['id', 'date_time', 'close']),
+                         [(1, '20161026 10:00:00.000000', 100.0), (2, '20161026 10:00:01.000000', 101.0)])
+        self.assertEqual(db_client.select(exch.get_bars_table_name('Test', 'XBTUSD', '1m')), [])
+
+        # The pending bars are recorded on shutdown
+        exch.flush_bars(instmt)
+        self.assertEqual(db_client.select(exch.get_bars_table_name('Test', 'XBTUSD', '1s'),
+                                          columns=['id', 'date_time'], orderby='id desc', limit=1),
+                         [(3, '20161026 10:00:02.000000')])
+        self.assertEqual(db_client.select(exch.get_bars_table_name('Test', 'XBTUSD', '1m'),
+                                          columns=['id', 'close']),
+                         [(1, 102.0)])
+
+    def test_outage(self):
+        exch = ExchangeGateway(None)
+        instmt = Instrument('Test', 'XBTUSD', 'xbtusd')
+        instmt.set_subscribed(True)
+        exch.set_reconnected(instmt)
+        self.assertEqual(instmt.get_outage_stats()['count'], 0)
+
+        exch.set_disconnected(instmt)
+        self.assertFalse(instmt.get_subscribed())
+        self.assertTrue(instmt.get_outage_stats()['disconnected'])
+        exch.set_disconnected(instmt)
+        time.sleep(0.01)
+        exch.set_reconnected(instmt)
+        stats = instmt.get_outage_stats()
+        self.assertEqual(stats['count'], 1)
+        self.assertFalse(stats['disconnected'])
+        self.assertGreaterEqual(stats['time'], 0.01)
+        self.assertEqual(stats['time'], (instmt.get_outages()[0][1] - instmt.get_outages()[0][0]) / 1e9)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -111,6 +111,169 @@ class SqliteClientTest(unittest.TestCase):
         self.assertTrue(not self.db_client.create(table_name, columns[1::], types))
         self.assertTrue(not self.db_client.insert(table_name, columns, []))
 
+class FileClientHandleTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        Logger.init_log()
+        cls.db_client = FileClient(dir=path, max_open_files=1, flush_interval=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db_client.close()
+        os.remove(path + 'test_handle_a' + ".csv")
+        os.remove(path + 'test_handle_b' + ".csv")
+
+    def test_handle_cache(self):
+        self.assertTrue(self.db_client.create('test_handle_a', columns, types))
+        self.assertTrue(self.db_client.create('test_handle_b', columns, types))
+        for i in range(0, 3):
+            self.assertTrue(self.db_client.insert('test_handle_a', columns,
+                                                  ['20161026', '10:00:00.000000', i, 'a', 1.0]))
+            self.assertTrue(self.db_client.insert('test_handle_b', columns,
+                                                  ['20161026', '10:00:00.000000', i, 'b', 2.0]))
+
+        # Only one file is kept open and the other is closed after flushing
+        stats = self.db_client.get_stats()
+        self.assertEqual(stats['open_files'], 1)
+        self.assertEqual(stats['evict_count'], 5)
+        self.assertEqual(len(self.db_client.select(table='test_handle_a')), 3)
+        self.assertEqual(len(self.db_client.select(table='test_handle_b')), 3)
+
+class FileClientIndexTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        Logger.init_log()
+        cls.table_name = 'test_index'
+        cls.db_client = FileClient(dir=path, index_interval=100)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db_client.close()
+        os.remove(path + cls.table_name + ".csv")
+        os.remove(path + cls.table_name + ".csv.idx")
+
+    def test_index(self):
+        columns = ['id', 'date_time', 'v']
+        self.assertTrue(self.db_client.create(self.table_name, columns, ['int', 'text', 'decimal(10,5)']))
+        for i in range(1, 1001):
+            self.db_client.insert(self.table_name, columns, [i, '20161026 10:00:00.000000', i * 0.5])
+
+        # Last row
+        row = self.db_client.select(table=self.table_name, columns=['id'], orderby='id desc', limit=2)
+        self.assertEqual(row, [[1000], [999]])
+
+        # Range through the sidecar index
+        row = self.db_client.select(table=self.table_name, condition='id>=500 and id<505')
+        self.assertEqual([e[0] for e in row], [500, 501, 502, 503, 504])
+        self.assertEqual(row[0][2], 250.0)
+        self.assertTrue(os.path.isfile(path + self.table_name + ".csv.idx"))
+        index = self.db_client.indexes[self.table_name]
+        self.assertEqual(len(index.ids), 10)
+        self.assertEqual(index.min_id, 1)
+        self.assertEqual(index.max_id, 1000)
+
+        # Index is extended with the appended rows
+        for i in range(1001, 1101):
+            self.db_client.insert(self.table_name, columns, [i, '20161026 10:00:01.000000', i * 0.5])
+        row = self.db_client.select(table=self.table_name, condition='id=1050')
+        self.assertEqual(len(row), 1)
+        self.assertEqual(row[0][0], 1050)
+        self.assertEqual(index.max_id, 1100)
+        self.assertEqual(len(self.db_client.select(table=self.table_name, condition='id>2000')), 0)
+
+class FileClientConditionTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        Logger.init_log()
+        cls.table_name = 'test_condition'
+        cls.db_client = FileClient(dir=path)
+        cls.db_client.create(cls.table_name, columns, types)
+        for i in range(0, 10):
+            cls.db_client.insert(cls.table_name, columns,
+                                 ['20161026', '10:00:0%d.000000' % i, i, 'v%d' % (i % 3), i * 1.5])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db_client.close()
+        os.remove(path + cls.table_name + ".csv")
+
+    def select_keys(self, condition):
+        return [row[0] for row in self.db_client.select(table=self.table_name,
+                                                        columns=['k'],
+                                                        condition=condition)]
+
+    def test_condition(self):
+        self.assertEqual(self.select_keys("k=2"), [2])
+        self.assertEqual(self.select_keys("k != 2 and k < 4"), [0, 1, 3])
+        self.assertEqual(self.select_keys("k<=1 or k>=8"), [0, 1, 8, 9])
+        self.assertEqual(self.select_keys("(k<2 or k>7) and v='v0'"), [0, 9])
+        self.assertEqual(self.select_keys("3 > k"), [0, 1, 2])
+
+        # Column name "v" is a prefix of the column "v2"
+        self.assertEqual(self.select_keys("v2>=12 and v='v2'"), [8])
+        self.assertEqual(self.select_keys("v2>k"), list(range(1, 10)))
+
+        # Invalid conditions
+        self.assertRaises(Exception, self.db_client.select, self.table_name, ['k'], "x=1")
+        self.assertRaises(Exception, self.db_client.select, self.table_name, ['k'], "k=")
+        self.assertRaises(Exception, self.db_client.select, self.table_name, ['k'], "(k=1")
+
+    def test_iter_select(self):
+        rows = self.db_client.iter_select(table=self.table_name, columns=['k'], condition="k>=3",
+                                          chunk_size=3, is_chunked=True)
+        self.assertEqual(list(rows), [[[3], [4], [5]], [[6], [7], [8]], [[9]]])
+        rows = self.db_client.iter_select(table=self.table_name, columns=['k'], orderby='k desc',
+                                          limit=2)
+        self.assertEqual(list(rows), [[9], [8]])
+
+class FileClientCompressTest(unittest.TestCase):
+    def test_compress_during_select(self):
+        Logger.init_log()
+        table_name = 'test_compress'
+        db_client = FileClient(dir=path)
+        db_client.create(table_name, columns, types)
+        for i in range(0, 5):
+            db_client.insert(table_name, columns, ['20161026', '10:00:0%d.000000' % i, i, 'v', 1.0])
+
+        try:
+            # The file opened by the select is still read after it is compressed
+            rows = db_client.iter_select(table=table_name, columns=['k'])
+            self.assertEqual(next(rows), [0])
+            self.assertTrue(db_client.compress(table_name))
+            self.assertFalse(os.path.isfile(path + table_name + ".csv"))
+            self.assertEqual(list(rows), [[1], [2], [3], [4]])
+            self.assertEqual(db_client.select(table=table_name, columns=['k'], condition="k>=3"),
+                             [[3], [4]])
+        finally:
+            db_client.close()
+            os.remove(path + table_name + ".csv.gz")
+
+class FileClientTailTest(unittest.TestCase):
+    def test_last_rows(self):
+        Logger.init_log()
+        table_name = 'test_tail'
+        db_client = FileClient(dir=path)
+        db_client.create(table_name, columns, types)
+        for i in range(0, 5):
+            db_client.insert(table_name, columns, ['20161026', '10:00:0%d.000000' % i, i, 'v', 1.0])
+        db_client.flush()
+        file_path = path + table_name + ".csv"
+
+        try:
+            end_offset = os.path.getsize(file_path)
+            # A row partially flushed after the snapshot
+            with open(file_path, 'ab') as f:
+                f.write(b'"20161026","10:00:05.000000",5,"v",1.0\n"20161026","10:00:0')
+            with open(file_path, 'rb') as f:
+                rows = FileClient.read_last_rows(f, 2, end_offset)
+            self.assertEqual([int(row[2]) for row in rows], [4, 3])
+            with open(file_path, 'rb') as f:
+                rows = FileClient.read_last_rows(f, 2, os.path.getsize(file_path))
+            self.assertEqual([int(row[2]) for row in rows], [5, 4])
+        finally:
+            db_client.close()
+            os.remove(file_path)
+
 if __name__ == '__main__':
     unittest.main()
 
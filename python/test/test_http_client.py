@@ -0,0 +1,122 @@
+#!/bin/python
+
+import unittest
+import threading
+import gzip
+import json
+import os
+import socket
+from unittest import mock
+from socketserver import ThreadingMixIn
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from http_client import HttpConnectionPool, HttpStatusError, TimedHTTPConnection
+
+def relay(src, dst):
+    while True:
+        data = src.recv(4096)
+        if len(data) == 0:
+            break
+        dst.sendall(data)
+    dst.shutdown(socket.SHUT_WR)
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    tunnel_count = 0
+
+    def do_GET(self):
+        if self.path.startswith('/missing'):
+            body = b'missing'
+            self.send_response(404)
+        else:
+            ret = {'path': self.path}
+            if 'Proxy-Authorization' in self.headers:
+                ret['proxy_auth'] = self.headers['Proxy-Authorization']
+            body = json.dumps(ret).encode('utf8')
+            self.send_response(200)
+            if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                body = gzip.compress(body)
+                self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_CONNECT(self):
+        host, port = self.path.split(':')
+        upstream = socket.create_connection((host, int(port)))
+        Handler.tunnel_count += 1
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.flush()
+        t = threading.Thread(target=relay, args=(upstream, self.connection))
+        t.start()
+        relay(self.connection, upstream)
+        t.join()
+        upstream.close()
+        self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+class Server(ThreadingMixIn, HTTPServer):
+    # The tunnel is relayed to the same server
+    daemon_threads = True
+
+class HttpConnectionPoolTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = Server(('127.0.0.1', 0), Handler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+        cls.url = 'http://127.0.0.1:%d' % cls.server.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_request(self):
+        pool = HttpConnectionPool(timeout=5)
+        body = pool.request(self.url + '/orderbook?limit=5')
+        self.assertEqual(json.loads(body.decode('utf8')), {'path': '/orderbook?limit=5'})
+        self.assertFalse(pool.get_timing()['reused'])
+
+        # The connection is kept alive
+        pool.request(self.url + '/trades')
+        timing = pool.get_timing()
+        self.assertTrue(timing['reused'])
+        self.assertEqual(timing['connect'], 0.0)
+        stats = pool.get_stats()[self.url]
+        self.assertEqual(stats['count'], 2)
+        self.assertEqual(stats['reused'], 1)
+
+        self.assertRaises(HttpStatusError, pool.request, self.url + '/missing')
+        pool.close()
+
+    def test_proxy(self):
+        # The http requests are forwarded with the absolute url
+        pool = HttpConnectionPool(timeout=5, proxies={'http': 'http://user:pwd@' + self.url[7:]})
+        body = pool.request('http://exchange.invalid/trades')
+        self.assertEqual(json.loads(body.decode('utf8')),
+                         {'path': 'http://exchange.invalid/trades', 'proxy_auth': 'Basic dXNlcjpwd2Q='})
+        pool.close()
+
+        # The environment proxies are bypassed by NO_PROXY
+        with mock.patch.dict(os.environ, {'http_proxy': 'http://proxy.invalid:3128',
+                                          'no_proxy': 'exchange.invalid'}):
+            pool = HttpConnectionPool()
+            self.assertEqual(pool.get_proxy('http', 'api.invalid'), ('proxy.invalid:3128', None))
+            self.assertEqual(pool.get_proxy('http', 'exchange.invalid'), (None, None))
+
+    def test_tunnel(self):
+        # The connection is tunnelled by CONNECT, as the https connections through a proxy
+        conn = TimedHTTPConnection(self.url[7:], timeout=5)
+        conn.set_tunnel('127.0.0.1:%d' % self.server.server_address[1])
+        conn.request('GET', '/orderbook')
+        response = conn.getresponse()
+        self.assertEqual(json.loads(response.read().decode('utf8')), {'path': '/orderbook'})
+        self.assertEqual(Handler.tunnel_count, 1)
+        conn.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,294 @@
+#!/bin/python
+
+import unittest
+import os
+import shutil
+from market_data import L2Depth, Trade, OrderBook, L2DepthReader, BarAggregator
+from instrument import Instrument
+from exchange import ExchangeGateway
+from sqlite_client import SqliteClient
+from file_client import FileClient
+from column_client import ColumnClient
+from util import Timestamp
+
+path = 'test\\'
+column_path = 'l2depthreadertest'
+
+class MarketDataTest(unittest.TestCase):
+    def test_slots(self):
+        l2_depth = L2Depth(5)
+        self.assertFalse(hasattr(l2_depth, '__dict__'))
+        self.assertFalse(hasattr(l2_depth.bids[0], '__dict__'))
+        self.assertFalse(hasattr(Trade(), '__dict__'))
+
+    def test_copy(self):
+        l2_depth = L2Depth(5)
+        l2_depth.bids[0].price = 100.0
+        l2_depth.asks[4].volume = 1.5
+        copied = l2_depth.copy()
+        l2_depth.bids[0].price = 101.0
+        self.assertEqual(copied.bids[0].price, 100.0)
+        self.assertEqual(copied.asks[4].volume, 1.5)
+        self.assertEqual(copied.date_time, l2_depth.date_time)
+        self.assertEqual(copied.depth, 5)
+
+    def test_timestamp(self):
+        ns = Timestamp.parse('20161026 10:00:01.123456')
+        self.assertEqual(ns, 1477476001123456000)
+        self.assertEqual(Timestamp.parse('2016-10-26T10:00:01.123Z'), 1477476001123000000)
+        self.assertEqual(Timestamp.from_seconds('1477476001.123456'), ns)
+        self.assertEqual(Timestamp.format(ns), '20161026 10:00:01.123456')
+        self.assertEqual(Timestamp.format(ns + 1000), '20161026 10:00:01.123457')
+
+        trade = Trade()
+        trade.timestamp = ns
+        self.assertEqual(trade.date_time, '20161026 10:00:01.123456')
+        self.assertEqual(trade.values()[0], '20161026 10:00:01.123456')
+        self.assertEqual(trade.values(True)[0], ns)
+        trade.date_time = '20161026 10:00:02.000000'
+        self.assertEqual(trade.timestamp, ns + 876544000)
+
+        # Fallback of python older than 3.7
+        time_ns = Timestamp.time_ns
+        Timestamp.time_ns = None
+        try:
+            self.assertTrue(isinstance(Timestamp.now(), int))
+            self.assertTrue(Timestamp.now() > ns)
+        finally:
+            Timestamp.time_ns = time_ns
+
+    def test_record_depth(self):
+        self.assertEqual(len(L2Depth.columns(25)), 101)
+        self.assertEqual(L2Depth.columns(2), ['date_time', 'b1', 'b2', 'a1', 'a2', 'bq1', 'bq2', 'aq1', 'aq2'])
+        self.assertEqual(len(L2Depth.types(False, 25)), 101)
+        self.assertEqual(L2Depth.columns()[1:6], ['b1', 'b2', 'b3', 'b4', 'b5'])
+
+        l2_depth = L2Depth(3)
+        for i in range(0, 3):
+            l2_depth.bids[i].price = 100.0 - i
+            l2_depth.bids[i].volume = 1.0 + i
+            l2_depth.asks[i].price = 101.0 + i
+            l2_depth.asks[i].volume = 2.0 + i
+        self.assertEqual(l2_depth.values(depth=2)[1:],
+                         [100.0, 99.0, 101.0, 102.0, 1.0, 2.0, 2.0, 3.0])
+        self.assertEqual(l2_depth.values(depth=4)[1:],
+                         [100.0, 99.0, 98.0, 0.0, 101.0, 102.0, 103.0, 0.0,
+                          1.0, 2.0, 3.0, 0.0, 2.0, 3.0, 4.0, 0.0])
+
+    def test_l2_depth_changed(self):
+        instmt = Instrument('Exchange', 'Instmt', 'INSTMT')
+        instmt.set_l2_depth(L2Depth(10))
+        l2_depth = instmt.get_l2_depth()
+        l2_depth.bids[0].price = 100.0
+        self.assertTrue(instmt.is_l2_depth_changed())
+        self.assertFalse(instmt.is_l2_depth_changed())
+
+        # Only the first 5 levels are compared
+        l2_depth.bids[5].price = 95.0
+        self.assertFalse(instmt.is_l2_depth_changed())
+        l2_depth.asks[4].volume = 2.0
+        self.assertTrue(instmt.is_l2_depth_changed())
+        self.assertEqual(l2_depth.fingerprint(1), (100.0, 0.0, 0.0, 0.0))
+        self.assertEqual(instmt.get_l2_depth_stats(), {'emitted': 2, 'suppressed': 2, 'conflated': 0})
+
+    def test_l2_depth_tolerance(self):
+        instmt = Instrument('Exchange', 'Instmt', 'INSTMT', book_diff_depth='2',
+                            book_price_tolerance='0.05', book_volume_tolerance='1')
+        instmt.set_l2_depth(L2Depth(5))
+        l2_depth = instmt.get_l2_depth()
+        l2_depth.bids[0].price = 100.0
+        l2_depth.bids[0].volume = 3.0
+        self.assertTrue(instmt.is_l2_depth_changed())
+        l2_depth.bids[0].price = 100.03
+        l2_depth.bids[1].volume = 0.5
+        self.assertFalse(instmt.is_l2_depth_changed())
+        l2_depth.bids[2].price = 99.0
+        self.assertFalse(instmt.is_l2_depth_changed())
+
+        # Differences are accumulated against the last emitted depth
+        l2_depth.bids[0].price = 100.06
+        self.assertTrue(instmt.is_l2_depth_changed())
+        l2_depth.asks[1].volume = 1.5
+        self.assertTrue(instmt.is_l2_depth_changed())
+        self.assertEqual(instmt.get_l2_depth_stats(), {'emitted': 3, 'suppressed': 2, 'conflated': 0})
+
+class OrderBookTest(unittest.TestCase):
+    def test_update(self):
+        order_book = OrderBook()
+        for price in [100.0, 102.0, 101.0, 99.5]:
+            order_book.update(L2Depth.Side.BUY, price, 1, price / 100)
+        for price in [104.0, 103.0, 105.0]:
+            order_book.update(L2Depth.Side.SELL, price, 2, price / 100)
+
+        self.assertEqual([e.price for e in order_book.get_bids(3)], [102.0, 101.0, 100.0])
+        self.assertEqual([e.price for e in order_book.get_asks(5)], [103.0, 104.0, 105.0])
+
+        # Update and deletion
+        order_book.update(L2Depth.Side.BUY, 101.0, 3, 5.0)
+        self.assertEqual(order_book.get_bids(2)[1].volume, 5.0)
+        self.assertEqual(order_book.get_bids(2)[1].count, 3)
+        self.assertTrue(order_book.delete(L2Depth.Side.BUY, 102.0))
+        self.assertFalse(order_book.delete(L2Depth.Side.BUY, 102.0))
+        self.assertTrue(order_book.delete(L2Depth.Side.SELL, 103.0))
+        self.assertEqual([e.price for e in order_book.get_bids(5)], [101.0, 100.0, 99.5])
+        self.assertEqual([e.price for e in order_book.get_asks(1)], [104.0])
+
+    def test_fill_l2_depth(self):
+        order_book = OrderBook(5)
+        order_book.update(L2Depth.Side.BUY, 100.0, 1, 0.5)
+        order_book.update(L2Depth.Side.SELL, 101.0, 1, 0.7)
+        l2_depth = L2Depth(5)
+        order_book.fill_l2_depth(l2_depth)
+        self.assertEqual(l2_depth.values()[1:],
+                         [100.0, 0.0, 0.0, 0.0, 0.0, 101.0, 0.0, 0.0, 0.0, 0.0,
+                          0.5, 0.0, 0.0, 0.0, 0.0, 0.7, 0.0, 0.0, 0.0, 0.0])
+
+        # Updated levels are shared with the L2 depth
+        order_book.update(L2Depth.Side.BUY, 100.0, 2, 0.8)
+        order_book.update(L2Depth.Side.BUY, 99.0, 1, 0.1)
+        order_book.fill_l2_depth(l2_depth)
+        self.assertEqual([e.volume for e in l2_depth.bids[0:3]], [0.8, 0.1, 0.0])
+        order_book.delete(L2Depth.Side.SELL, 101.0)
+        order_book.fill_l2_depth(l2_depth)
+        self.assertEqual(l2_depth.asks[0].price, 0.0)
+        self.assertEqual(len(l2_depth.asks), 5)
+
+class BarAggregatorTest(unittest.TestCase):
+    def test_update(self):
+        aggregator = BarAggregator('1m')
+        self.assertEqual(aggregator.interval, 60 * Timestamp.SECOND)
+        self.assertRaises(Exception, BarAggregator, '1x')
+        self.assertRaises(Exception, BarAggregator, '0s')
+
+        bars = []
+        for date_time, price, volume in [('20161026 10:00:01.000000', 100.0, 1.0),
+                                         ('20161026 10:00:30.000000', 102.0, 1.0),
+                                         ('20161026 10:00:59.999999', 99.0, 2.0),
+                                         ('20161026 10:03:00.000000', 101.0, 1.0)]:
+            trade = Trade()
+            trade.date_time = date_time
+            trade.trade_price = price
+            trade.trade_volume = volume
+            bar = aggregator.update(trade)
+            if bar is not None:
+                bars.append(bar)
+
+        self.assertEqual(len(bars), 1)
+        self.assertEqual(bars[0].values(), ['20161026 10:00:00.000000', 100.0, 102.0, 99.0, 99.0, 4.0, 100.0, 3])
+        self.assertEqual(aggregator.bar.date_time, '20161026 10:03:00.000000')
+        self.assertEqual(aggregator.bar.trade_count, 1)
+
+        # Late trade of the completed interval is dropped
+        trade = Trade()
+        trade.date_time = '20161026 10:00:59.999999'
+        self.assertIsNone(aggregator.update(trade))
+        self.assertEqual(aggregator.late_count, 1)
+
+    def test_flush(self):
+        aggregator = BarAggregator('1s')
+        trade = Trade()
+        trade.date_time = '20161026 10:00:01.500000'
+        trade.trade_price = 100.0
+        trade.trade_volume = 1.0
+        self.assertIsNone(aggregator.update(trade))
+
+        # The bar is completed after the interval and the close delay
+        self.assertIsNone(aggregator.flush(Timestamp.parse('20161026 10:00:02.500000')))
+        bar = aggregator.flush(Timestamp.parse('20161026 10:00:03.000000'))
+        self.assertEqual(bar.date_time, '20161026 10:00:01.000000')
+        self.assertIsNone(aggregator.bar)
+        self.assertIsNone(aggregator.update(trade))
+        self.assertEqual(aggregator.late_count, 1)
+
+        # Shutdown completes the current bar anyway
+        trade.date_time = '20161026 10:00:05.000000'
+        self.assertIsNone(aggregator.update(trade))
+        self.assertEqual(aggregator.flush().date_time, '20161026 10:00:05.000000')
+        self.assertIsNone(aggregator.flush())
+
+class L2DepthReaderTest(unittest.TestCase):
+    updates = [(L2Depth.Side.BUY, 100.0, 1.0), (L2Depth.Side.SELL, 101.0, 2.0),
+               (L2Depth.Side.BUY, 99.0, 3.0), (L2Depth.Side.BUY, 100.0, 0.0),
+               (L2Depth.Side.SELL, 102.0, 1.5), (L2Depth.Side.BUY, 98.0, 4.0),
+               (L2Depth.Side.SELL, 100.5, 0.5)]
+
+    def record(self, db_client):
+        """
+        Record the order books in the delta mode
+        :return Gateway, instrument and the recorded values
+        """
+        exch = ExchangeGateway(None, db_client)
+        instmt = Instrument('Test', 'XBTUSD', 'xbtusd', book_record_depth='3',
+                            book_record_mode='delta', book_snapshot_interval='3')
+        instmt.set_order_book_table_name(exch.get_order_book_table_name('Test', 'XBTUSD'))
+        instmt.set_order_book_id(exch.get_order_book_init(instmt))
+
+        order_book = OrderBook(3)
+        l2_depth = L2Depth(3)
+        instmt.set_l2_depth(l2_depth)
+        recorded = []
+        for i, (side, price, volume) in enumerate(self.updates):
+            if volume == 0.0:
+                order_book.delete(side, price)
+            else:
+                order_book.update(side, price, 1, volume)
+            order_book.fill_l2_depth(l2_depth)
+            l2_depth.date_time = '20161026 10:00:%02d.000000' % i
+            instmt.incr_order_book_id()
+            exch.insert_order_book(instmt)
+            recorded.append(l2_depth.values(depth=3))
+        return exch, instmt, recorded
+
+    def check_reader(self, db_client, instmt, recorded):
+        reader = L2DepthReader(db_client, instmt.get_order_book_table_name())
+        for i in range(0, len(self.updates)):
+            self.assertEqual(reader.get_l2_depth_by_id(i + 1).values(depth=3), recorded[i])
+            self.assertEqual(reader.get_l2_depth('20161026 10:00:%02d.500000' % i).values(depth=3),
+                             recorded[i])
+        self.assertIsNone(reader.get_l2_depth('20161026 09:00:00.000000'))
+
+    def test_delta(self):
+        db_client = SqliteClient()
+        db_client.connect(path=':memory:')
+        exch, instmt, recorded = self.record(db_client)
+
+        # Snapshots of the books 1, 4 and 7, and one delta row for the others
+        self.assertEqual(len(db_client.select(instmt.get_order_book_table_name())), 3)
+        self.assertEqual(len(db_client.select(instmt.get_order_book_table_name() + '_delta')), 4)
+        self.check_reader(db_client, instmt, recorded)
+
+        # The ids continue after restart
+        instmt = Instrument('Test', 'XBTUSD', 'xbtusd', book_record_mode='delta')
+        self.assertEqual(exch.get_order_book_init(instmt), 7)
+        self.assertEqual(instmt.get_order_book_delta_id(), 4)
+
+    def test_delta_files(self):
+        # The snapshots and the deltas are searched by the id in the files
+        db_client = FileClient(dir=path)
+        exch, instmt, recorded = self.record(db_client)
+        try:
+            self.check_reader(db_client, instmt, recorded)
+        finally:
+            db_client.close()
+            for table in [instmt.get_order_book_table_name(), instmt.get_order_book_table_name() + '_delta']:
+                for ext in ['.csv', '.csv.idx']:
+                    if os.path.isfile(path + table + ext):
+                        os.remove(path + table + ext)
+
+        db_client = ColumnClient(dir=column_path)
+        exch, instmt, recorded = self.record(db_client)
+        try:
+            self.check_reader(db_client, instmt, recorded)
+        finally:
+            db_client.close()
+            shutil.rmtree(column_path)
+
+    def test_diff_levels(self):
+        prev = ({100.0: 1.0, 99.0: 2.0}, {101.0: 1.0})
+        curr = ({100.0: 1.5, 98.0: 2.0}, {101.0: 1.0})
+        self.assertEqual(L2Depth.diff_levels(curr, prev),
+                         [(L2Depth.Side.BUY, 100.0, 1.5), (L2Depth.Side.BUY, 98.0, 2.0),
+                          (L2Depth.Side.BUY, 99.0, 0.0)])
+
+if __name__ == '__main__':
+    unittest.main()
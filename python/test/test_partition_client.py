@@ -0,0 +1,72 @@
+#!/bin/python
+
+import unittest
+import time
+import os
+from file_client import FileClient
+from partition_client import PartitionClient
+from util import Logger
+
+path = 'test\\'
+table_name = 'test_partition'
+columns = ['id', 'date_time', 'v']
+types = ['int PRIMARY KEY', 'text', 'decimal(10,5)']
+
+class PartitionClientTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        Logger.init_log()
+
+    def test_partition(self):
+        db_client = PartitionClient(FileClient(dir=path), compression='gzip')
+        self.assertTrue(db_client.create(table_name, columns, types))
+        today = db_client.get_partition_name(table_name, db_client.get_partition_key())
+        self.assertTrue(db_client.insert(table_name, columns, [1, '20161026 23:59:59.000000', 1.0]))
+        self.assertTrue(db_client.insert(table_name, columns, [2, '20161026 23:59:59.500000', 2.0]))
+
+        # Late rows stay in the current partition
+        self.assertTrue(db_client.insert(table_name, columns, [3, '29991231 00:00:00.000000', 3.0]))
+        self.assertTrue(db_client.insert(table_name, columns, [4, '29991230 23:59:59.000000', 4.0]))
+        self.assertEqual(db_client.get_partitions(table_name),
+                         [today, table_name + '_29991231'])
+
+        # The closed partition is compressed in the background
+        for i in range(0, 100):
+            if db_client.get_stats()['compress_count'] > 0:
+                break
+            time.sleep(0.05)
+        self.assertEqual(db_client.get_stats()['compress_count'], 1)
+        self.assertTrue(os.path.isfile(path + today + ".csv.gz"))
+
+        # Ids continue across the partitions
+        self.assertEqual(db_client.select(table_name, columns=['id'], orderby='id desc', limit=3),
+                         [[4], [3], [2]])
+        self.assertEqual(db_client.select(table_name, columns=['id'], condition='id<=3'),
+                         [[1], [2], [3]])
+        self.assertEqual(db_client.select(table_name, columns=['id', 'v'], orderby='v desc', limit=1),
+                         [[4, 4.0]])
+
+        # The lazy select chains the partitions
+        self.assertEqual([int(e[0]) for e in db_client.iter_select(table_name, columns=['id'])],
+                         [1, 2, 3, 4])
+        self.assertEqual([int(e[0]) for e in db_client.iter_select(table_name, columns=['id'],
+                                                                   orderby='id desc', limit=3)],
+                         [4, 3, 2])
+        self.assertEqual([len(e) for e in db_client.iter_select(table_name, columns=['id'],
+                                                                chunk_size=1, is_chunked=True)],
+                         [1, 1, 1, 1])
+        db_client.close()
+
+        # Partitions are found after restart
+        db_client = PartitionClient(FileClient(dir=path))
+        self.assertEqual(db_client.get_partitions(table_name),
+                         [today, table_name + '_29991231'])
+        self.assertEqual(db_client.select(table_name, columns=['id'], orderby='id desc', limit=1),
+                         [[4]])
+        db_client.close()
+        os.remove(path + today + ".csv.gz")
+        os.remove(path + table_name + "_29991231.csv")
+        os.remove(path + table_name + "_29991231.csv.idx")
+
+if __name__ == '__main__':
+    unittest.main()
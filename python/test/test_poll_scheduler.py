@@ -0,0 +1,79 @@
+#!/bin/python
+
+import unittest
+import threading
+import time
+from poll_scheduler import TokenBucket, AdaptiveInterval, Poller, PollScheduler
+from http_client import HttpStatusError
+from util import Logger
+
+class PollSchedulerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        Logger.init_log()
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(10.0, 2)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertAlmostEqual(bucket.reserve(), 0.1, delta=0.02)
+        self.assertAlmostEqual(bucket.reserve(), 0.2, delta=0.02)
+        self.assertEqual(TokenBucket(0.0).reserve(), 0.0)
+
+    def test_adaptive_interval(self):
+        interval = AdaptiveInterval(1.0)
+        self.assertEqual(interval.update(True), 0.75)
+        self.assertEqual(interval.update(True), 0.5625)
+        self.assertEqual(interval.update(True), 0.5)
+        self.assertEqual(interval.update(False), 0.625)
+        self.assertEqual(interval.backoff(), 1.25)
+        self.assertEqual(interval.backoff(30.0), 30.0)
+        for i in range(0, 10):
+            interval.update(False)
+        self.assertEqual(interval.interval, 10.0)
+
+    def test_poller(self):
+        counts = {'init': 0, 'poll': 0}
+
+        def init():
+            counts['init'] += 1
+            if counts['init'] == 1:
+                raise Exception("Init failure")
+
+        def poll():
+            counts['poll'] += 1
+            if counts['poll'] == 2:
+                raise HttpStatusError(429, 'Too Many Requests', 'http://localhost', 5.0)
+            return True
+
+        poller = Poller('test', init, poll, AdaptiveInterval(1.0))
+        self.assertEqual(poller.execute(), 2.0)
+        self.assertEqual(counts, {'init': 1, 'poll': 0})
+        self.assertEqual(poller.execute(), 1.5)
+        self.assertEqual(poller.execute(), 5.0)
+        self.assertEqual(counts, {'init': 2, 'poll': 2})
+
+    def test_scheduler(self):
+        scheduler = PollScheduler(max_workers=2)
+        bucket = TokenBucket(50.0, 1)
+        times = []
+        thread_names = set()
+        done = threading.Event()
+
+        def poll():
+            times.append(time.time())
+            thread_names.add(threading.current_thread().name)
+            if len(times) == 10:
+                done.set()
+            return True
+
+        # The pollers share the rate limit of 50 requests per second
+        scheduler.add_poller(Poller('test', None, poll, AdaptiveInterval(0.001), bucket))
+        scheduler.add_poller(Poller('test2', None, poll, AdaptiveInterval(0.001), bucket))
+        self.assertTrue(done.wait(5))
+        scheduler.stop()
+        self.assertGreaterEqual(times[9] - times[0], 0.15)
+        self.assertLessEqual(len(thread_names), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/bin/python
+
+import unittest
+import os
+import threading
+from database_client import DatabaseClient
+from queued_client import QueuedClient
+from sqlite_client import SqliteClient
+from util import Logger
+
+file_name = 'queuedclienttest.sqlite'
+spill_path = 'queuedclienttest.spill'
+
+class GatedClient(DatabaseClient):
+    """
+    Client which blocks the first insertion until the gate is opened
+    """
+    def __init__(self):
+        DatabaseClient.__init__(self)
+        self.rows = []
+        self.entered = threading.Event()
+        self.gate = threading.Event()
+
+    def insert(self, table, columns, values, is_orreplace=False):
+        self.entered.set()
+        self.gate.wait()
+        self.rows.append(values)
+        return True
+
+class QueuedClientTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        Logger.init_log()
+
+    def test_query(self):
+        db_client = QueuedClient(SqliteClient(), max_size=10)
+        db_client.connect(path=file_name)
+        table_name = 'test_query'
+        columns = ['k', 'v']
+        self.assertTrue(db_client.create(table_name, columns, ['int PRIMARY KEY', 'text']))
+        for i in range(0, 20):
+            self.assertTrue(db_client.insert(table_name, columns, [i, str(i)]))
+
+        row = db_client.select(table=table_name, orderby='k desc', limit=1)
+        self.assertEqual(row[0][0], 19)
+        self.assertEqual(row[0][1], '19')
+        stats = db_client.get_stats()
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertEqual(stats['enqueued'], 20)
+        self.assertEqual(stats['committed'], 20)
+        self.assertEqual(stats['dropped'], 0)
+        self.assertTrue(db_client.close())
+        os.remove(file_name)
+
+    def test_drop_oldest(self):
+        inner = GatedClient()
+        db_client = QueuedClient(inner, max_size=2,
+                                 overflow_policy=QueuedClient.OverflowPolicy.DROP_OLDEST)
+        db_client.insert('t', ['k'], [1])
+        inner.entered.wait()
+        for i in range(2, 5):
+            db_client.insert('t', ['k'], [i])
+        inner.gate.set()
+        db_client.flush()
+        self.assertEqual(inner.rows, [[1], [3], [4]])
+        self.assertEqual(db_client.get_stats()['dropped'], 1)
+        db_client.close()
+
+    def test_spill(self):
+        inner = GatedClient()
+        db_client = QueuedClient(inner, max_size=1,
+                                 overflow_policy=QueuedClient.OverflowPolicy.SPILL,
+                                 spill_path=spill_path)
+        db_client.insert('t', ['k'], [1])
+        inner.entered.wait()
+        for i in range(2, 6):
+            db_client.insert('t', ['k'], [i])
+        stats = db_client.get_stats()
+        self.assertEqual(stats['spilled'], 3)
+        self.assertEqual(stats['queue_depth'], 5)
+        inner.gate.set()
+        db_client.flush()
+        self.assertEqual(inner.rows, [[1], [2], [3], [4], [5]])
+        self.assertFalse(os.path.isfile(spill_path))
+        db_client.close()
+
+    def test_spill_chunks(self):
+        inner = GatedClient()
+        db_client = QueuedClient(inner, max_size=2,
+                                 overflow_policy=QueuedClient.OverflowPolicy.SPILL,
+                                 spill_path=spill_path)
+        db_client.insert('t', ['k'], [1])
+        inner.entered.wait()
+        for i in range(2, 9):
+            db_client.insert('t', ['k'], [i])
+        self.assertEqual(db_client.get_stats()['spill_rows'], 5)
+
+        # The spill file is replayed in chunks of the queue size
+        db_client.cond.acquire()
+        self.assertEqual([e[2] for e in db_client.load_spill()], [[4], [5]])
+        self.assertTrue(os.path.isfile(spill_path + '.replay'))
+        self.assertFalse(os.path.isfile(spill_path))
+        db_client.cond.release()
+
+        # The rows spilled during the replay are kept after the replayed ones
+        db_client.insert('t', ['k'], [9])
+        self.assertEqual(db_client.get_stats()['spill_rows'], 4)
+        inner.gate.set()
+        db_client.flush()
+        self.assertEqual(inner.rows, [[1], [2], [3], [6], [7], [8], [9]])
+        self.assertFalse(os.path.isfile(spill_path + '.replay'))
+        self.assertFalse(os.path.isfile(spill_path))
+        db_client.close()
+
+if __name__ == '__main__':
+    unittest.main()
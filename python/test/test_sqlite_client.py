@@ -1,8 +1,11 @@
 #!/bin/python
 
 import unittest
+import sqlite3
 import os
+import threading
 from sqlite_client import SqliteClient
+from util import Logger
 
 file_name = 'sqliteclienttest.sqlite'
 
@@ -164,6 +167,137 @@ class SqliteClientTest(unittest.TestCase):
         self.assertTrue(not self.db_client.create(table_name, columns[1::], types))
         self.assertTrue(not self.db_client.insert(table_name, columns, []))
 
+
+class SqliteClientBatchTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        Logger.init_log()
+        cls.file_name = 'sqliteclientbatchtest.sqlite'
+        cls.db_client = SqliteClient(batch_size=3)
+        cls.db_client.connect(path=cls.file_name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db_client.close()
+        os.remove(cls.file_name)
+
+    def test_batch_insert(self):
+        table_name = 'test_batch'
+        columns = ['k', 'v']
+        types = ['int PRIMARY KEY', 'text']
+        self.assertTrue(self.db_client.create(table_name, columns, types))
+
+        # Rows are buffered until the batch size is reached
+        self.assertTrue(self.db_client.insert(table_name, columns, [1, 'a']))
+        self.assertTrue(self.db_client.insert(table_name, columns, [2, 'b']))
+        self.assertEqual(self.db_client.get_stats()['pending_rows'], 2)
+        self.assertEqual(self.db_client.get_stats()['flush_count'], 0)
+        self.assertTrue(self.db_client.insert(table_name, columns, [3, 'c']))
+        stats = self.db_client.get_stats()
+        self.assertEqual(stats['pending_rows'], 0)
+        self.assertEqual(stats['flush_count'], 1)
+        self.assertEqual(stats['flush_rows'], 3)
+        self.assertEqual(stats['avg_batch_size'], 3)
+
+        # Select flushes the buffered rows
+        self.assertTrue(self.db_client.insert(table_name, columns, [4, 'd']))
+        row = self.db_client.select(table=table_name, orderby='k desc', limit=1)
+        self.assertEqual(row[0][0], 4)
+        self.assertEqual(row[0][1], 'd')
+
+        # Duplicated key only discards the failed row
+        self.assertTrue(self.db_client.insert(table_name, columns, [5, 'e']))
+        self.assertTrue(self.db_client.insert(table_name, columns, [4, 'x']))
+        self.assertTrue(self.db_client.flush())
+        row = self.db_client.select(table=table_name)
+        self.assertEqual(len(row), 5)
+        self.assertEqual(row[3][1], 'd')
+        self.assertEqual(row[4][0], 5)
+
+    def test_commit_error(self):
+        db_client = SqliteClient(batch_size=10)
+        db_client.connect(path=':memory:')
+        self.assertTrue(db_client.create('test_commit', ['k'], ['int PRIMARY KEY']))
+
+        def commit():
+            raise Exception("Connection lost")
+
+        # The error is logged instead of raised, and the lock is released
+        db_client.commit = commit
+        self.assertTrue(db_client.insert('test_commit', ['k'], [1]))
+        self.assertTrue(db_client.flush())
+        del db_client.commit
+        self.assertTrue(db_client.insert('test_commit', ['k'], [2]))
+        self.assertEqual(db_client.select(table='test_commit', orderby='k desc', limit=1), [(2,)])
+        db_client.close()
+
+    def test_parameterized_insert(self):
+        table_name = 'test_parameterized'
+        columns = ['k', 'v', 'v2']
+        types = ['int PRIMARY KEY', 'text', 'decimal(20,8)']
+        self.assertTrue(self.db_client.create(table_name, columns, types))
+
+        # Values are bound instead of formatted into the statement
+        self.assertTrue(self.db_client.insert(table_name, columns, [1, "It's", 0.123456789]))
+        self.assertTrue(self.db_client.insert(table_name, columns, [1, "Replaced", 1.5], True))
+        row = self.db_client.select(table=table_name)
+        self.assertTrue((table_name, tuple(columns), False) in self.db_client.insert_stmts)
+        self.assertTrue((table_name, tuple(columns), True) in self.db_client.insert_stmts)
+        self.assertEqual(len(row), 1)
+        self.assertEqual(row[0][1], 'Replaced')
+        self.assertEqual(row[0][2], 1.5)
+
+    def test_iter_select(self):
+        table_name = 'test_iter_select'
+        columns = ['k', 'v']
+        types = ['int PRIMARY KEY', 'text']
+        self.assertTrue(self.db_client.create(table_name, columns, types))
+        for i in range(0, 5):
+            self.assertTrue(self.db_client.insert(table_name, columns, [i, str(i)]))
+
+        # Buffered rows are flushed before streaming
+        chunks = list(self.db_client.iter_select(table=table_name, columns=['k'], orderby='k asc',
+                                                 chunk_size=2, is_chunked=True))
+        self.assertEqual([[row[0] for row in chunk] for chunk in chunks], [[0, 1], [2, 3], [4]])
+        rows = list(self.db_client.iter_select(table=table_name, condition='k>=3'))
+        self.assertEqual(rows, [(3, '3'), (4, '4')])
+
+class SqliteClientPerThreadTest(unittest.TestCase):
+    def test_per_thread_connection(self):
+        file_name = 'sqliteclientperthreadtest.sqlite'
+        db_client = SqliteClient()
+        db_client.connect(path=file_name, per_thread=True)
+        columns = ['k', 'v']
+        types = ['int PRIMARY KEY', 'text']
+        self.assertTrue(db_client.create('test_a', columns, types))
+        self.assertTrue(db_client.create('test_b', columns, types))
+
+        def writer(table):
+            for i in range(0, 10):
+                db_client.insert(table, columns, [i, table])
+
+        threads = [threading.Thread(target=writer, args=(table,)) for table in ['test_a', 'test_b']]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(db_client.select(table='test_a')), 10)
+        self.assertEqual(len(db_client.select(table='test_b')), 10)
+        self.assertEqual(db_client.get_stats()['lock']['connections'], 3)
+
+        # The connections of the ended threads are closed when a new thread connects
+        conns = [conn for thread, conn, lock in db_client.thread_conns]
+        t = threading.Thread(target=db_client.select, args=('test_a',))
+        t.start()
+        t.join()
+        self.assertEqual(db_client.get_stats()['lock']['connections'], 2)
+        self.assertRaises(sqlite3.ProgrammingError, conns[1].execute, 'select 1')
+        db_client.close()
+        for suffix in ['', '-wal', '-shm']:
+            if os.path.isfile(file_name + suffix):
+                os.remove(file_name + suffix)
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -54,6 +54,14 @@ class SubscriptionManagerTest(unittest.TestCase):
         self.assertEqual(m['Id'], 'TRADE_ID')
         self.assertEqual(m['Price'], 'TRADE_PRICE')        
         self.assertEqual(m['Quantity'], 'TRADE_VOLUME')                
+        self.assertEqual(instmts[name].book_diff_depth, 3)
+        self.assertEqual(instmts[name].book_price_tolerance, 0.01)
+        self.assertEqual(instmts[name].book_volume_tolerance, 0.5)
+        self.assertEqual(instmts[name].book_record_depth, 10)
+        self.assertEqual(instmts[name].book_conflation_ms, 100)
+        self.assertEqual(instmts['BTCC-BTCCNY-Restful'].book_conflation_ms, 0)
+        self.assertEqual(instmts['BTCC-BTCCNY-Restful'].book_diff_depth, 5)
+        self.assertEqual(instmts['BTCC-BTCCNY-Restful'].book_record_depth, 5)
         
     def test_get_subscriptions(self):
         instmts = SubscriptionManager(file_name).get_subscriptions()
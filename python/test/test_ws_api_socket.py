@@ -0,0 +1,83 @@
+#!/bin/python
+
+import unittest
+from ws_api_socket import WebSocketApiClient, WebSocketApiPool
+from util import Logger
+
+class WebSocketStub(object):
+    """
+    Web socket recording the sent messages
+    """
+    def __init__(self):
+        self.sent = []
+
+    def send(self, msg):
+        self.sent.append(msg)
+
+class WebSocketApiClientTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        Logger.init_log()
+
+    def test_send(self):
+        client = WebSocketApiClient('test')
+        ws = WebSocketStub()
+        client.ws = ws
+        opened = []
+        client.on_open_handlers.append(lambda x: opened.append(list(ws.sent)))
+
+        # The messages are queued until the socket is opened, after the open handlers
+        client.send('a')
+        client.send('b')
+        self.assertEqual(ws.sent, [])
+        client._WebSocketApiClient__on_open(ws)
+        self.assertEqual(opened, [[]])
+        self.assertEqual(ws.sent, ['a', 'b'])
+        client.send('c')
+        self.assertEqual(ws.sent, ['a', 'b', 'c'])
+        self.assertEqual(client.pending_messages, [])
+
+    def test_message(self):
+        client = WebSocketApiClient('test')
+        messages = []
+        client.on_message_handlers.append(lambda x: messages.append(x))
+        client.on_message_handlers.append(lambda x: messages.append(x['k']))
+        client._WebSocketApiClient__on_message(None, '{"k": 1}')
+        client._WebSocketApiClient__on_message(None, 'not json')
+        self.assertEqual(messages, [{'k': 1}, 1])
+        self.assertEqual(client.message_count, 2)
+        self.assertEqual(client.message_rate, -1.0)
+
+class WebSocketApiPoolTest(unittest.TestCase):
+    def test_get_socket(self):
+        pool = WebSocketApiPool(WebSocketApiClient('test'), lambda: WebSocketApiClient('test'), 3)
+
+        def subscribe():
+            api_socket = pool.get_socket()
+            api_socket.on_open_handlers.append(lambda x: None)
+            return api_socket
+
+        # The rates are not measured at the start, so the instruments are spread
+        s0 = subscribe()
+        s1 = subscribe()
+        self.assertIsNot(s0, s1)
+        self.assertEqual(s1.id, 'test-1')
+
+        # The connection below the saturated rate takes the instrument
+        s0.message_rate = 10.0
+        s1.message_rate = WebSocketApiPool.MAX_MESSAGE_RATE
+        self.assertIs(subscribe(), s0)
+        self.assertEqual(len(pool.sockets), 2)
+
+        # A new connection is opened when all are saturated
+        s0.message_rate = WebSocketApiPool.MAX_MESSAGE_RATE * 2
+        s2 = subscribe()
+        self.assertEqual(len(pool.sockets), 3)
+
+        # The pool is full, so the least busy connection takes the instrument
+        s2.message_rate = WebSocketApiPool.MAX_MESSAGE_RATE * 3
+        self.assertIs(subscribe(), s1)
+        self.assertEqual(len(pool.sockets), 3)
+
+if __name__ == '__main__':
+    unittest.main()
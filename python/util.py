@@ -1,5 +1,8 @@
 from datetime import datetime
+import calendar
 import logging
+import threading
+import time
 
 
 class Logger:
@@ -40,3 +43,135 @@ class Logger:
         :param str: Log message
         """
         Logger.logger.error('[%s]\n%s\n' % (method, str))
+
+
+class TimedLock(object):
+    """
+    Lock which records the number of acquisitions and the time spent on waiting
+    """
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.lock = threading.Lock()
+        self.count = 0
+        self.contended_count = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def acquire(self, blocking=True):
+        """
+        Acquire the lock. The wait time is only measured if the lock is contended.
+        :param blocking: Block until the lock is acquired
+        :return True if the lock is acquired
+        """
+        if self.lock.acquire(False):
+            self.count += 1
+            return True
+        elif not blocking:
+            return False
+
+        start_time = time.time()
+        self.lock.acquire()
+        wait_time = time.time() - start_time
+        self.count += 1
+        self.contended_count += 1
+        self.wait_time += wait_time
+        if wait_time > self.max_wait_time:
+            self.max_wait_time = wait_time
+        return True
+
+    def release(self):
+        """
+        Release the lock
+        """
+        self.lock.release()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def get_stats(self):
+        """
+        Get the lock statistics. Wait times are in milliseconds.
+        :return Dictionary of statistics
+        """
+        return {'count': self.count,
+                'contended_count': self.contended_count,
+                'wait_time': self.wait_time * 1000,
+                'avg_wait_time': self.wait_time * 1000 / self.count if self.count > 0 else 0.0,
+                'max_wait_time': self.max_wait_time * 1000}
+
+
+class Timestamp:
+    """
+    Timestamps in nanoseconds since epoch. The texts are rendered in the format
+    "%Y%m%d %H:%M:%S.%f" with the prefix up to the second cached.
+    """
+    SECOND = 1000000000
+
+    # Maximum number of cached prefixes
+    CACHE_SIZE = 256
+
+    cache = dict()      # Seconds since epoch -> Prefix text
+    time_ns = getattr(time, 'time_ns', None)
+
+    @staticmethod
+    def now():
+        """
+        Current time. time.time_ns is only available in python 3.7 or above.
+        :return Nanoseconds since epoch
+        """
+        if Timestamp.time_ns is not None:
+            return Timestamp.time_ns()
+        return int(time.time() * 1000000000)
+
+    @staticmethod
+    def from_seconds(value):
+        """
+        Convert the seconds since epoch. The value is rounded to microseconds.
+        :param value: Seconds, in integer, float or text
+        :return Nanoseconds since epoch
+        """
+        return int(round(float(value) * 1000000)) * 1000
+
+    @staticmethod
+    def from_milliseconds(value):
+        """
+        Convert the milliseconds since epoch
+        :param value: Milliseconds, in integer, float or text
+        :return Nanoseconds since epoch
+        """
+        return int(round(float(value) * 1000)) * 1000
+
+    @staticmethod
+    def parse(value):
+        """
+        Parse the text in the format "%Y%m%d %H:%M:%S.%f" or ISO 8601 in UTC,
+        e.g. "2016-10-26T10:00:00.123Z"
+        :param value: Text
+        :return Nanoseconds since epoch
+        """
+        value = value.replace('-', '').replace('T', ' ').rstrip('Z')
+        seconds = calendar.timegm((int(value[0:4]), int(value[4:6]), int(value[6:8]),
+                                   int(value[9:11]), int(value[12:14]), int(value[15:17])))
+        fraction = value[18:27]
+        return seconds * Timestamp.SECOND + (int(fraction.ljust(9, '0')) if len(fraction) > 0 else 0)
+
+    @staticmethod
+    def format(value):
+        """
+        Render the timestamp
+        :param value: Nanoseconds since epoch
+        :return Text in the format "%Y%m%d %H:%M:%S.%f"
+        """
+        seconds, nanoseconds = divmod(value, Timestamp.SECOND)
+        prefix = Timestamp.cache.get(seconds)
+        if prefix is None:
+            if len(Timestamp.cache) >= Timestamp.CACHE_SIZE:
+                Timestamp.cache = dict()
+            prefix = datetime.utcfromtimestamp(seconds).strftime("%Y%m%d %H:%M:%S.")
+            Timestamp.cache[seconds] = prefix
+        return prefix + "%06d" % (nanoseconds // 1000)
@@ -1,13 +1,22 @@
 import websocket
 import threading
-from time import sleep
+import json
+import random
+from time import sleep, time
 from api_socket import ApiSocket
-from util import Logger
+from util import Logger, Timestamp
 
 class WebSocketApiClient(ApiSocket):
     """
     Generic REST API call
     """
+    # Initial and maximum delay (in seconds) before reconnecting
+    RECONNECT_DELAY = 1.0
+    MAX_RECONNECT_DELAY = 60.0
+
+    # Seconds over which the message rate is measured
+    RATE_WINDOW = 5.0
+
     def __init__(self, id):
         """
         Constructor
@@ -15,9 +24,21 @@ class WebSocketApiClient(ApiSocket):
         """
         ApiSocket.__init__(self)
         self.ws = None              # Web socket
+        self.url = ''
         self.id = id
+        self.stopped = False
+        self.reconnect_delay = WebSocketApiClient.RECONNECT_DELAY
+        self.reconnect_count = 0
+        self.close_time = 0         # Time of the last close in nanoseconds since epoch
+        self.reconnect_latency = 0  # Nanoseconds from the last close to the reopen
         self.wst = None             # Web socket thread
         self._connected = False
+        self.lock = threading.RLock()
+        self.pending_messages = []  # Messages sent before the socket is opened
+        self.message_count = 0
+        self.message_rate = -1.0    # Messages per second in the last window. Negative if not measured yet.
+        self.rate_count = 0
+        self.rate_start = 0.0
         self.on_message_handlers = []
         self.on_open_handlers = []
         self.on_close_handlers = []
@@ -30,8 +51,10 @@ class WebSocketApiClient(ApiSocket):
                 on_error_handler=None):
         """
         :param url: Url link
-        :param on_message_handler: Message handler which take the message as
-                           the first argument
+        :param on_message_handler: Message handler which take the decoded JSON
+                           message as the first argument. The message is
+                           decoded once for all the handlers, and a handler
+                           registered already is not added again.
         :param on_open_handler: Socket open handler which take the socket as
                            the first argument
         :param on_close_handler: Socket close handler which take the socket as
@@ -40,52 +63,210 @@ class WebSocketApiClient(ApiSocket):
                            the first argument and the error as the second
                            argument
         """
-        Logger.info(self.__class__.__name__, "Connecting to socket <%s>..." % self.id)
-        if on_message_handler is not None:
-            self.on_message_handlers.append(on_message_handler)
-        if on_open_handler is not None:
-            self.on_open_handlers.append(on_open_handler)
-        if on_close_handler is not None:
-            self.on_close_handlers.append(on_close_handler)
-        if on_error_handler is not None:
-            self.on_error_handlers.append(on_error_handler)
+        self.lock.acquire()
+        try:
+            if on_message_handler is not None and on_message_handler not in self.on_message_handlers:
+                self.on_message_handlers.append(on_message_handler)
+            if on_open_handler is not None:
+                self.on_open_handlers.append(on_open_handler)
+            if on_close_handler is not None:
+                self.on_close_handlers.append(on_close_handler)
+            if on_error_handler is not None:
+                self.on_error_handlers.append(on_error_handler)
 
-        if not self._connected:
-            self.ws = websocket.WebSocketApp(url,
+            # Only one socket is opened, and the handlers of the later callers
+            # are registered on it
+            if self.wst is None:
+                self.url = url
+                self.wst = threading.Thread(target=self.run)
+                self.wst.start()
+            elif self._connected and on_open_handler is not None:
+                # The socket is opened already
+                on_open_handler(self.ws)
+        finally:
+            self.lock.release()
+
+        return self.wst
+
+    def run(self):
+        """
+        Socket thread. Reconnects after the socket is closed, with exponential
+        backoff and random jitter, until the client is closed. The open handlers
+        are called again on each reconnection to resubscribe.
+        """
+        while not self.stopped:
+            Logger.info(self.__class__.__name__, "Connecting to socket <%s>..." % self.id)
+            self.lock.acquire()
+            self.ws = websocket.WebSocketApp(self.url,
                                              on_message=self.__on_message,
                                              on_close=self.__on_close,
                                              on_open=self.__on_open,
                                              on_error=self.__on_error)
-            self.wst = threading.Thread(target=lambda: self.ws.run_forever())
-            self.wst.start()
+            self.lock.release()
+            try:
+                self.ws.run_forever()
+            except Exception as e:
+                Logger.error(self.__class__.__name__, "Socket <%s> error: %s" % (self.id, e))
 
-        return self.wst
+            if self._connected:
+                # The close callback is not called on every failure
+                self.__on_close(self.ws)
+            if self.stopped:
+                break
+
+            delay = random.uniform(self.reconnect_delay / 2, self.reconnect_delay)
+            Logger.info(self.__class__.__name__, "Socket <%s> reconnects in %.1f seconds." % (self.id, delay))
+            sleep(delay)
+            self.reconnect_delay = min(self.reconnect_delay * 2, WebSocketApiClient.MAX_RECONNECT_DELAY)
+            self.reconnect_count += 1
+
+    def close(self):
+        """
+        Close the socket without reconnection
+        """
+        self.stopped = True
+        if self.ws is not None:
+            self.ws.close()
+
+    def get_stats(self):
+        """
+        Get the statistics of the socket
+        :return Dictionary of statistics
+        """
+        return {'connected': self._connected,
+                'message_count': self.message_count,
+                'message_rate': self.message_rate,
+                'reconnect_count': self.reconnect_count,
+                'reconnect_latency': self.reconnect_latency / 1e9}
 
     def send(self, msg):
         """
-        Send message
+        Send message. The message is queued until the socket is opened.
         :param msg: Message
         :return:
         """
-        self.ws.send(msg)
+        self.lock.acquire()
+        try:
+            if self._connected:
+                self.ws.send(msg)
+            else:
+                self.pending_messages.append(msg)
+        finally:
+            self.lock.release()
+
+    def get_instmt_count(self):
+        """
+        Get the number of the instruments connected to the socket
+        :return: Number of the registered open handlers
+        """
+        return len(self.on_open_handlers)
+
+    def update_message_rate(self):
+        """
+        Count a received message in the message rate
+        """
+        now = time()
+        if self.rate_count == 0:
+            self.rate_start = now
+        self.rate_count += 1
+        if now - self.rate_start >= WebSocketApiClient.RATE_WINDOW:
+            self.message_rate = self.rate_count / (now - self.rate_start)
+            self.rate_count = 0
 
     def __on_message(self, ws, m):
+        self.message_count += 1
+        self.update_message_rate()
+        try:
+            message = json.loads(m)
+        except ValueError as e:
+            Logger.error(self.__class__.__name__, "Socket <%s> message is not decoded: %s\n%s" % (self.id, e, m))
+            return
+
         for handler in self.on_message_handlers:
-            handler(m)
+            handler(message)
 
     def __on_open(self, ws):
         Logger.info(self.__class__.__name__, "Socket <%s> is opened." % self.id)
-        self._connected = True
-        for handler in self.on_open_handlers:
-            handler(ws)
+        self.lock.acquire()
+        try:
+            self._connected = True
+            self.reconnect_delay = WebSocketApiClient.RECONNECT_DELAY
+            if self.close_time > 0:
+                self.reconnect_latency = Timestamp.now() - self.close_time
+                Logger.info(self.__class__.__name__, "Socket <%s> is reconnected in %.3f seconds." % \
+                            (self.id, self.reconnect_latency / 1e9))
+            for handler in self.on_open_handlers:
+                handler(ws)
+            for msg in self.pending_messages:
+                ws.send(msg)
+            self.pending_messages = []
+        finally:
+            self.lock.release()
         
-    def __on_close(self, ws):
+    def __on_close(self, ws, *args):
         Logger.info(self.__class__.__name__, "Socket <%s> is closed." % self.id)
+        self.lock.acquire()
+        if not self._connected:
+            self.lock.release()
+            return
         self._connected = False
-        for handler in self.on_close_handlers:
+        self.close_time = Timestamp.now()
+        handlers = list(self.on_close_handlers)
+        self.lock.release()
+        for handler in handlers:
             handler(ws)
         
     def __on_error(self, ws, error):
         Logger.info(self.__class__.__name__, "Socket <%s> error:\n %s" % (self.id, error))
         for handler in self.on_error_handlers:
             handler(ws, error)
+
+
+class WebSocketApiPool(object):
+    """
+    Pool of the web socket connections of an exchange. An instrument is assigned
+    to the connection with the lowest message rate below MAX_MESSAGE_RATE. A new
+    connection is opened only if all the existing ones have instruments and are
+    saturated. A connection of which the rate is not measured yet, i.e. before
+    RATE_WINDOW seconds of messages, counts as saturated, so the instruments subscribed
+    at the start are spread across the pool.
+    The instruments are not moved after they are assigned.
+    """
+    # Messages per second handled by the thread of a connection before it is saturated
+    MAX_MESSAGE_RATE = 500.0
+
+    def __init__(self, api_socket, factory, size=1):
+        """
+        Constructor
+        :param api_socket: First socket of the pool
+        :param factory: Function creating a new socket
+        :param size: Maximum number of connections
+        """
+        self.sockets = [api_socket]
+        self.factory = factory
+        self.size = max(1, size)
+        self.lock = threading.Lock()
+
+    def get_socket(self):
+        """
+        Get the socket for a new instrument
+        :return: WebSocketApiClient object
+        """
+        self.lock.acquire()
+        try:
+            for api_socket in self.sockets:
+                if api_socket.get_instmt_count() == 0:
+                    return api_socket
+
+            candidates = [e for e in self.sockets if 0 <= e.message_rate < WebSocketApiPool.MAX_MESSAGE_RATE]
+            if len(candidates) == 0:
+                if len(self.sockets) < self.size:
+                    api_socket = self.factory()
+                    api_socket.id = "%s-%d" % (api_socket.id, len(self.sockets))
+                    self.sockets.append(api_socket)
+                    return api_socket
+                candidates = self.sockets
+
+            return min(candidates, key=lambda x: (x.message_rate, x.get_instmt_count()))
+        finally:
+            self.lock.release()